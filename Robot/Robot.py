@@ -7,10 +7,20 @@ License:    MIT
 """
 
 import network
-import socket
+import machine
 import time
 import neopixel
+import uasyncio as asyncio
+import ujson as json
+from httpserver import HTTPServer
+import websocket
 from PicoRobotics import KitronikPicoRobotics
+from control import CommandChannel
+from motors import MotorController
+
+DEADMAN_MS = 500  # motors stop when the page sent nothing for this long
+MAX_SPEED = 40  # motor % at full stick
+ACCEL = 300  # %/s, how fast a wheel may change speed
 
 # Initialize robot
 board = KitronikPicoRobotics()
@@ -46,8 +56,8 @@ def set_color(r, g, b):
         np[i] = (r, g, b)
     np.write()
 
-def web_page():
-    html = """
+# Static control page, encoded once and served with an ETag
+WEB_PAGE = """
 <html>
 <head>
 <title>Pico Controller</title>
@@ -61,73 +71,137 @@ button {
   display: grid; grid-template-columns: 120px 120px 120px;
   justify-content: center; align-items: center;
 }
-</style>
-<script>
-function send(dir) {
-  fetch('/action?dir=' + dir);
+#stick {
+  position: relative; width: 240px; height: 240px; margin: 10px auto;
+  border-radius: 50%; background: #ddd; touch-action: none;
 }
-</script>
+#knob {
+  position: absolute; width: 80px; height: 80px; left: 80px; top: 80px;
+  border-radius: 50%; background: #555;
+}
+</style>
 </head>
 <body>
 <h2>Pico Control</h2>
+<div id="stick"><div id="knob"></div></div>
 <div class="grid">
-  <div></div><button onclick="send('forward')">up</button><div></div>
-  <button onclick="send('left')">left</button>
-  <button onclick="send('stop')">stop</button>
-  <button onclick="send('right')">right</button>
-  <div></div><button onclick="send('backward')">back</button><div></div>
+  <div></div><button onclick="send(50, 0)">up</button><div></div>
+  <button onclick="send(25, -25)">left</button>
+  <button onclick="send(0, 0)">stop</button>
+  <button onclick="send(25, 25)">right</button>
+  <div></div><button onclick="send(-50, 0)">back</button><div></div>
 </div>
+<p id="status">connecting...</p>
+<script>
+// setpoint frame: seq u8, page ms u16, throttle i8, steer i8 (see control.py)
+var ws, retry = 500, throttle = 0, steer = 0, seq = 0, frame = new Uint8Array(5);
+function push() {
+  if (!ws || ws.readyState !== 1) return;
+  var t = performance.now() & 0xFFFF;
+  seq = (seq + 1) & 255;
+  frame[0] = seq; frame[1] = t & 255; frame[2] = t >> 8;
+  frame[3] = throttle & 255; frame[4] = steer & 255;
+  ws.send(frame);
+}
+function send(t, s) {
+  if (t === throttle && s === steer) return;  // the heartbeat repeats it anyway
+  throttle = t; steer = s; push();
+}
+// joystick: -100..100 on both axes, springs back to the centre when released
+var stick = document.getElementById('stick'), knob = document.getElementById('knob');
+function moveStick(e) {
+  var r = stick.getBoundingClientRect(), h = r.width / 2;
+  var x = Math.max(-1, Math.min(1, (e.clientX - r.left - h) / h));
+  var y = Math.max(-1, Math.min(1, (e.clientY - r.top - h) / h));
+  knob.style.left = (80 + x * 80) + 'px'; knob.style.top = (80 + y * 80) + 'px';
+  send(Math.round(-y * 100), Math.round(x * 100));
+}
+function releaseStick() {
+  knob.style.left = '80px'; knob.style.top = '80px';
+  send(0, 0);
+}
+stick.onpointerdown = function (e) { stick.setPointerCapture(e.pointerId); moveStick(e); };
+stick.onpointermove = function (e) { if (stick.hasPointerCapture(e.pointerId)) moveStick(e); };
+stick.onpointerup = stick.onpointercancel = releaseStick;
+function connect() {
+  ws = new WebSocket('ws://' + location.host + '/ws');
+  ws.binaryType = 'arraybuffer';
+  ws.onopen = function () { retry = 500; seq = 0; throttle = steer = 0; push(); };
+  ws.onmessage = function (e) {  // ack after the setpoint was taken: seq, the ms we sent
+    var a = new Uint8Array(e.data);
+    var rtt = ((performance.now() & 0xFFFF) - (a[1] | a[2] << 8)) & 0xFFFF;
+    document.getElementById('status').textContent = 'round trip ' + rtt + ' ms';
+  };
+  ws.onclose = function () {
+    document.getElementById('status').textContent = 'disconnected, robot stopped';
+    setTimeout(connect, retry); retry = Math.min(retry * 2, 8000);
+  };
+}
+document.addEventListener('visibilitychange', function () { if (document.hidden) releaseStick(); });
+setInterval(push, 100);  // heartbeat, the robot stops after 500 ms without one
+connect();
+</script>
 </body>
 </html>
 """
-    return html
-
-# Start socket server
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.bind(('', 80))
-s.listen(5)
 
-print("Server started, waiting for connections...")
-
-while True:
-    conn, addr = s.accept()
-    print('Got connection from', addr)
-    request = conn.recv(1024).decode('utf-8')
-    print('Request:', request)
-
-    # Parse GET request line
+# Motors run in their own fixed rate loop with ramping (see motors.py)
+motors = MotorController(board, rate_hz=100, accel=ACCEL, max_speed=MAX_SPEED)
+lit = False
+
+# New throttle / steering setpoint from the page, green LEDs while driving forward
+def drive(throttle, steer):
+    global lit
+    motors.set_target(throttle, steer)
+    if (throttle > 0) != lit:
+        lit = throttle > 0
+        set_color(0, 255 if lit else 0, 0)
+
+def halt():
+    global lit
+    motors.stop()
+    if lit:
+        lit = False
+        set_color(0, 0, 0)
+
+# Setpoints come over a WebSocket: latest wins, deadman stop (see control.py)
+control = CommandChannel(drive, halt, deadman_ms=DEADMAN_MS)
+
+# Start web server (lib/httpserver.py), the page and its socket share port 80
+server = HTTPServer()
+
+server.add_static("/", WEB_PAGE)
+
+@server.route("/ws")
+async def control_socket(req):
+    if not control.connect():  # one driver at a time, the robot stays with the first page
+        return 503, "text/plain", "Another page is driving"
+    ws = None
     try:
-        first_line = request.split('\n')[0]
-        path = first_line.split(' ')[1]
-    except IndexError:
-        path = '/'
-
-    # Basic parsing for /action?dir=forward style requests
-    action = None
-    if path.startswith('/action?dir='):
-        action = path.split('=')[1].split('&')[0]
-
-    # Control robot based on action
-    if action == 'forward':
-        board.motorOn(1, "f", 20)
-        board.motorOn(2, "f", 20)
-        set_color(0, 255, 0)
-    elif action == 'backward':
-        board.motorOn(1, "r", 20)
-        board.motorOn(2, "r", 20)
-    elif action == 'left':
-        board.motorOn(1, "f", 20)
-        board.motorOff(2)
-    elif action == 'right':
-        board.motorOff(1)
-        board.motorOn(2, "f", 20)
-    elif action == 'stop':
-        board.motorOff(1)
-        board.motorOff(2)
-
-    response = web_page()
-    conn.send('HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n'.encode('utf-8'))
-    conn.send(response.encode('utf-8'))
-    conn.close()
-
-
+        ws = await websocket.accept(req, max_message=16, idle_s=5)
+        if ws is None:
+            return 400, "text/plain", "WebSocket only"
+        while True:
+            msg = await ws.recv()
+            if msg is None:
+                break
+            opcode, data = msg
+            if opcode == websocket.BINARY and control.feed(data):
+                await ws.send(control.ack)
+    finally:
+        control.disconnect()  # connection lost: don't wait for the deadman
+        if ws is not None:
+            await ws.close()
+    return None
+
+@server.route("/stats")
+def stats(req):
+    return 200, "application/json", json.dumps({"control": control.stats(), "motors": motors.stats(), "http": server.stats})
+
+async def main():
+    asyncio.create_task(motors.run())
+    asyncio.create_task(control.watchdog())
+    print("Server started, waiting for connections...")
+    await server.serve(port=80)
+
+asyncio.run(main())
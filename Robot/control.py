@@ -0,0 +1,112 @@
+# Robot command channel: latest setpoint wins, deadman stop
+#
+# The control page sends a 5 byte binary WebSocket frame, little endian:
+#   seq       u8   +1 per frame, wraps
+#   ts        u16  page clock in ms, wraps
+#   throttle  i8   -100..100, forward > 0
+#   steer     i8   -100..100, right > 0
+# whenever the joystick / a button changes it and every 100 ms as a
+# heartbeat. Each frame is acked with (seq, ts) after the setpoint was
+# handed on, so the page measures the full round trip.
+#
+# Frames older than the newest one seen are ignored (latest wins), apply()
+# is only called when the setpoint changes, and the watchdog calls halt()
+# when no frame arrived for deadman_ms: a closed tab, a phone that went to
+# sleep or a half-open connection can't leave the robot driving.
+#
+# One controller drives at a time: connect() returns False while another
+# page is connected, so a second page can't restart the sequence numbers
+# under the first one or stop the robot when it leaves. disconnect() frees
+# the channel and stops the motors.
+#
+# usage:
+#   control = CommandChannel(motors.set_target, motors.stop, deadman_ms=500)
+#   if control.connect(): ... control.feed(frame); await ws.send(control.ack) ... control.disconnect()
+#   asyncio.create_task(control.watchdog())
+
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_us, ticks_diff
+
+
+def _i8(b):
+    return b - 256 if b > 127 else b
+
+
+class CommandChannel:
+    def __init__(self, apply, halt, deadman_ms=500):
+        self.apply = apply  # called with (throttle, steer) when the setpoint changes
+        self.halt = halt  # stops the motors at once
+        self.deadman_ms = deadman_ms
+        self.throttle = 0
+        self.steer = 0
+        self.seq = -1  # newest sequence number, -1 until the first frame of a connection
+        self.connected = False  # a controller is driving
+        self.rx_ts = ticks_ms()
+        self.ack = bytearray(3)  # seq, ts of the newest frame
+        self.counts = {"frames": 0, "applied": 0, "stale": 0, "bad": 0, "deadman": 0, "rejected": 0}
+        self.apply_us = {"last": 0, "max": 0}  # frame received -> motors updated
+
+    def connect(self):
+        """A controller (re)connected: its sequence numbers start over. False if another one is driving"""
+        if self.connected:
+            self.counts["rejected"] += 1
+            return False
+        self.connected = True
+        self.seq = -1
+        return True
+
+    def disconnect(self):
+        """The driving controller left: stops the motors, the next one may connect"""
+        self.connected = False
+        return self.stop()
+
+    def feed(self, frame, now=None):
+        """Applies one setpoint frame, returns False if it was stale or malformed"""
+        t0 = ticks_us()
+        if len(frame) != 5:
+            self.counts["bad"] += 1
+            return False
+        self.counts["frames"] += 1
+        seq = frame[0]
+        if self.seq >= 0 and not 0 < (seq - self.seq) & 0xFF < 128:
+            self.counts["stale"] += 1  # older than what was already applied
+            return False
+        self.seq = seq
+        self.rx_ts = ticks_ms() if now is None else now
+        self.ack[0] = seq
+        self.ack[1] = frame[1]
+        self.ack[2] = frame[2]
+        throttle = max(-100, min(100, _i8(frame[3])))
+        steer = max(-100, min(100, _i8(frame[4])))
+        if throttle != self.throttle or steer != self.steer:
+            self.throttle = throttle
+            self.steer = steer
+            self.apply(throttle, steer)
+            self.counts["applied"] += 1
+        us = ticks_diff(ticks_us(), t0)
+        self.apply_us["last"] = us
+        if us > self.apply_us["max"]:
+            self.apply_us["max"] = us
+        return True
+
+    def stop(self):
+        """Stops the motors now (controller disconnected, deadman)"""
+        moving = self.throttle or self.steer
+        self.throttle = self.steer = 0
+        self.halt()
+        return moving
+
+    def check(self, now=None):
+        """Deadman: stops the motors if the last frame is older than deadman_ms"""
+        if (self.throttle or self.steer) and ticks_diff(ticks_ms() if now is None else now, self.rx_ts) > self.deadman_ms:
+            self.counts["deadman"] += 1
+            self.stop()
+
+    async def watchdog(self, period_ms=50):
+        while True:
+            self.check()
+            await asyncio.sleep_ms(period_ms)
+
+    def stats(self):
+        return {"throttle": self.throttle, "steer": self.steer, "connected": self.connected, "counts": self.counts, "apply_us": self.apply_us,
+                "last_frame_ms": ticks_diff(ticks_ms(), self.rx_ts)}
@@ -0,0 +1,114 @@
+# Fixed-rate differential drive for the Kitronik Pico Robotics board
+#
+# The page only sets a target (throttle, steering, -100..100). A loop at
+# rate_hz mixes it into left / right wheel speeds, moves each wheel towards
+# its target by at most accel %/s, and calls motorOn / motorOff only when
+# a wheel's PWM value (0..100) or direction actually changes, so holding
+# the stick still or repeating a command costs no bus traffic at all.
+# stop() bypasses the ramp (deadman, lost connection).
+#
+# Speeds are kept as integers in 1/100 %, a tick allocates nothing.
+#
+# usage:
+#   motors = MotorController(board, rate_hz=100, accel=300)
+#   motors.set_target(throttle=50, steer=-20)
+#   asyncio.create_task(motors.run())
+
+import uasyncio as asyncio
+from utime import ticks_ms, ticks_us, ticks_add, ticks_diff
+
+_SCALE = 100  # internal units per PWM percent
+
+
+def mix(throttle, steer, max_speed=100):
+    """Wheel speeds (motor 1, motor 2) in % for a throttle / steering pair, scaled to fit"""
+    m1 = throttle - steer
+    m2 = throttle + steer
+    big = max(abs(m1), abs(m2))
+    if big > 100:  # keep the ratio, i.e. the turning radius
+        m1 = m1 * 100 // big
+        m2 = m2 * 100 // big
+    return m1 * max_speed // 100, m2 * max_speed // 100
+
+
+class MotorController:
+    def __init__(self, board, rate_hz=100, accel=300, max_speed=100):
+        self.board = board
+        self.period_ms = 1000 // rate_hz
+        self.step = accel * _SCALE // rate_hz  # max change per tick
+        self.max_speed = max_speed  # % at full stick
+        self.target = [0, 0]  # wheel speeds to reach, 1/100 %
+        self.speed = [0, 0]  # current ramped wheel speeds, 1/100 %
+        self.sent = [0, 0]  # signed PWM % last sent per motor
+        self.bus_calls = 0
+        self.ticks = 0
+        self.timing = {"tick_us_last": 0, "tick_us_max": 0, "tick_us_total": 0,
+                       "late_ms_max": 0, "overruns": 0}
+
+    def set_target(self, throttle, steer):
+        m1, m2 = mix(throttle, steer, self.max_speed)
+        self.target[0] = m1 * _SCALE
+        self.target[1] = m2 * _SCALE
+
+    def stop(self):
+        """Both motors off right now, no ramp"""
+        for i in (0, 1):
+            self.target[i] = self.speed[i] = 0
+            self._send(i, 0)
+
+    def _send(self, i, pwm):
+        if pwm == self.sent[i]:
+            return
+        self.sent[i] = pwm
+        self.bus_calls += 1
+        if pwm == 0:
+            self.board.motorOff(i + 1)
+        elif pwm > 0:
+            self.board.motorOn(i + 1, "f", pwm)
+        else:
+            self.board.motorOn(i + 1, "r", -pwm)
+
+    def tick(self):
+        """One control step: ramp, then send what changed"""
+        t0 = ticks_us()
+        step = self.step
+        for i in (0, 1):
+            v, goal = self.speed[i], self.target[i]
+            if v < goal:
+                v = min(v + step, goal)
+            elif v > goal:
+                v = max(v - step, goal)
+            self.speed[i] = v
+            self._send(i, v // _SCALE if v >= 0 else -(-v // _SCALE))
+        self.ticks += 1
+        us = ticks_diff(ticks_us(), t0)
+        t = self.timing
+        t["tick_us_last"] = us
+        t["tick_us_total"] += us
+        if us > t["tick_us_max"]:
+            t["tick_us_max"] = us
+
+    async def run(self):
+        """Ticks on a fixed grid of period_ms; after a stall the grid restarts instead of bursting"""
+        next_tick = ticks_ms()
+        while True:
+            now = ticks_ms()
+            late = ticks_diff(now, next_tick)
+            if late > self.timing["late_ms_max"]:
+                self.timing["late_ms_max"] = late
+            if late >= self.period_ms:  # missed a whole tick, ramp from here
+                self.timing["overruns"] += 1
+                next_tick = now
+            self.tick()
+            next_tick = ticks_add(next_tick, self.period_ms)
+            await asyncio.sleep_ms(max(0, ticks_diff(next_tick, ticks_ms())))
+
+    def stats(self):
+        t = self.timing
+        return {
+            "target": [v // _SCALE for v in self.target], "pwm": self.sent,
+            "ticks": self.ticks, "bus_calls": self.bus_calls,
+            "tick_us": {"last": t["tick_us_last"], "max": t["tick_us_max"],
+                        "avg": t["tick_us_total"] // max(self.ticks, 1)},
+            "late_ms_max": t["late_ms_max"], "overruns": t["overruns"],
+        }
@@ -5,16 +5,24 @@
 # - Connects to your Wi-Fi (Station Mode).
 # - A physical button on GP15 cycles through modes.
 # - Web interface is accessible on the Pico's IP address on your network.
+#
+# Everything runs as tasks on one uasyncio event loop (display, button,
+# snake, weather and web server). State is only changed between awaits,
+# so no thread or lock is needed.
 
 import network
 import time
-from machine import Pin, SoftI2C
+from machine import Pin
 import ssd1306
 from bmp280 import BMP280
-import socket
-import _thread
+import uasyncio as asyncio
+from httpserver import HTTPServer, EventChannel
+from jsonfields import http_get_fields
+from snake import Snake, SnakeView
+from textview import TextView
+import i2cbus
+import ujson as json
 import urandom
-import urequests
 import gc
 import sys
 
@@ -27,6 +35,21 @@ WIFI_PASSWORD = ""
 OPENWEATHERMAP_API_KEY = ""
 CITY = ""
 
+# --- Task periods (ms) ---
+# how often each screen is rebuilt; the panel is only redrawn when the text on it changed
+MODE_PERIOD_MS = {
+    "CLOCK": 250,  # the seconds show up at most 250 ms late
+    "TEMP": 1000,
+    "WEATHER": 5000,  # new weather data wakes the renderer itself
+    "SNAKE": 1000,  # snake frames are driven by snake_task
+}
+TEMP_READ_MS = 2000  # the BMP280 is read at most this often
+SNAKE_TICK_MS = 100  # snake speed, lower = faster (check "timing" on /data before lowering)
+SNAKE_MAX_CATCHUP = 3  # ticks run back to back after a stall, older ones are dropped
+BUTTON_POLL_MS = 20
+WEATHER_POLL_MS = 1000  # how often the weather task checks if a fetch is due
+MODE_BANNER_MS = 500  # how long "Mode: X" stays on screen after a button press
+
 # ---------- Network Setup ----------
 def connect_wifi(ssid, password):
     wlan = network.WLAN(network.STA_IF)
@@ -51,9 +74,10 @@ PICO_IP = wlan.ifconfig()[0] if wlan else "N/A"
 
 
 # ---------- Hardware Setup ----------
-i2c_bmp = SoftI2C(sda=Pin(26), scl=Pin(27))
+# both pin pairs map to a hardware I2C peripheral (I2C1 and I2C0), see lib/i2cbus.py
+i2c_bmp = i2cbus.get_bus(sda=26, scl=27, freq=400000)
 bmp = BMP280(i2c_bmp, addr=0x76)
-i2c_oled = SoftI2C(sda=Pin(0), scl=Pin(1))
+i2c_oled = i2cbus.get_bus(sda=0, scl=1, freq=400000)
 oled = ssd1306.SSD1306_I2C(128, 64, i2c_oled, addr=0x3C)
 button = Pin(15, Pin.IN, Pin.PULL_UP)
 
@@ -62,147 +86,345 @@ button = Pin(15, Pin.IN, Pin.PULL_UP)
 MODES = ["CLOCK", "TEMP", "WEATHER", "SNAKE"]
 current_mode_index = 0
 mode = MODES[current_mode_index]
-button_last_state = button.value()
+banner_until = None  # ticks until which the mode banner is shown
+
+# set whenever something visible changed, wakes the renderer early
+redraw = asyncio.Event()
+
+# input-to-display latency: time from a button press / web command to the
+# oled.show() that made it visible
+input_ts = None
+latency = {"last_ms": 0, "max_ms": 0, "count": 0}
+
+# frame timing, in histograms small enough to send with every /data reply
+class Histogram:
+    """Counts of durations per bucket, bucket upper edges in ms"""
+    EDGES_MS = (1, 2, 5, 10, 20, 50, 100)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.EDGES_MS) + 1)  # last bucket: everything slower
+        self.max_us = 0
+        self.total_us = 0
+
+    def add(self, us):
+        ms = us // 1000
+        i = 0
+        for edge in self.EDGES_MS:
+            if ms < edge:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def summary(self):
+        n = sum(self.counts)
+        return {"le_ms": self.EDGES_MS, "counts": self.counts,
+                "avg_ms": self.total_us // max(n, 1) / 1000, "max_ms": self.max_us / 1000}
+
+timing = {
+    "logic": Histogram(),  # one game.step() tick
+    "draw": Histogram(),  # building a frame in the framebuffer
+    "flush": Histogram(),  # sending the frame over I2C
+    "tick_late": Histogram(),  # how late a snake tick ran vs. its schedule
+}
+snake_ticks = {"run": 0, "dropped": 0}
+frames = {"drawn": 0, "skipped": 0}  # skipped: the screen was already up to date
+
+def note_input():
+    global input_ts
+    if input_ts is None:
+        input_ts = time.ticks_ms()
+    redraw.set()
+
+def set_mode(new_index):
+    global mode, current_mode_index
+    current_mode_index = new_index % len(MODES)
+    mode = MODES[current_mode_index]
+    if mode == "WEATHER": weather_refresher.request_now()
+    note_input()
 
 weather_data = {}
-last_weather_fetch = 0
-#WEATHER_UPDATE_INTERVAL_MS = 1 * 60 * 1000 # 1 minutes
-WEATHER_UPDATE_INTERVAL_MS = 0
+WEATHER_UPDATE_INTERVAL_MS = 10 * 60 * 1000 # 10 minutes between good fetches
+WEATHER_RETRY_MIN_MS = 15 * 1000  # first retry after an error
+WEATHER_RETRY_MAX_MS = 10 * 60 * 1000  # backoff cap
+WEATHER_TIMEOUT_S = 10
 
 
 # ---------- Weather Function ----------
-def get_weather_data():
-    global weather_data, last_weather_fetch
+WEATHER_PATHS = ("weather.0.description", "main.temp", "main.feels_like",
+                 "main.humidity", "wind.speed", "name")
+
+async def get_weather_data():
+    """Fetches the weather and returns a new dict (never touches weather_data)"""
     if not wlan or not wlan.isconnected():
-        weather_data = {"error": "No Wi-Fi"}
-        return
+        return {"error": "No Wi-Fi"}
 
     print("Attempting to fetch weather data...")
-    url = f'http://api.openweathermap.org/data/2.5/weather?q={CITY}&appid={OPENWEATHERMAP_API_KEY}&units=metric'
-    response = None
+    path = f'/data/2.5/weather?q={CITY}&appid={OPENWEATHERMAP_API_KEY}&units=metric'
 
     try:
-        response = urequests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            raw_desc = data['weather'][0].get('description', 'N/A')
+        status, data = await asyncio.wait_for(
+            http_get_fields('api.openweathermap.org', path, WEATHER_PATHS), WEATHER_TIMEOUT_S)
+
+        if status == 200:
+            raw_desc = data.get('weather.0.description', 'N/A')
             weather_desc = raw_desc[0].upper() + raw_desc[1:].lower() if raw_desc else 'N/A'
-            
-            weather_data = {
-                "desc": weather_desc, "temp": data['main'].get('temp'), "city": data.get('name', 'N/A'),
-                "feels_like": data['main'].get('feels_like'), "humidity": data['main'].get('humidity'),
-                "wind_speed": data['wind'].get('speed') }
-            print(f"Weather successfully parsed for {weather_data['city']}.")
+
+            result = {
+                "desc": weather_desc, "temp": data.get('main.temp'), "city": data.get('name', 'N/A'),
+                "feels_like": data.get('main.feels_like'), "humidity": data.get('main.humidity'),
+                "wind_speed": data.get('wind.speed') }
+            print(f"Weather successfully parsed for {result['city']}.")
+            return result
         else:
-            weather_data = {"error": f"API Err {response.status_code}"}
-            print(f"Error: Server returned status code {response.status_code}")
+            print(f"Error: Server returned status code {status}")
+            return {"error": f"API Err {status}"}
 
     except Exception as e:
         sys.print_exception(e)
-        weather_data = {"error": "Fetch Failed"}
-    
+        return {"error": "Fetch Failed"}
+
     finally:
-        if response: response.close()
-        last_weather_fetch = time.ticks_ms()
         gc.collect()
 
-# ---------- Snake Game Logic (Original "clockwatch" version) ----------
-snake_dir, snake_dir_next = "RIGHT", "RIGHT"
+
+class WeatherRefresher:
+    """Runs get_weather_data() on its own schedule, off the render path.
+
+    Good results are refetched every interval_ms. Errors back off
+    exponentially (with +-25% jitter) from retry_min_ms up to retry_max_ms.
+    Results are published by rebinding the weather_data global in a single
+    assignment, so the display never sees a half-built dict.
+    """
+    def __init__(self, interval_ms=WEATHER_UPDATE_INTERVAL_MS,
+                 retry_min_ms=WEATHER_RETRY_MIN_MS, retry_max_ms=WEATHER_RETRY_MAX_MS):
+        self.interval_ms = interval_ms
+        self.retry_min_ms = retry_min_ms
+        self.retry_max_ms = retry_max_ms
+        self.failures = 0
+        self.next_fetch = time.ticks_ms()
+
+    def request_now(self):
+        """Ask for a fetch on the next poll (e.g. when WEATHER mode is entered)"""
+        if not weather_data:
+            self.next_fetch = time.ticks_ms()
+
+    def _retry_delay(self):
+        delay = min(self.retry_min_ms << min(self.failures - 1, 8), self.retry_max_ms)
+        jitter = delay // 4
+        return delay - jitter + (urandom.getrandbits(16) * 2 * jitter >> 16)
+
+    async def poll(self):
+        """Fetch if due"""
+        global weather_data
+        if time.ticks_diff(time.ticks_ms(), self.next_fetch) < 0:
+            return
+        result = await get_weather_data()
+        if "error" in result:
+            self.failures += 1
+            delay = self._retry_delay()
+            # keep showing the last good data while retrying
+            if not weather_data or "error" in weather_data:
+                weather_data = result
+            print(f"Weather fetch failed ({self.failures}x), retry in {delay} ms")
+        else:
+            self.failures = 0
+            delay = self.interval_ms
+            weather_data = result
+        self.next_fetch = time.ticks_add(time.ticks_ms(), delay)
+        redraw.set()
+
+weather_refresher = WeatherRefresher()
+if not wlan: weather_data = {"error": "No Wi-Fi"}
+
+# ---------- Snake Game ----------
+# game state and rules live in snake.py, this is drawing and input only
 SEG_SIZE = 4
 MAX_X, MAX_Y = 128 // SEG_SIZE, 64 // SEG_SIZE
-snake, food, score, snake_initialized = [], [], 0, False
-
-def init_snake():
-    global snake, food, score, snake_dir, snake_dir_next, snake_initialized
-    snake = [[2,2],[1,2],[0,2]]
-    food = [urandom.getrandbits(7)%MAX_X, urandom.getrandbits(6)%MAX_Y]
-    score, snake_dir, snake_dir_next, snake_initialized = 0, "RIGHT", "RIGHT", True
-
-def draw_snake():
-    oled.fill(0)
-    for seg in snake:
-        x, y = seg
-        for dx in range(SEG_SIZE):
-            for dy in range(SEG_SIZE): oled.pixel(x*SEG_SIZE+dx, y*SEG_SIZE+dy, 1)
-    fx, fy = food
-    for dx in range(SEG_SIZE):
-        for dy in range(SEG_SIZE): oled.pixel(fx*SEG_SIZE+dx, fy*SEG_SIZE+dy, 1)
-    oled.text(f"Score:{score}", 0, 0)
-    oled.show()
-
-def move_snake():
-    global snake, food, score, snake_dir
-    head = snake[0][:]
-    snake_dir = snake_dir_next
-
-    if snake_dir == "UP": head[1] -= 1
-    elif snake_dir == "DOWN": head[1] += 1
-    elif snake_dir == "LEFT": head[0] -= 1
-    elif snake_dir == "RIGHT": head[0] += 1
-
-    head[0] %= MAX_X; head[1] %= MAX_Y
-    if head in snake: init_snake(); return
-    snake.insert(0, head)
-
-    if head == food:
-        score += 1
-        food = [urandom.getrandbits(7)%MAX_X, urandom.getrandbits(6)%MAX_Y]
-    else: snake.pop()
+game = Snake(MAX_X, MAX_Y)
+# draws only what a step changed and sends only those columns to the OLED
+snake_view = SnakeView(oled, game, SEG_SIZE)
 
-# ---------- Web Server ----------
-def web_server():
-    global mode, snake_dir_next, snake_initialized, score, current_mode_index
-    if not wlan or not wlan.isconnected(): return
+def steer_snake(direction):
+    if game.steer(direction):
+        note_input()
+
+# ---------- Display ----------
+# clock, temp and weather screens are render models: tuples of (x, y, text)
+# lines, which text_view diffs against what is on the panel
+text_view = TextView(oled)
+
+temp_reading = None  # (temp C, pressure hPa)
+temp_read_ts = 0
+
+def read_temp():
+    """Latest BMP280 reading, read again only after TEMP_READ_MS"""
+    global temp_reading, temp_read_ts
+    now = time.ticks_ms()
+    if temp_reading is None or time.ticks_diff(now, temp_read_ts) >= TEMP_READ_MS:
+        temp_reading = bmp.read()
+        temp_read_ts = now
+    return temp_reading
+
+def banner_model():
+    return ((0, 10, "Mode:"), (0, 25, mode))
+
+def clock_model():
+    t = time.localtime()
+    return ((0, 0, "Clock"),
+            (0, 25, f"{t[3]:02d}:{t[4]:02d}:{t[5]:02d}"),  # time
+            (0, 35, f"{t[2]:02d}-{t[1]:02d}-{t[0]:04d}"))  # date format: DD-MM-YYYY
 
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-    s = socket.socket(); s.bind(addr); s.listen(1)
-    print(f"Web server running at http://{PICO_IP}")
+def temp_model():
+    temp, pressure = read_temp()
+    return ((0, 0, "Temperature"),
+            (0, 20, f"T: {temp:.1f} C"),
+            (0, 40, f"P: {pressure:.1f}hPa"))
 
+def weather_model():
+    if "error" in weather_data:
+        return ((0, 0, "Weather"), (0, 25, "Error:"), (0, 40, weather_data["error"]))
+    if "city" in weather_data:
+        return ((0, 0, "Weather"),
+                (0, 16, weather_data["city"]),
+                (0, 28, f"{weather_data['temp']:.1f}C (feels {weather_data['feels_like']:.1f})"),
+                (0, 40, weather_data['desc']),
+                (0, 52, f"H:{weather_data['humidity']}% W:{weather_data['wind_speed']:.1f}m/s"))
+    return ((0, 0, "Weather"), (0, 30, "Loading..."))
+
+MODELS = {"CLOCK": clock_model, "TEMP": temp_model, "WEATHER": weather_model}
+
+def snake_on_screen():
+    return mode == "SNAKE" and banner_until is None
+
+def draw_screen():
+    """Builds the frame, returns False if the panel already shows it"""
+    if snake_on_screen():
+        text_view.invalidate()
+        snake_view.draw()  # full frame only after something else was shown, steps draw themselves
+        return True
+    snake_view.invalidate()
+    model = banner_model() if banner_until is not None else MODELS[mode]()
+    return text_view.draw(model)
+
+def flush_screen():
+    if snake_on_screen():
+        snake_view.flush()  # only the touched pages / columns
+    else:
+        text_view.flush()  # only the lines that changed
+
+# ---------- Tasks ----------
+async def render_task():
+    global banner_until, input_ts
     while True:
+        if banner_until is not None and time.ticks_diff(time.ticks_ms(), banner_until) >= 0:
+            banner_until = None
+        t0 = time.ticks_us()
+        if draw_screen():
+            t1 = time.ticks_us()
+            flush_screen()
+            timing["draw"].add(time.ticks_diff(t1, t0))
+            timing["flush"].add(time.ticks_diff(time.ticks_us(), t1))
+            frames["drawn"] += 1
+        else:
+            frames["skipped"] += 1
+        if input_ts is not None:
+            latency["last_ms"] = time.ticks_diff(time.ticks_ms(), input_ts)
+            latency["max_ms"] = max(latency["max_ms"], latency["last_ms"])
+            latency["count"] += 1
+            input_ts = None
+        publish_state()
+        redraw.clear()
+        period = MODE_PERIOD_MS[mode]
+        if banner_until is not None:  # wake up when the banner ends
+            period = max(0, min(period, time.ticks_diff(banner_until, time.ticks_ms())))
         try:
-            cl, addr_client = s.accept()
-            request = cl.recv(1024).decode('utf-8')
-
-            if "/data" in request:
-                response_data = ""
-                if mode == "TEMP":
-                    response_data = f"Temp: {bmp.temperature:.1f} C<br>Pres: {bmp.pressure:.1f} hPa"
-                elif mode == "CLOCK":
-                    t = time.localtime()
-                    response_data = f"Time: {t[3]:02d}:{t[4]:02d}:{t[5]:02d}<br>Date: {t[0]:04d}-{t[1]:02d}-{t[2]:02d}"
-                elif mode == "SNAKE":
-                    response_data = f"Score: {score}"
-                elif mode == "WEATHER":
-                    if "error" in weather_data:
-                        response_data = f"Error: {weather_data['error']}"
-                    elif "city" in weather_data:
-                        response_data = (f"{weather_data['city']}: {weather_data['desc']}<br>"
-                                       f"Temp: {weather_data['temp']:.1f}C (Feels {weather_data['feels_like']:.1f}C)<br>"
-                                       f"Humidity: {weather_data['humidity']}% | Wind: {weather_data['wind_speed']:.1f} m/s")
-                cl.send("HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\n" + response_data); cl.close(); continue
-            
-            if "/mode=clock" in request: mode = "CLOCK"; current_mode_index = 0
-            elif "/mode=temperature" in request: mode = "TEMP"; current_mode_index = 1
-            elif "/mode=weather" in request: mode = "WEATHER"; current_mode_index = 2; get_weather_data()
-            elif "/mode=snake" in request: mode = "SNAKE"; current_mode_index = 3
-            
-            if mode == "SNAKE" and not snake_initialized: init_snake()
-            
-            if "/action?dir=UP" in request and snake_dir != "DOWN": snake_dir_next = "UP"
-            elif "/action?dir=DOWN" in request and snake_dir != "UP": snake_dir_next = "DOWN"
-            elif "/action?dir=LEFT" in request and snake_dir != "RIGHT": snake_dir_next = "LEFT"
-            elif "/action?dir=RIGHT" in request and snake_dir != "LEFT": snake_dir_next = "RIGHT"
-
-            response = f"""HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n
-            <html><head><title>Pico Control</title><meta name="viewport" content="width=device-width, initial-scale=1.0"></head>
+            await asyncio.wait_for_ms(redraw.wait(), period)
+        except asyncio.TimeoutError:
+            pass
+
+async def button_task():
+    global banner_until
+    last_state = button.value()
+    while True:
+        state = button.value()
+        if state == 0 and last_state == 1:
+            set_mode(current_mode_index + 1)
+            print(f"Mode switched to: {mode}")
+            banner_until = time.ticks_add(time.ticks_ms(), MODE_BANNER_MS)
+        last_state = state
+        await asyncio.sleep_ms(BUTTON_POLL_MS)
+
+async def snake_task():
+    """Fixed timestep: ticks are scheduled on a grid of SNAKE_TICK_MS.
+
+    Rendering happens in render_task, so a slow frame or a busy web request
+    only delays ticks, it doesn't slow the game down: late ticks are caught
+    up (at most SNAKE_MAX_CATCHUP in a row) and the grid never drifts.
+    """
+    next_tick = time.ticks_ms()
+    while True:
+        now = time.ticks_ms()
+        if not snake_on_screen():
+            next_tick = time.ticks_add(now, SNAKE_TICK_MS)  # paused, restart the grid
+        else:
+            ran = 0
+            while time.ticks_diff(now, next_tick) >= 0 and ran < SNAKE_MAX_CATCHUP:
+                timing["tick_late"].add(time.ticks_diff(now, next_tick) * 1000)
+                t0 = time.ticks_us()
+                snake_view.update(game.step())
+                timing["logic"].add(time.ticks_diff(time.ticks_us(), t0))
+                next_tick = time.ticks_add(next_tick, SNAKE_TICK_MS)
+                ran += 1
+            if time.ticks_diff(now, next_tick) >= 0:  # still behind after catching up
+                behind = time.ticks_diff(now, next_tick) // SNAKE_TICK_MS + 1
+                snake_ticks["dropped"] += behind
+                next_tick = time.ticks_add(next_tick, behind * SNAKE_TICK_MS)
+            if ran:
+                snake_ticks["run"] += ran
+                redraw.set()
+        await asyncio.sleep_ms(max(0, time.ticks_diff(next_tick, time.ticks_ms())))
+
+async def weather_task():
+    while True:
+        if mode == "WEATHER":
+            await weather_refresher.poll()
+        await asyncio.sleep_ms(WEATHER_POLL_MS)
+
+# ---------- Web Server ----------
+def data_text():
+    if mode == "TEMP":
+        temp, pressure = read_temp()
+        return f"Temp: {temp:.1f} C<br>Pres: {pressure:.1f} hPa"
+    elif mode == "CLOCK":
+        t = time.localtime()
+        return f"Time: {t[3]:02d}:{t[4]:02d}:{t[5]:02d}<br>Date: {t[0]:04d}-{t[1]:02d}-{t[2]:02d}"
+    elif mode == "SNAKE":
+        return f"Score: {game.score}"
+    elif mode == "WEATHER":
+        if "error" in weather_data:
+            return f"Error: {weather_data['error']}"
+        elif "city" in weather_data:
+            return (f"{weather_data['city']}: {weather_data['desc']}<br>"
+                    f"Temp: {weather_data['temp']:.1f}C (Feels {weather_data['feels_like']:.1f}C)<br>"
+                    f"Humidity: {weather_data['humidity']}% | Wind: {weather_data['wind_speed']:.1f} m/s")
+    return ""
+
+# The page never changes, so it is encoded once and served with an ETag.
+# Everything dynamic is pushed over /events (Server-Sent Events): the
+# renderer publishes mode, screen text and latency after every frame and
+# only values that changed are sent. /data still answers with one JSON
+# snapshot, the page falls back to polling it without EventSource.
+PAGE_HTML = """<html><head><title>Pico Control</title><meta name="viewport" content="width=device-width, initial-scale=1.0"></head>
             <body style="text-align:center;font-family:sans-serif;">
-            <h1>Mode: {mode}</h1><p id="data" style="font-size:20px; line-height:1.5;"></p>
+            <h1>Mode: <span id="mode"></span></h1><p id="data" style="font-size:20px; line-height:1.5;"></p>
             <div style="display:grid; grid-template-columns: auto auto; justify-content:center;">
-                <button onclick="window.location='/mode=clock'" style="width:140px;height:70px;margin:10px;">Clock</button>
-                <button onclick="window.location='/mode=temperature'" style="width:140px;height:70px;margin:10px;">Temp</button>
-                <button onclick="window.location='/mode=weather'" style="width:140px;height:70px;margin:10px;">Weather</button>
-                <button onclick="window.location='/mode=snake'" style="width:140px;height:70px;margin:10px;">Snake</button>
+                <button onclick="setMode('clock')" style="width:140px;height:70px;margin:10px;">Clock</button>
+                <button onclick="setMode('temperature')" style="width:140px;height:70px;margin:10px;">Temp</button>
+                <button onclick="setMode('weather')" style="width:140px;height:70px;margin:10px;">Weather</button>
+                <button onclick="setMode('snake')" style="width:140px;height:70px;margin:10px;">Snake</button>
             </div>
             <!-- D-PAD CONTROLS -->
             <div style="display: grid; grid-template-columns: 1fr 1fr 1fr; grid-template-rows: 1fr 1fr 1fr; width: 270px; height: 210px; margin: 20px auto; gap: 5px;">
@@ -211,62 +433,72 @@ def web_server():
                 <button onclick="fetch('/action?dir=RIGHT')" style="grid-column: 3; grid-row: 2; font-size: 1.2em;">RIGHT</button>
                 <button onclick="fetch('/action?dir=DOWN')"  style="grid-column: 2; grid-row: 3; font-size: 1.2em;">DOWN</button>
             </div>
+            <small id="latency"></small>
             <script>
-            function updateData() {{ fetch('/data').then(r => r.text()).then(d => {{ document.getElementById('data').innerHTML = d; }}); }}
-            setInterval(updateData, 1500); updateData();
+            function show(d) {
+                if (d.mode !== undefined) document.getElementById('mode').textContent = d.mode;
+                if (d.text !== undefined) document.getElementById('data').innerHTML = d.text;
+                if (d.latency_ms !== undefined) document.getElementById('latency').textContent = 'Input latency: ' + d.latency_ms + ' ms (max ' + d.latency_max_ms + ')';
+            }
+            function updateData() { fetch('/data').then(r => r.json()).then(show); }
+            function setMode(m) { fetch('/mode=' + m); }
+            if (window.EventSource) {
+                const es = new EventSource('/events');
+                es.addEventListener('mode', e => show({mode: e.data}));
+                es.addEventListener('text', e => show({text: e.data}));
+                es.addEventListener('latency', e => show(JSON.parse(e.data)));
+            } else { setInterval(updateData, 1500); updateData(); }
             </script>
             </body></html>"""
-            cl.send(response); cl.close()
-        except Exception as e:
-            if 'cl' in locals(): cl.close()
-
-_thread.start_new_thread(web_server, ())
-
-# ---------- Main Loop ----------
-while True:
-    button_current_state = button.value()
-    if button_current_state == 0 and button_last_state == 1:
-        current_mode_index = (current_mode_index + 1) % len(MODES)
-        mode = MODES[current_mode_index]
-        print(f"Mode switched to: {mode}")
-        oled.fill(0); oled.text("Mode:", 0, 10); oled.text(mode, 0, 25); oled.show()
-        time.sleep(0.5)
-
-        if mode == "SNAKE" and not snake_initialized: init_snake()
-        if mode == "WEATHER": get_weather_data()
-            
-    button_last_state = button_current_state
-
-    if mode == "SNAKE":
-        move_snake(); draw_snake()
-        # --- SPEED CONTROL: Lower value = less latency & faster snake ---
-       # time.sleep(0.04)
-        time.sleep(0.1)
-    else:
-        oled.fill(0)
-        if mode == "TEMP":
-            oled.text("Temperature", 0, 0)
-            oled.text(f"T: {bmp.temperature:.1f} C", 0, 20)
-            oled.text(f"P: {bmp.pressure:.1f}hPa", 0, 40)
-        elif mode == "CLOCK":
-            t = time.localtime()
-            oled.text("Clock", 0, 0)
-            oled.text(f"{t[2]:02d}-{t[1]:02d}-{t[0]:04d}", 0, 35)  #date format: DD-MM-YYYY
-            oled.text(f"{t[3]:02d}:{t[4]:02d}:{t[5]:02d}", 0, 25) # time
-        elif mode == "WEATHER":
-            oled.text("Weather", 0, 0)
-            if "error" in weather_data:
-                oled.text("Error:", 0, 25); oled.text(weather_data["error"], 0, 40)
-            elif "city" in weather_data:
-                oled.text(weather_data["city"], 0, 16)
-                oled.text(f"{weather_data['temp']:.1f}C (feels {weather_data['feels_like']:.1f})", 0, 28)
-                oled.text(weather_data['desc'], 0, 40)
-                oled.text(f"H:{weather_data['humidity']}% W:{weather_data['wind_speed']:.1f}m/s", 0, 52)
-            else:
-                oled.text("Loading...", 0, 30)
-            
-            if time.ticks_diff(time.ticks_ms(), last_weather_fetch) > WEATHER_UPDATE_INTERVAL_MS:
-                get_weather_data()
-        
-        oled.show()
-        time.sleep(0.2)
\ No newline at end of file
+
+server = HTTPServer(max_conns=6)  # up to 4 of them can be /events streams
+events = EventChannel(max_clients=4)
+server.add_route("/events", events.handle)
+
+def publish_state():
+    """Pushes what the page shows, subscribers only get the values that changed"""
+    events.publish("mode", mode)
+    events.publish("text", data_text())
+    events.publish("latency", {"latency_ms": latency["last_ms"], "latency_max_ms": latency["max_ms"]})
+
+server.add_static("/", PAGE_HTML, gz_file="clockwatch.html.gz")
+
+@server.route("/data")
+def data(req):
+    return 200, "application/json", json.dumps({
+        "mode": mode, "text": data_text(),
+        "latency_ms": latency["last_ms"], "latency_max_ms": latency["max_ms"],
+        "timing": {name: h.summary() for name, h in timing.items()},
+        "snake_ticks": snake_ticks,
+        "frames": frames,
+        "events": events.stats,
+        "i2c": i2cbus.report()})
+
+def mode_route(path, index):
+    def handler(req):
+        set_mode(index)
+        return 204, None, b""
+    server.add_route(path, handler)
+
+mode_route("/mode=clock", 0)
+mode_route("/mode=temperature", 1)
+mode_route("/mode=weather", 2)
+mode_route("/mode=snake", 3)
+
+@server.route("/action")
+def action(req):
+    steer_snake(req.query.get("dir", ""))
+    return 204, None, b""
+
+# ---------- Main ----------
+async def main():
+    if wlan and wlan.isconnected():
+        await server.start(port=80)
+        print(f"Web server running at http://{PICO_IP}")
+    asyncio.create_task(button_task())
+    asyncio.create_task(snake_task())
+    asyncio.create_task(weather_task())
+    await render_task()
+
+if __name__ == "__main__":
+    asyncio.run(main())
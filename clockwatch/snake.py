@@ -0,0 +1,249 @@
+# Snake game state for a small grid, O(1) per tick
+#
+# The body is a ring buffer of cell indices (y * width + x) in a
+# preallocated array, tail first, and a bitmap marks the occupied cells.
+# Moving, growing and the collision test are all O(1) and a tick
+# allocates nothing, however long the snake gets. Food is only ever
+# placed on a free cell.
+#
+# usage:
+#   game = Snake(32, 16)
+#   game.steer("UP")
+#   result = game.step()      # MOVED, ATE or DIED (the game restarts itself)
+#   game.head, game.food, game.score
+#
+# SnakeView draws a game on an SSD1306 incrementally: after a step only
+# the freed tail cell, the new head and new food are redrawn and only
+# those few columns of one page each are sent over I2C, so a frame costs
+# the same for a 3 cell and a 500 cell snake.
+
+from array import array
+import urandom
+import oledflush
+
+DIRECTIONS = ("UP", "RIGHT", "DOWN", "LEFT")
+_DX = (0, 1, 0, -1)
+_DY = (-1, 0, 1, 0)
+_RIGHT = 1
+
+# step() results
+MOVED = 0
+ATE = 1
+DIED = 2  # ran into itself or filled the board, the game was restarted
+
+
+def _rand_below(n):
+    return urandom.getrandbits(16) * n >> 16
+
+
+class Snake:
+    def __init__(self, width=32, height=16):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.body = array("H", bytes(2 * self.size))  # ring buffer of cells
+        self.occ = bytearray((self.size + 7) // 8)  # occupancy bitmap
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.occ)):
+            self.occ[i] = 0
+        self.tail = 0  # ring position of the tail
+        self.length = 0
+        for x in range(3):  # three cells on row 2, heading right
+            self._push(2 * self.width + x)
+        self.dir = self.next_dir = _RIGHT
+        self.score = 0
+        self.new_head = -1  # cell the head moved into on the last step
+        self.freed = -1  # cell the tail left on the last step, -1 if it grew
+        self.place_food()
+
+    # ---------- Body ----------
+    def occupied(self, c):
+        return self.occ[c >> 3] & (1 << (c & 7))
+
+    def _push(self, c):
+        self.body[(self.tail + self.length) % self.size] = c
+        self.length += 1
+        self.occ[c >> 3] |= 1 << (c & 7)
+
+    def _pop(self):
+        c = self.body[self.tail]
+        self.tail = (self.tail + 1) % self.size
+        self.length -= 1
+        self.occ[c >> 3] &= ~(1 << (c & 7))
+        return c
+
+    @property
+    def head(self):
+        return self.body[(self.tail + self.length - 1) % self.size]
+
+    def cell(self, k):
+        """k-th body cell, 0 = tail"""
+        return self.body[(self.tail + k) % self.size]
+
+    # ---------- Game ----------
+    def steer(self, name):
+        """Sets the direction for the next step, returns False for unknown names or reversing"""
+        if name not in DIRECTIONS:
+            return False
+        d = DIRECTIONS.index(name)
+        if d == (self.dir + 2) % 4:
+            return False
+        self.next_dir = d
+        return True
+
+    def place_food(self):
+        free = self.size - self.length
+        if not free:
+            self.food = -1
+            return
+        # a few random tries are enough unless the board is nearly full
+        for _ in range(8):
+            c = _rand_below(self.size)
+            if not self.occupied(c):
+                self.food = c
+                return
+        # then the r-th free cell, skipping full bytes of the bitmap
+        r = _rand_below(free)
+        for i in range(len(self.occ)):
+            bits = self.occ[i]
+            if bits == 0xFF:
+                continue
+            for b in range(8):
+                if not bits & (1 << b):
+                    if r == 0:
+                        self.food = i * 8 + b
+                        return
+                    r -= 1
+
+    def step(self):
+        self.dir = self.next_dir
+        c = self.head
+        x = (c % self.width + _DX[self.dir]) % self.width
+        y = (c // self.width + _DY[self.dir]) % self.height
+        c = y * self.width + x
+        ate = c == self.food
+        # the tail moves first, so the head may take the cell it just left
+        self.freed = -1 if ate else self._pop()
+        if self.occupied(c):
+            self.reset()
+            return DIED
+        self._push(c)
+        self.new_head = c
+        if not ate:
+            return MOVED
+        self.score += 1
+        if self.length == self.size:
+            self.reset()
+            return DIED
+        self.place_food()
+        return ATE
+
+
+_MAX_RECTS = 8  # more touched areas than this in one frame: send the whole screen
+
+
+class SnakeView:
+    def __init__(self, oled, game, seg=4, score_chars=9):
+        self.oled = oled
+        self.game = game
+        self.seg = seg
+        self.text_w = score_chars * 8  # "Score:NNN" box in the top left corner
+        self.fb = memoryview(oled.buffer)
+        self.rects = bytearray(3 * _MAX_RECTS)  # (page, x0, x1) per touched area
+        self.n_rects = 0
+        self.full = True  # framebuffer must be redrawn from scratch
+        self.send_all = False  # next flush sends the whole framebuffer
+        self.text_dirty = False
+        self.bytes_sent = 0  # I2C bytes pushed to the panel (commands + data)
+
+    def invalidate(self):
+        """Next draw() redraws everything (mode change, something else was on screen)"""
+        self.full = True
+
+    # ---------- Framebuffer ----------
+    def _touch(self, x0, x1, page):
+        r = self.rects
+        for i in range(0, 3 * self.n_rects, 3):
+            if r[i] == page and r[i + 1] <= x1 + 1 and x0 <= r[i + 2] + 1:  # overlaps, merge
+                r[i + 1] = min(r[i + 1], x0)
+                r[i + 2] = max(r[i + 2], x1)
+                return
+        if self.n_rects == _MAX_RECTS:
+            self.send_all = True
+            return
+        i = 3 * self.n_rects
+        r[i] = page
+        r[i + 1] = x0
+        r[i + 2] = x1
+        self.n_rects += 1
+
+    def _cell(self, c, colour):
+        w = self.game.width
+        x = (c % w) * self.seg
+        y = (c // w) * self.seg
+        self.oled.fill_rect(x, y, self.seg, self.seg, colour)
+        for page in range(y >> 3, (y + self.seg - 1 >> 3) + 1):
+            self._touch(x, x + self.seg - 1, page)
+        if y < 8 and x < self.text_w:
+            self.text_dirty = True  # the score is drawn on top of this cell
+
+    def _text(self):
+        """Redraws the score box: the cells under it, then the text over them"""
+        g = self.game
+        self.oled.fill_rect(0, 0, self.text_w, 8, 0)
+        for cy in range((8 + self.seg - 1) // self.seg):
+            for cx in range((self.text_w + self.seg - 1) // self.seg):
+                c = cy * g.width + cx
+                if g.occupied(c) or c == g.food:
+                    self.oled.fill_rect(cx * self.seg, cy * self.seg, self.seg, self.seg, 1)
+        self.oled.text("Score:" + str(g.score), 0, 0)
+        self._touch(0, self.text_w - 1, 0)
+        self.text_dirty = False
+
+    def update(self, result):
+        """Applies one game.step() result to the framebuffer"""
+        if self.full:
+            return  # the full redraw will show it
+        if result == DIED:
+            self.full = True
+            return
+        g = self.game
+        if g.freed >= 0:
+            self._cell(g.freed, 0)
+        self._cell(g.new_head, 1)
+        if result == ATE:
+            if g.food >= 0:
+                self._cell(g.food, 1)
+            self.text_dirty = True
+
+    def draw(self):
+        """Full redraw if needed, otherwise the steps since the last frame are already drawn"""
+        if not self.full:
+            return
+        g = self.game
+        w, seg = g.width, self.seg
+        self.oled.fill(0)
+        for k in range(g.length):
+            c = g.cell(k)
+            self.oled.fill_rect((c % w) * seg, (c // w) * seg, seg, seg, 1)
+        if g.food >= 0:
+            self.oled.fill_rect((g.food % w) * seg, (g.food // w) * seg, seg, seg, 1)
+        self.full = False
+        self.send_all = True
+        self.text_dirty = True
+
+    # ---------- Panel ----------
+    def flush(self):
+        """Sends only the touched columns of the touched pages"""
+        if self.text_dirty:
+            self._text()
+        if self.send_all:
+            self.bytes_sent += oledflush.send_all(self.oled)
+        else:
+            r = self.rects
+            for i in range(0, 3 * self.n_rects, 3):
+                self.bytes_sent += oledflush.send_span(self.oled, self.fb, r[i], r[i + 1], r[i + 2])
+        self.n_rects = 0
+        self.send_all = False
@@ -0,0 +1,75 @@
+# Text screens on an SSD1306 that only redraw what changed
+#
+# A screen is described by a small render model: a tuple of (x, y, text)
+# lines. draw() compares it with the model on the panel: nothing changed
+# means no drawing and no I2C at all, a changed line is cleared and
+# redrawn, and flush() sends only its columns of the pages it covers. A
+# different layout (another mode, another number of lines) is drawn and
+# sent in full.
+#
+# usage:
+#   view = TextView(oled)
+#   if view.draw(((0, 0, "Clock"), (0, 25, "12:00:00"))):   # False: already on the panel
+#       view.flush()
+#   view.invalidate()   # something else was drawn over it
+
+import oledflush
+
+
+class TextView:
+    def __init__(self, oled):
+        self.oled = oled
+        self.fb = memoryview(oled.buffer)
+        self.lines = None  # model currently in the framebuffer, None = unknown
+        self.spans = []  # (page, x0, x1) to send on the next flush
+        self.send_all = False
+        self.bytes_sent = 0  # I2C bytes pushed to the panel (commands + data)
+
+    def invalidate(self):
+        """Next draw() redraws everything"""
+        self.lines = None
+
+    @staticmethod
+    def _same_layout(a, b):
+        if len(a) != len(b):
+            return False
+        for i in range(len(a)):
+            if a[i][0] != b[i][0] or a[i][1] != b[i][1]:
+                return False
+        return True
+
+    def draw(self, lines):
+        """Draws the model into the framebuffer, returns False if it is already there"""
+        old = self.lines
+        if lines == old:
+            return False
+        self.lines = lines
+        oled = self.oled
+        if old is None or not self._same_layout(lines, old):
+            oled.fill(0)
+            for x, y, text in lines:
+                oled.text(text, x, y)
+            self.send_all = True
+            return True
+        for i in range(len(lines)):
+            x, y, text = lines[i]
+            prev = old[i][2]
+            if text == prev or x >= oled.width:
+                continue
+            w = 8 * max(len(text), len(prev))
+            oled.fill_rect(x, y, w, 8, 0)
+            oled.text(text, x, y)
+            x1 = min(x + w, oled.width) - 1
+            for page in range(max(y, 0) >> 3, (min(y + 7, oled.height - 1) >> 3) + 1):
+                self.spans.append((page, x, x1))
+        return True
+
+    def flush(self):
+        """Sends what the last draw() changed"""
+        if self.send_all:
+            self.bytes_sent += oledflush.send_all(self.oled)
+        else:
+            for page, x0, x1 in self.spans:
+                self.bytes_sent += oledflush.send_span(self.oled, self.fb, page, x0, x1)
+        self.spans.clear()
+        self.send_all = False
@@ -0,0 +1,81 @@
+# Terminal text layer for the SSD1306 used by piOS.py
+# crearor martinP
+#
+# Every text row sits on one 8 pixel SSD1306 page, so instead of
+# oled.fill(0) + oled.show() (the whole 1 KB framebuffer) for every line,
+# only the pages that actually changed are sent over I2C.
+# Scrolling does not move any pixels: the panel's display start line is
+# shifted by one page and the new line is written into the freed page.
+
+import oledflush
+
+# SSD1306 commands
+SET_DISP_START_LINE = 0x40
+
+
+class OledTerminal:
+    def __init__(self, oled, wrap=21):
+        self.oled = oled
+        self.wrap = wrap  # split long lines into chunks of this many characters
+        self.rows = oled.height // 8
+        self.lines = []
+        self.top = 0  # RAM page currently shown on the first screen row
+        self.dirty = 0  # bitmask of RAM pages waiting to be sent
+        self.bytes_sent = 0  # I2C bytes pushed to the panel (commands + data)
+        self.pages_sent = 0
+
+    def _cmd(self, cmd):
+        self.oled.write_cmd(cmd)
+        self.bytes_sent += 2  # control byte + command
+
+    def _page(self, row):
+        return (self.top + row) % self.rows
+
+    def _draw_row(self, row):
+        y = self._page(row) * 8
+        self.oled.fill_rect(0, y, self.oled.width, 8, 0)
+        if row < len(self.lines):
+            self.oled.text(self.lines[row], 0, y)
+        self.dirty |= 1 << self._page(row)
+
+    def flush(self):
+        """Send only the dirty pages to the display"""
+        if not self.dirty:
+            return
+        last = self.oled.width - 1
+        fb = memoryview(self.oled.buffer)
+        for page in range(self.rows):
+            if not self.dirty & (1 << page):
+                continue
+            self.bytes_sent += oledflush.send_span(self.oled, fb, page, 0, last)
+            self.pages_sent += 1
+        self.dirty = 0
+
+    def clear(self):
+        self.lines = []
+        self.top = 0
+        self.oled.fill(0)
+        self._cmd(SET_DISP_START_LINE)
+        self.dirty = (1 << self.rows) - 1
+        self.flush()
+
+    def print(self, line):
+        parts = [line[i:i + self.wrap] for i in range(0, len(line), self.wrap)] or [line]
+        for part in parts:
+            if len(self.lines) == self.rows:
+                # scroll: the oldest page becomes the new bottom row
+                self.lines.pop(0)
+                self.top = (self.top + 1) % self.rows
+                self._cmd(SET_DISP_START_LINE | (self.top * 8))
+            self.lines.append(part)
+            self._draw_row(len(self.lines) - 1)
+        self.flush()
+
+    def append(self, text):
+        """Extend the last line in place (used by the dot animation)"""
+        if not self.lines:
+            self.print(text)
+            return
+        self.lines[-1] += text
+        self._draw_row(len(self.lines) - 1)
+        self.flush()
@@ -5,38 +5,25 @@
 # ===============================
 # Pico SDOS MicroPython Terminal
 # ===============================
-from machine import Pin, SoftI2C
+import i2cbus
 import ssd1306
 import utime
 import urandom
 import sys
+from oled_term import OledTerminal
 
 # ---------- OLED Setup ----------
-i2c = SoftI2C(sda=Pin(0), scl=Pin(1))
+i2c = i2cbus.get_bus(sda=0, scl=1)  # hardware I2C0, shared and locked
 oled = ssd1306.SSD1306_I2C(128, 64, i2c)
 
-oled_lines = []
+# only the changed 8px pages are sent, see oled_term.py
+term = OledTerminal(oled)
 
 def oled_clear():
-    global oled_lines
-    oled.fill(0)
-    oled_lines = []
-    oled.show()
+    term.clear()
 
 def oled_print(line):
-    global oled_lines
-    # split long lines into 21-character chunks (fits 128px width)
-    if len(line) > 21:
-        parts = [line[i:i+21] for i in range(0, len(line), 21)]
-    else:
-        parts = [line]
-    for part in parts:
-        oled_lines.append(part)
-    oled_lines = oled_lines[-8:]  # keep last 8 lines
-    oled.fill(0)
-    for i, l in enumerate(oled_lines):
-        oled.text(l, 0, i*8)
-    oled.show()
+    term.print(line)
     
     
 
@@ -158,22 +145,14 @@ def oled_animate_dots(line, delay=0.05):
         # print left part
         oled_print(left + " ")
 
-        # animate dots
+        # animate dots (one page per dot instead of the whole screen)
         for i in range(dot_count):
-            oled_lines[-1] += "."
-            oled.fill(0)
-            for j, l in enumerate(oled_lines):
-                oled.text(l, 0, j*8)
-            oled.show()
+            term.append(".")
             utime.sleep(delay)
 
         # add trailing text
         if trailing:
-            oled_lines[-1] += " " + trailing
-            oled.fill(0)
-            for j, l in enumerate(oled_lines):
-                oled.text(l, 0, j*8)
-            oled.show()
+            term.append(" " + trailing)
             utime.sleep(delay)
     else:
         oled_print(line)
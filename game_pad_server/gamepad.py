@@ -0,0 +1,253 @@
+# Gamepad state from the binary WebSocket frames of the virtual gamepad page
+#
+# A state frame is 4 or 5 bytes, little endian:
+#   seq      u8   +1 per frame, wraps
+#   ts       u16  client clock in ms, wraps (performance.now() & 0xFFFF)
+#   buttons  u8   bitmask (UP, DOWN, LEFT, RIGHT, A, B), u16 if a pad has more
+# The page sends one when a button changes and repeats it every 250 ms
+# while nothing changes (keepalive). The server answers each frame with a
+# 3 byte ack (seq, ts) so the page can show the round trip time.
+#
+# GamepadState keeps the current bitmask and latches press / release edges
+# until they are read, so a game polling at any rate sees every tap even
+# if press and release arrive between two polls. Reading input is O(1):
+#   if pad.pressed() & A: jump()
+#   if pad.buttons & LEFT: x -= 1
+#
+# Every page that connects gets its own GamepadState (sequence numbers,
+# clock, timeout); Gamepads merges them into one pad holding what any
+# page holds:
+#   pad = Gamepads()
+#   state = pad.connect()          # per WebSocket connection
+#   pad.feed(state, frame)
+#   pad.disconnect(state)          # releases only what this page held
+#
+# Latency: the client clock isn't synchronised, so the one-way delay is
+# measured against the fastest frame seen recently (queueing and
+# retransmission delay on top of the best case). The page shows the real
+# round trip from the acks.
+
+import struct
+from utime import ticks_ms, ticks_us, ticks_diff
+
+UP = 0x01
+DOWN = 0x02
+LEFT = 0x04
+RIGHT = 0x08
+A = 0x10
+B = 0x20
+NAMES = ("UP", "DOWN", "LEFT", "RIGHT", "A", "B")
+
+_MIN_WINDOW = 128  # frames per latency baseline window, follows clock drift
+
+
+def names(mask):
+    """Button names in a bitmask, for printing"""
+    return [n for i, n in enumerate(NAMES) if mask & (1 << i)]
+
+
+class GamepadState:
+    def __init__(self, timeout_ms=1000):
+        self.timeout_ms = timeout_ms  # no frame for this long: all buttons count as released
+        self._buttons = 0
+        self._pressed = 0
+        self._released = 0
+        self.seq = -1  # last sequence number, -1 until the first frame of a connection
+        self.rx_ts = ticks_ms()
+        self._base = None  # first raw client->server clock difference
+        self._min = self._next_min = 0x7FFF
+        self._window = 0
+        self.ack = bytearray(3)  # seq, ts of the last frame, to send back
+        self.counts = {"frames": 0, "changes": 0, "keepalives": 0, "lost": 0, "bad": 0}
+        self.latency = {"last_ms": 0, "max_ms": 0, "total_ms": 0}
+        self.process_us = {"last": 0, "max": 0}
+
+    def connect(self):
+        """A controller (re)connected: its sequence numbers and clock start over"""
+        self.seq = -1
+        self._base = None
+        self._min = self._next_min = 0x7FFF
+        self._window = 0
+
+    def disconnect(self):
+        """The controller is gone: everything it held is released"""
+        self._released |= self._buttons
+        self._buttons = 0
+
+    # ---------- Input ----------
+    def feed(self, frame, now=None):
+        """Applies one state frame, returns True if the buttons changed"""
+        t0 = ticks_us()
+        n = len(frame)
+        if n != 4 and n != 5:
+            self.counts["bad"] += 1
+            return False
+        if now is None:
+            now = ticks_ms()
+        seq = frame[0]
+        ts = frame[1] | frame[2] << 8
+        buttons = frame[3] if n == 4 else frame[3] | frame[4] << 8
+        self.counts["frames"] += 1
+        if self.seq >= 0:
+            gap = (seq - self.seq) & 0xFF
+            if gap == 0 or gap > 128:  # repeated or older frame, keep the newer state
+                self.counts["bad"] += 1
+                return False
+            self.counts["lost"] += gap - 1
+        self.expire(now)  # after a timeout, buttons still held come back as new presses
+        self.seq = seq
+        self.rx_ts = now
+        self.ack[0] = seq
+        self.ack[1] = frame[1]
+        self.ack[2] = frame[2]
+        self._latency(now, ts)
+        old = self._buttons
+        changed = buttons != old
+        if changed:
+            self._pressed |= buttons & ~old
+            self._released |= old & ~buttons
+            self._buttons = buttons
+            self.counts["changes"] += 1
+        else:
+            self.counts["keepalives"] += 1
+        us = ticks_diff(ticks_us(), t0)
+        self.process_us["last"] = us
+        if us > self.process_us["max"]:
+            self.process_us["max"] = us
+        return changed
+
+    def _latency(self, now, ts):
+        raw = (now - ts) & 0xFFFF  # clock offset + one-way delay, 16 bit
+        if self._base is None:
+            self._base = raw
+        d = ((raw - self._base + 0x8000) & 0xFFFF) - 0x8000
+        if d < self._min:
+            self._min = d
+        if d < self._next_min:
+            self._next_min = d
+        self._window += 1
+        if self._window == _MIN_WINDOW:  # start a new baseline so clock drift can't accumulate
+            self._min, self._next_min, self._window = self._next_min, 0x7FFF, 0
+        ms = d - self._min
+        self.latency["last_ms"] = ms
+        self.latency["total_ms"] += ms
+        if ms > self.latency["max_ms"]:
+            self.latency["max_ms"] = ms
+
+    # ---------- Polling ----------
+    def expire(self, now=None):
+        """Releases everything if the controller went quiet for timeout_ms"""
+        if self._buttons and ticks_diff(ticks_ms() if now is None else now, self.rx_ts) > self.timeout_ms:
+            self._released |= self._buttons
+            self._buttons = 0
+
+    @property
+    def buttons(self):
+        """Bitmask of the buttons held right now"""
+        self.expire()
+        return self._buttons
+
+    def pressed(self):
+        """Buttons pressed since the last call (each press is reported once)"""
+        self.expire()
+        p = self._pressed
+        self._pressed = 0
+        return p
+
+    def released(self):
+        """Buttons released since the last call"""
+        self.expire()
+        r = self._released
+        self._released = 0
+        return r
+
+    def stats(self):
+        frames = max(self.counts["frames"], 1)
+        return {
+            "buttons": names(self._buttons), "counts": self.counts,
+            "latency_ms": {"last": self.latency["last_ms"], "max": self.latency["max_ms"],
+                           "avg": self.latency["total_ms"] / frames},
+            "process_us": self.process_us,
+        }
+
+
+class Gamepads:
+    """Several controllers as one pad: a button is held while any page holds it.
+
+    Each connection has its own GamepadState, so a second page can't reset
+    the first one's sequence numbers and a page leaving releases only its
+    own buttons. Edges are latched on the merged bitmask: a button held on
+    two pages is pressed once and released when the last one lets go.
+    """
+    def __init__(self, timeout_ms=1000):
+        self.timeout_ms = timeout_ms
+        self.states = []
+        self._buttons = 0
+        self._pressed = 0
+        self._released = 0
+
+    def connect(self):
+        """A page connected: returns the state its frames go to"""
+        state = GamepadState(self.timeout_ms)
+        self.states.append(state)
+        return state
+
+    def disconnect(self, state):
+        state.disconnect()
+        if state in self.states:
+            self.states.remove(state)
+        self._merge()
+
+    def feed(self, state, frame, now=None):
+        """Applies a frame of one page, returns True if the merged buttons changed"""
+        if state.feed(frame, now):
+            return self._merge()
+        return False
+
+    def _merge(self):
+        buttons = 0
+        for state in self.states:
+            buttons |= state._buttons
+        old = self._buttons
+        if buttons == old:
+            return False
+        self._pressed |= buttons & ~old
+        self._released |= old & ~buttons
+        self._buttons = buttons
+        return True
+
+    def expire(self, now=None):
+        for state in self.states:
+            state.expire(now)
+        self._merge()
+
+    # ---------- Polling ----------
+    @property
+    def buttons(self):
+        """Bitmask of the buttons held right now on any page"""
+        self.expire()
+        return self._buttons
+
+    def pressed(self):
+        """Buttons pressed since the last call (each press is reported once)"""
+        self.expire()
+        p = self._pressed
+        self._pressed = 0
+        return p
+
+    def released(self):
+        """Buttons released since the last call"""
+        self.expire()
+        r = self._released
+        self._released = 0
+        return r
+
+    def stats(self):
+        return {"buttons": names(self._buttons), "controllers": [s.stats() for s in self.states]}
+
+
+def pack(seq, ts, buttons):
+    """A state frame as the page builds it (for tests and Pico-side senders)"""
+    if buttons > 0xFF:
+        return struct.pack("<BHH", seq & 0xFF, ts & 0xFFFF, buttons)
+    return struct.pack("<BHB", seq & 0xFF, ts & 0xFFFF, buttons)
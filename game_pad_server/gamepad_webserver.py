@@ -1,8 +1,12 @@
-# this project is super unresponsive
+# Virtual gamepad: the page and its WebSocket are served on one port (80)
+# by lib/httpserver.py + lib/websocket.py
 
 import network
 import uasyncio as asyncio
-import usocket as socket
+import ujson as json
+from httpserver import HTTPServer
+import websocket
+from gamepad import Gamepads, names
 
 # --- Wi-Fi ---
 ssid = 'YOUR NETWORK NAME HERE'
@@ -16,23 +20,59 @@ while not wlan.isconnected():
 print('Connected, IP:', wlan.ifconfig()[0])
 
 
-# --- Simple WebSocket Handler ---
-clients = []
+# --- WebSocket Handler ---
+# the page sends binary state frames (see gamepad.py), each one is acked
+# so the page can show the round trip time. hub pushes messages back to
+# every connected controller; a phone that stops reading is dropped
+# instead of stalling the others. Each page has its own pad state, the
+# game sees the buttons held on any of them. Open sockets don't take the
+# HTTP server's connection slots, MAX_PADS caps them instead.
+MAX_PADS = 16
+hub = websocket.Broadcaster(queue_len=8)
+pad = Gamepads()
 
-async def websocket_handler(reader, writer):
-    clients.append(writer)
+async def websocket_handler(req):
+    if len(pad.states) >= MAX_PADS:
+        return 503, "text/plain", "Too many controllers"
+    ws = await websocket.accept(req)
+    if ws is None:
+        return 400, "text/plain", "WebSocket only"
+    hub.add(ws)
+    state = pad.connect()
     try:
         while True:
-            data = await reader.read(100)
-            if not data:
+            msg = await ws.recv()
+            if msg is None:
                 break
-            msg = data.decode().strip()
-            print("Button:", msg)
+            opcode, data = msg
+            if opcode == websocket.BINARY:
+                pad.feed(state, data)
+                await ws.send(state.ack)
     except Exception as e:
         print("WebSocket error:", e)
     finally:
-        clients.remove(writer)
-        await writer.aclose()
+        hub.remove(ws)
+        pad.disconnect(state)
+        await ws.close()
+    return None  # the server closes the connection
+
+
+# --- Game loop: polls the pad, no message parsing ---
+def push(kind, value):
+    """Sends state to every controller, only the latest value per kind is kept"""
+    hub.send(json.dumps({kind: value}), key=kind)
+
+async def input_task():
+    while True:
+        down = pad.pressed()
+        up = pad.released()
+        if down:
+            print("Pressed:", names(down))
+        if up:
+            print("Released:", names(up))
+        if down or up:
+            push("buttons", names(pad.buttons))  # what the Pico sees, shown on every page
+        await asyncio.sleep_ms(20)
 
 
 # --- HTTP Server to serve HTML page ---
@@ -41,7 +81,8 @@ html = """<!DOCTYPE html>
 <head>
 <title>Pi Pico WebSocket Gamepad</title>
 <style>
-button { width: 80px; height: 80px; font-size: 20px; margin: 5px; }
+button { width: 80px; height: 80px; font-size: 20px; margin: 5px; touch-action: none; user-select: none; -webkit-user-select: none; }
+button.down { background: #8cf; }
 .grid { display: grid; grid-template-columns: 80px 80px 80px 80px;
        grid-template-rows: 80px 80px 80px; justify-content: center; align-items: center; }
 </style>
@@ -49,29 +90,78 @@ button { width: 80px; height: 80px; font-size: 20px; margin: 5px; }
 <body>
 <h1>Virtual Gamepad</h1>
 <div class="grid">
-  <div></div><button onmousedown="send('UP')" onmouseup="send('UP_RELEASE')">UP</button><div></div><button onmousedown="send('A')" onmouseup="send('A_RELEASE')">A</button>
-  <button onmousedown="send('LEFT')" onmouseup="send('LEFT_RELEASE')">LEFT</button><div></div><button onmousedown="send('RIGHT')" onmouseup="send('RIGHT_RELEASE')">RIGHT</button><button onmousedown="send('B')" onmouseup="send('B_RELEASE')">B</button>
-  <div></div><button onmousedown="send('DOWN')" onmouseup="send('DOWN_RELEASE')">DOWN</button><div></div><div></div>
+  <div></div><button data-b="UP">UP</button><div></div><button data-b="A">A</button>
+  <button data-b="LEFT">LEFT</button><div></div><button data-b="RIGHT">RIGHT</button><button data-b="B">B</button>
+  <div></div><button data-b="DOWN">DOWN</button><div></div><div></div>
 </div>
+<p id="rtt">connecting...</p>
+<p id="seen"></p>
 
 <script>
-var ws = new WebSocket('ws://' + location.hostname + ':8765/');
-function send(action){ ws.send(action); }
+// state frame: seq u8, client ms u16, buttons u8 (see gamepad.py)
+var BITS = {UP: 1, DOWN: 2, LEFT: 4, RIGHT: 8, A: 16, B: 32};
+var KEYS = {ArrowUp: 'UP', ArrowDown: 'DOWN', ArrowLeft: 'LEFT', ArrowRight: 'RIGHT', z: 'A', x: 'B'};
+var ws, retry = 500, state = 0, seq = 0, frame = new Uint8Array(4);
+function sendState() {
+  if (!ws || ws.readyState !== 1) return;
+  var t = performance.now() & 0xFFFF;
+  seq = (seq + 1) & 255;
+  frame[0] = seq; frame[1] = t & 255; frame[2] = t >> 8; frame[3] = state;
+  ws.send(frame);
+}
+function set(name, down) {
+  var s = down ? state | BITS[name] : state & ~BITS[name];
+  if (s === state) return;
+  state = s;
+  sendState();  // on change, right away
+}
+function connect() {
+  ws = new WebSocket('ws://' + location.host + '/ws');
+  ws.binaryType = 'arraybuffer';
+  ws.onopen = function () { retry = 500; seq = 0; sendState(); };
+  ws.onmessage = function (e) {
+    if (typeof e.data === 'string') {  // pushed state, e.g. {"buttons": [...]}
+      var m = JSON.parse(e.data);
+      if (m.buttons) document.getElementById('seen').textContent = 'Pico sees: ' + (m.buttons.join(' ') || '-');
+      return;
+    }
+    var a = new Uint8Array(e.data);  // ack: seq, the ms we sent
+    var rtt = ((performance.now() & 0xFFFF) - (a[1] | a[2] << 8)) & 0xFFFF;
+    document.getElementById('rtt').textContent = 'round trip ' + rtt + ' ms';
+  };
+  ws.onclose = function () { setTimeout(connect, retry); retry = Math.min(retry * 2, 8000); };
+}
+document.querySelectorAll('button[data-b]').forEach(function (el) {
+  var name = el.dataset.b;
+  function up() { el.classList.remove('down'); set(name, false); }
+  el.addEventListener('pointerdown', function (e) { el.setPointerCapture(e.pointerId); el.classList.add('down'); set(name, true); });
+  el.addEventListener('pointerup', up);
+  el.addEventListener('pointercancel', up);
+  el.addEventListener('lostpointercapture', up);
+  el.addEventListener('contextmenu', function (e) { e.preventDefault(); });
+});
+document.addEventListener('keydown', function (e) { if (KEYS[e.key]) { set(KEYS[e.key], true); e.preventDefault(); } });
+document.addEventListener('keyup', function (e) { if (KEYS[e.key]) set(KEYS[e.key], false); });
+setInterval(sendState, 250);  // keepalive, the Pico releases everything after 1 s without one
+connect();
 </script>
 </body>
 </html>"""
 
-async def http_server(reader, writer):
-    request = await reader.read(1024)
-    response = 'HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n' + html
-    await writer.awrite(response)
-    await writer.aclose()
+http_server = HTTPServer()
+http_server.add_static("/", html)
+http_server.add_route("/ws", websocket_handler)
+
+@http_server.route("/stats")
+def stats(req):
+    return 200, "application/json", json.dumps({
+        "hub": hub.stats, "pad": pad.stats(), "http": http_server.stats})
 
 
-# --- Run servers ---
+# --- Run server ---
 async def main():
-    asyncio.create_task(asyncio.start_server(http_server, "0.0.0.0", 80))
-    asyncio.create_task(asyncio.start_server(websocket_handler, "0.0.0.0", 8765))
+    await http_server.start("0.0.0.0", 80)
+    asyncio.create_task(input_task())
     while True:
         await asyncio.sleep(1)
 
@@ -0,0 +1,533 @@
+# Small async HTTP/1.1 server shared by the web projects in this repo
+# (weather, clockwatch, Robot, game_pad_server).
+#
+# Copy this file to /lib on the Pico.
+#
+# - one uasyncio task per connection, so clients are served concurrently;
+#   at most max_conns at a time, further connections wait for a free slot
+#   (up to queue_s, then 503) instead of being refused. A handler that
+#   keeps its connection (WebSocket) calls req.detach() to free the slot
+# - keep-alive: a connection is reused until the client closes it, asks for
+#   "Connection: close" or stays idle for keepalive_s
+# - request line and headers are parsed from a buffer capped at max_header
+#   bytes, request bodies are capped at max_body, so one connection can
+#   never use more memory than that
+# - routes are an exact-path table, the query string is parsed into req.query
+# - a handler can return a generator as body, it is streamed with chunked
+#   transfer encoding so large responses are never held in RAM
+# - EventChannel pushes Server-Sent Events to any number of subscribers,
+#   a slow one never holds up the others
+#
+# usage:
+#   server = HTTPServer()
+#   @server.route("/")
+#   def index(req):
+#       return "<h1>hello</h1>"            # 200 text/html
+#   @server.route("/data")
+#   def data(req):
+#       return 200, "text/plain", "42"     # or (status, type, body, headers)
+#   @server.route("/rows")
+#   def rows(req):
+#       return 200, "text/csv", (str(i) + "\n" for i in range(1000))  # streamed, chunked
+#   server.add_static("/page", HTML)       # encoded once, served with ETag / 304
+#   events = EventChannel()
+#   server.add_route("/events", events.handle)
+#   events.publish("mode", "CLOCK")        # sent to every subscriber, only if it changed
+#   asyncio.run(server.serve(port=80))
+
+import uasyncio as asyncio
+import binascii
+import hashlib
+import json
+
+STATUS_TEXT = {
+    200: "OK", 204: "No Content", 304: "Not Modified", 400: "Bad Request",
+    404: "Not Found", 405: "Method Not Allowed", 408: "Request Timeout",
+    413: "Payload Too Large", 431: "Request Header Fields Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def unquote(s):
+    """Decodes %xx escapes (UTF-8) and + in a query string value"""
+    if "%" not in s and "+" not in s:
+        return s
+    s = s.replace("+", " ")
+    parts = s.split("%")
+    out = bytearray(parts[0].encode("utf-8"))
+    for p in parts[1:]:
+        try:
+            if len(p) < 2:
+                raise ValueError
+            out.append(int(p[:2], 16))
+            out += p[2:].encode("utf-8")
+        except ValueError:  # a lone % is kept as it is
+            out += b"%" + p.encode("utf-8")
+    try:
+        return out.decode("utf-8")
+    except UnicodeError:
+        return s
+
+
+def parse_query(qs):
+    query = {}
+    for pair in qs.split("&"):
+        if pair:
+            k, _, v = pair.partition("=")
+            query[unquote(k)] = unquote(v)
+    return query
+
+
+def etag(data, suffix=""):
+    """Strong ETag for the bytes that are sent"""
+    return '"' + binascii.hexlify(hashlib.sha256(data).digest()[:8]).decode() + suffix + '"'
+
+
+def gz_matches(gz, body):
+    """False if a gzip copy doesn't unpack to body (left over from an older page).
+
+    Needs the deflate module (MicroPython 1.21+), without it the copy is trusted.
+    """
+    try:
+        import deflate
+        import io
+    except ImportError:
+        return True
+    # distances never reach back further than the page is long, so a small window will do
+    wbits = max(9, min(15, len(body).bit_length()))
+    stream = deflate.DeflateIO(io.BytesIO(gz), deflate.GZIP, wbits)
+    buf = bytearray(256)
+    n = 0
+    try:
+        while True:
+            k = stream.readinto(buf)
+            if not k:
+                return n == len(body)
+            if body[n:n + k] != buf[:k]:
+                return False
+            n += k
+    except (OSError, ValueError):  # not gzip, truncated
+        return False
+
+
+class StaticPage:
+    """A page encoded to bytes once at startup and served with an ETag.
+
+    Browsers that already have it get a 304 with no body. If gz_file names
+    a gzip file on flash (made on the PC with e.g. `gzip -9 -k page.html`)
+    it is sent instead to clients that accept gzip, with its own ETag and
+    Vary: Accept-Encoding on both, so caches keep the two apart. A gzip
+    file that doesn't unpack to the page is ignored.
+    """
+    def __init__(self, body, content_type="text/html; charset=UTF-8", max_age=0, gz_file=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag(body)
+        cache = "max-age={}".format(max_age) if max_age else "no-cache"
+        self.headers = {"ETag": self.etag, "Cache-Control": cache}
+        self.gz = None
+        if gz_file:
+            try:
+                with open(gz_file, "rb") as f:
+                    self.gz = f.read()
+            except OSError:
+                print("StaticPage: no", gz_file, "on flash, serving uncompressed")
+        if self.gz is not None and not gz_matches(self.gz, body):
+            print("StaticPage:", gz_file, "is not this page (stale?), serving uncompressed")
+            self.gz = None
+        if self.gz is not None:
+            self.gz_etag = etag(self.gz, "-gz")
+            self.headers["Vary"] = "Accept-Encoding"
+            self.gz_headers = {"ETag": self.gz_etag, "Cache-Control": cache,
+                               "Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+
+    def __call__(self, req):
+        if self.gz is not None and "gzip" in req.headers.get("accept-encoding", ""):
+            body, tag, headers = self.gz, self.gz_etag, self.gz_headers
+        else:
+            body, tag, headers = self.body, self.etag, self.headers
+        if req.headers.get("if-none-match") == tag:
+            return 304, None, b"", headers
+        return 200, self.content_type, body, headers
+
+
+class Request:
+    def __init__(self, method, path, query, version, headers, reader, writer):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.version = version
+        self.headers = headers  # keys are lower case
+        self.body = b""
+        self.reader = reader
+        self.writer = writer
+        self.detached = False
+        self._release = None  # set by the server: frees the connection's slot
+
+    def detach(self):
+        """The handler keeps the connection open (WebSocket): it stops counting against max_conns"""
+        if not self.detached:
+            self.detached = True
+            if self._release:
+                self._release()
+
+    @property
+    def keep_alive(self):
+        conn = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return conn == "keep-alive"
+        return conn != "close"
+
+
+def is_stream(body):
+    """True for bodies that are iterated and sent chunked (generators etc.)"""
+    return body is not None and not isinstance(body, (str, bytes, bytearray, list))
+
+
+class _Subscriber:
+    def __init__(self, pending):
+        self.pending = pending  # names of events to send
+        self.ready = asyncio.Event()
+
+
+class EventChannel:
+    """Server-Sent Events (text/event-stream) to several subscribers.
+
+    Only the latest value of each event is kept. publish() stores it and
+    flags it for every subscriber without touching a socket; each
+    subscriber connection runs in its own task and sends the flagged
+    events, so a slow client just skips values that were replaced in the
+    meantime and never stalls the publisher or the other clients. A client
+    that can't take a write for send_timeout_s is dropped (browsers
+    reconnect by themselves after retry_ms). New subscribers get every
+    current value first.
+    """
+    def __init__(self, max_clients=4, retry_ms=3000, ping_s=15, send_timeout_s=5):
+        self.max_clients = max_clients
+        self.retry_ms = retry_ms
+        self.ping_s = ping_s  # comment line sent on idle streams, finds dead clients
+        self.send_timeout_s = send_timeout_s
+        self.latest = {}  # event name -> (data, encoded frame)
+        self.subs = []
+        self.stats = {"subscribers": 0, "connects": 0, "published": 0, "sent": 0, "dropped": 0}
+
+    def publish(self, event, data):
+        """Sets an event's value (str, or anything json encodes), returns False if it didn't change"""
+        if not isinstance(data, str):
+            data = json.dumps(data)
+        old = self.latest.get(event)
+        if old is not None and old[0] == data:
+            return False
+        frame = "event: {}\ndata: {}\n\n".format(event, data.replace("\n", "\ndata: "))
+        self.latest[event] = (data, frame.encode("utf-8"))
+        self.stats["published"] += 1
+        for sub in self.subs:
+            if event not in sub.pending:
+                sub.pending.append(event)
+            sub.ready.set()
+        return True
+
+    async def handle(self, req):
+        """Route handler for the stream: server.add_route("/events", channel.handle)"""
+        if len(self.subs) >= self.max_clients:
+            return 503, "text/plain", "Too many subscribers", {"Retry-After": "10"}
+        writer = req.writer
+        sub = _Subscriber(list(self.latest))
+        self.subs.append(sub)
+        self.stats["connects"] += 1
+        self.stats["subscribers"] = len(self.subs)
+        try:
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                         b"Cache-Control: no-cache\r\nConnection: keep-alive\r\n\r\n")
+            writer.write("retry: {}\n\n".format(self.retry_ms).encode())
+            while True:
+                if not sub.pending:
+                    try:
+                        await asyncio.wait_for(sub.ready.wait(), self.ping_s)
+                    except asyncio.TimeoutError:
+                        writer.write(b": ping\n\n")
+                sub.ready.clear()
+                names, sub.pending = sub.pending, []
+                for name in names:
+                    writer.write(self.latest[name][1])
+                self.stats["sent"] += len(names)
+                await asyncio.wait_for(writer.drain(), self.send_timeout_s)
+        except asyncio.TimeoutError:  # drain stuck: the client stopped reading
+            self.stats["dropped"] += 1
+        except OSError:  # the client went away
+            pass
+        finally:
+            self.subs.remove(sub)
+            self.stats["subscribers"] = len(self.subs)
+        return None  # the connection is closed by the server
+
+
+class HTTPServer:
+    def __init__(self, max_header=1024, max_body=1024, keepalive_s=5, max_conns=4, stream_chunk=512,
+                 queue_s=30):
+        self.max_header = max_header
+        self.max_body = max_body
+        self.stream_chunk = stream_chunk  # streamed bodies are gathered into chunks of about this size
+        self.keepalive_s = keepalive_s
+        self.max_conns = max_conns
+        self.queue_s = queue_s  # how long a connection past max_conns waits for a slot
+        self.routes = {}  # path -> (methods, handler)
+        self.active = 0
+        self.waiting = 0
+        self._slot = asyncio.Event()  # set when a connection ends
+        self.stats = {"connections": 0, "requests": 0, "queued": 0, "rejected": 0, "errors": 0,
+                      "bytes_sent": 0}
+
+    # ---------- Routing ----------
+    def add_route(self, path, handler, methods=("GET",)):
+        self.routes[path] = (methods, handler)
+
+    def route(self, path, methods=("GET",)):
+        def decorator(handler):
+            self.add_route(path, handler, methods)
+            return handler
+        return decorator
+
+    def add_static(self, path, body, content_type="text/html; charset=UTF-8", max_age=0, gz_file=None):
+        page = StaticPage(body, content_type, max_age, gz_file)
+        self.add_route(path, page)
+        return page
+
+    # ---------- Parsing ----------
+    async def _read_head(self, reader, buf, timeout_s):
+        """Returns (head, rest) once a full header block is buffered"""
+        while True:
+            end = buf.find(b"\r\n\r\n")
+            if end >= 0:
+                return buf[:end], buf[end + 4:]
+            if len(buf) >= self.max_header:
+                raise HTTPError(431)
+            chunk = await asyncio.wait_for(reader.read(self.max_header - len(buf)), timeout_s)
+            if not chunk:
+                return None, b""
+            buf += chunk
+
+    def _parse_head(self, head, reader, writer):
+        lines = head.decode("utf-8").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise HTTPError(400)
+        path, _, qs = target.partition("?")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise HTTPError(400)
+            headers[name.strip().lower()] = value.strip()
+        return Request(method, path, parse_query(qs), version, headers, reader, writer)
+
+    async def _read_body(self, req, reader, buf):
+        try:
+            length = int(req.headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400)
+        if length < 0:
+            raise HTTPError(400)
+        if length > self.max_body:
+            raise HTTPError(413)
+        while len(buf) < length:
+            chunk = await asyncio.wait_for(reader.read(length - len(buf)), self.keepalive_s)
+            if not chunk:
+                raise HTTPError(400)
+            buf += chunk
+        return buf[:length], buf[length:]
+
+    # ---------- Responses ----------
+    def _head(self, status, content_type, headers, keep_alive, framing):
+        head = "HTTP/1.1 {} {}\r\nConnection: {}\r\n".format(
+            status, STATUS_TEXT.get(status, ""), "keep-alive" if keep_alive else "close")
+        if framing:
+            head += framing
+        if content_type:
+            head += "Content-Type: " + content_type + "\r\n"
+        if headers:
+            for k in headers:
+                head += k + ": " + headers[k] + "\r\n"
+        return head.encode("utf-8") + b"\r\n"
+
+    async def send(self, writer, status, content_type, body, headers=None, keep_alive=True, chunked=True):
+        """Writes a response, returns False if the connection has to be closed after it.
+
+        body is None (empty), str, bytes or a list of those (sent chunk by
+        chunk, never joined), or any other iterable such as a generator, which
+        is streamed with chunked encoding, or until close if chunked is False
+        (HTTP/1.0).
+        """
+        if is_stream(body):
+            return await self._send_stream(writer, status, content_type, body, headers,
+                                           keep_alive and chunked, chunked)
+        if body is None:
+            body = b""
+        if isinstance(body, list):  # encoded into a new list, the handler's list is left alone
+            chunks = [chunk.encode("utf-8") if isinstance(chunk, str) else chunk for chunk in body]
+        else:
+            chunks = [body.encode("utf-8") if isinstance(body, str) else body]
+        length = 0
+        for chunk in chunks:
+            length += len(chunk)
+        framing = None
+        if status not in (204, 304):  # these never have a body
+            framing = "Content-Length: {}\r\n".format(length)
+        head = self._head(status, content_type, headers, keep_alive, framing)
+        writer.write(head)
+        self.stats["bytes_sent"] += len(head) + length
+        for chunk in chunks:
+            if chunk:
+                writer.write(chunk)
+                await writer.drain()
+        await writer.drain()
+        return keep_alive
+
+    async def _send_stream(self, writer, status, content_type, body, headers, keep_alive, chunked):
+        head = self._head(status, content_type, headers, keep_alive,
+                          "Transfer-Encoding: chunked\r\n" if chunked else None)
+        writer.write(head)
+        sent = len(head)
+        buf = bytearray()
+        for part in body:
+            buf += part.encode("utf-8") if isinstance(part, str) else part
+            if len(buf) >= self.stream_chunk:
+                sent += await self._write_chunk(writer, buf, chunked)
+                buf = bytearray()
+        if buf:
+            sent += await self._write_chunk(writer, buf, chunked)
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+            sent += 5
+        await writer.drain()
+        self.stats["bytes_sent"] += sent
+        return keep_alive
+
+    async def _write_chunk(self, writer, data, chunked):
+        n = len(data)
+        if chunked:
+            size = "{:x}\r\n".format(n).encode()
+            writer.write(size)
+            writer.write(data)
+            writer.write(b"\r\n")
+            n += len(size) + 2
+        else:
+            writer.write(data)
+        await writer.drain()
+        return n
+
+    async def _dispatch(self, req):
+        entry = self.routes.get(req.path)
+        if entry is None:
+            return 404, "text/plain", "Not Found"
+        methods, handler = entry
+        if req.method not in methods:
+            return 405, "text/plain", "Method Not Allowed"
+        result = handler(req)
+        if hasattr(result, "send"):  # async handler
+            result = await result
+        if result is None or isinstance(result, tuple):  # None: the handler took the connection
+            return result
+        return 200, "text/html; charset=UTF-8", result
+
+    # ---------- Connection loop ----------
+    async def _free_slot(self):
+        while self.active >= self.max_conns:
+            self._slot.clear()
+            await self._slot.wait()
+
+    async def _wait_slot(self):
+        """Waits up to queue_s for one of the max_conns slots, False if none came free"""
+        self.waiting += 1
+        self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(self._free_slot(), self.queue_s)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    def _release(self):
+        self.active -= 1
+        self._slot.set()  # wakes a queued connection
+
+    async def _handle(self, reader, writer):
+        self.stats["connections"] += 1
+        if self.active >= self.max_conns and not await self._wait_slot():
+            self.stats["rejected"] += 1
+            try:
+                await self.send(writer, 503, "text/plain", "Busy", keep_alive=False)
+            finally:
+                await self._close(writer)
+            return
+        self.active += 1
+        req = None
+        buf = b""
+        first = True
+        try:
+            while True:
+                # the first request gets a little longer than idle keep-alive waits
+                head, buf = await self._read_head(reader, buf, self.keepalive_s * (2 if first else 1))
+                if head is None:
+                    break
+                first = False
+                req = self._parse_head(head, reader, writer)
+                req._release = self._release
+                req.body, buf = await self._read_body(req, reader, buf)
+                self.stats["requests"] += 1
+                try:
+                    result = await self._dispatch(req)
+                except Exception as e:
+                    print("HTTP handler error:", e)
+                    self.stats["errors"] += 1
+                    result = (500, "text/plain", "Internal Server Error")
+                if result is None:  # the handler wrote to req.writer itself (streams, upgrades)
+                    break
+                status, content_type, body = result[0], result[1], result[2]
+                headers = result[3] if len(result) > 3 else None
+                keep_alive = await self.send(writer, status, content_type, body, headers,
+                                             req.keep_alive, req.version != "HTTP/1.0")
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            try:
+                await self.send(writer, e.status, "text/plain", STATUS_TEXT.get(e.status, ""), keep_alive=False)
+            except Exception:
+                pass
+        except asyncio.TimeoutError:
+            pass
+        except Exception as e:
+            self.stats["errors"] += 1
+            print("HTTP connection error:", e)
+        finally:
+            if req is None or not req.detached:
+                self._release()
+            await self._close(writer)
+
+    async def _close(self, writer):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+    async def start(self, host="0.0.0.0", port=80, backlog=8):
+        """Starts listening and returns the asyncio server (runs alongside other tasks)"""
+        return await asyncio.start_server(self._handle, host, port, backlog=backlog)
+
+    async def serve(self, host="0.0.0.0", port=80, backlog=8):
+        """Starts listening and runs forever"""
+        await self.start(host, port, backlog)
+        print("HTTP server listening on {}:{}".format(host, port))
+        while True:
+            await asyncio.sleep(3600)
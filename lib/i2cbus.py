@@ -0,0 +1,148 @@
+# Shared I2C buses for the Pico projects
+#
+# get_bus(sda, scl) returns one bus object per pin pair, so every device on
+# those pins (OLED, BMP280, ...) shares it:
+# - the RP2040 hardware I2C peripheral is used when the pins belong to one
+#   (and it isn't already taken by other pins), SoftI2C only otherwise
+# - every transaction holds the bus lock, so a second thread can't
+#   interleave with it; `with bus:` holds it across several transactions
+#   (e.g. a register read-modify-write)
+# - bytes, transactions and time on the bus are counted, stats() gives the
+#   achieved throughput
+#
+# usage:
+#   bus = get_bus(sda=0, scl=1)
+#   oled = ssd1306.SSD1306_I2C(128, 64, bus)
+#   print(bus.stats())
+#
+# Copy this file to /lib on the Pico.
+
+from machine import Pin, I2C, SoftI2C
+from utime import ticks_us, ticks_diff
+
+try:
+    import _thread
+except ImportError:  # port without threads, transactions can't interleave anyway
+    _thread = None
+
+# RP2040 GPIO functions (datasheet 2.19.2, F3): GPIO -> hardware I2C peripheral.
+# GP23..25 and GP29 are wired on the Pico board (SMPS, VBUS, LED, VSYS) but
+# are listed for other RP2040 boards.
+_HW_SDA = {0: 0, 4: 0, 8: 0, 12: 0, 16: 0, 20: 0, 24: 0, 28: 0,
+           2: 1, 6: 1, 10: 1, 14: 1, 18: 1, 22: 1, 26: 1}
+_HW_SCL = {1: 0, 5: 0, 9: 0, 13: 0, 17: 0, 21: 0, 25: 0, 29: 0,
+           3: 1, 7: 1, 11: 1, 15: 1, 19: 1, 23: 1, 27: 1}
+
+buses = {}  # (sda, scl) -> SharedI2C
+_hw_taken = {}  # peripheral id -> (sda, scl)
+
+
+def get_bus(sda, scl, freq=400000):
+    """The shared bus on these pins, created on first use (later freq values are ignored)"""
+    key = (sda, scl)
+    bus = buses.get(key)
+    if bus is None:
+        hw = _HW_SDA.get(sda)
+        if hw is not None and hw == _HW_SCL.get(scl) and hw not in _hw_taken:
+            _hw_taken[hw] = key
+            i2c = I2C(hw, sda=Pin(sda), scl=Pin(scl), freq=freq)
+            name = "I2C{}".format(hw)
+        else:
+            i2c = SoftI2C(sda=Pin(sda), scl=Pin(scl), freq=freq)
+            name = "SoftI2C"
+        bus = SharedI2C(i2c, "{} sda={} scl={}".format(name, sda, scl), freq)
+        buses[key] = bus
+    return bus
+
+
+def report():
+    """stats() of every bus, keyed by name"""
+    return {bus.name: bus.stats() for bus in buses.values()}
+
+
+class SharedI2C:
+    """Wraps a machine.I2C / SoftI2C: same methods, plus a lock and counters"""
+    def __init__(self, i2c, name, freq):
+        self.i2c = i2c
+        self.name = name
+        self.freq = freq
+        self._lock = _thread.allocate_lock() if _thread else None
+        self._owner = None
+        self._depth = 0
+        self.transactions = 0
+        self.bytes = 0  # payload plus address / register bytes
+        self.busy_us = 0
+        self.errors = 0
+
+    # ---------- Lock ----------
+    def __enter__(self):
+        if self._lock is None:
+            return self
+        me = _thread.get_ident()
+        if self._owner != me:  # re-entering from the same thread doesn't block
+            self._lock.acquire()
+            self._owner = me
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        if self._lock is None:
+            return
+        self._depth -= 1
+        if not self._depth:
+            self._owner = None
+            self._lock.release()
+
+    def _run(self, n, fn, *args):
+        with self:
+            t0 = ticks_us()
+            try:
+                return fn(*args)
+            except OSError:
+                self.errors += 1
+                raise
+            finally:
+                self.busy_us += ticks_diff(ticks_us(), t0)
+                self.transactions += 1
+                self.bytes += n
+
+    # ---------- machine.I2C methods ----------
+    def scan(self):
+        return self._run(0, self.i2c.scan)
+
+    def writeto(self, addr, buf, stop=True):
+        return self._run(1 + len(buf), self.i2c.writeto, addr, buf, stop)
+
+    def writevto(self, addr, vector, stop=True):
+        n = 1
+        for buf in vector:
+            n += len(buf)
+        return self._run(n, self.i2c.writevto, addr, vector, stop)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return self._run(1 + nbytes, self.i2c.readfrom, addr, nbytes, stop)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        return self._run(1 + len(buf), self.i2c.readfrom_into, addr, buf, stop)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self._run(3 + nbytes, self.i2c.readfrom_mem, addr, memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        return self._run(3 + len(buf), self.i2c.readfrom_mem_into, addr, memaddr, buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        return self._run(2 + len(buf), self.i2c.writeto_mem, addr, memaddr, buf)
+
+    # ---------- Stats ----------
+    def stats(self):
+        """Achieved throughput while busy (9 bits per byte with ACK) and lifetime counters"""
+        busy = max(self.busy_us, 1)
+        return {
+            "transactions": self.transactions,
+            "bytes": self.bytes,
+            "busy_ms": self.busy_us // 1000,
+            "errors": self.errors,
+            "kbit_s": self.bytes * 9 * 1000 // busy,
+            "clock_khz": self.freq // 1000,
+        }
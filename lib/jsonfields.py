@@ -0,0 +1,203 @@
+# Incremental JSON field extractor
+#
+# Pulls a few scalar values out of a JSON document while it is still
+# arriving from the socket, without ever building the whole document.
+# Memory use is fixed: one token buffer of max_token bytes plus a stack
+# entry per nesting level, no matter how big the response is.
+#
+# Paths are dotted, array items are addressed by index:
+#   ex = JSONFields(("main.temp", "weather.0.description", "name"))
+#   while True:
+#       n = sock.readinto(buf)
+#       if not n: break
+#       ex.feed(memoryview(buf)[:n])
+#   ex.values  ->  {"main.temp": 11.3, "weather.0.description": "light rain", "name": "Halifax"}
+#
+# Objects and arrays are only walked, so a path must end at a string,
+# number, true, false or null.
+#
+# http_get_fields() does a non-blocking GET over uasyncio streams and feeds
+# the body straight into a JSONFields, for use inside an event loop:
+#   status, values = await http_get_fields("api.openweathermap.org", path, paths)
+#
+# Copy this file to /lib on the Pico.
+
+import uasyncio as asyncio
+
+_VALUE = 0  # expecting a value
+_KEY = 1  # inside an object, expecting a key or }
+_COLON = 2
+_STRING = 3
+_LITERAL = 4  # number, true, false, null
+_AFTER = 5  # after a value, expecting , } or ]
+_END = 6
+
+_WS = b" \t\r\n"
+_ESCAPES = {ord("n"): 10, ord("t"): 9, ord("r"): 13, ord("b"): 8, ord("f"): 12}
+
+
+class JSONFields:
+    def __init__(self, paths, max_token=64):
+        self.wanted = set(paths)
+        self.depth = 0  # deepest wanted path, anything below is skipped cheaply
+        for p in paths:
+            self.depth = max(self.depth, p.count(".") + 1)
+        self.values = {}
+        self.stack = []  # one [is_object, key or index] per open container
+        self.tok = bytearray(max_token)
+        self.tok_len = 0
+        self.state = _VALUE
+        self.is_key = False
+        self.escape = False
+        self.unicode = 0  # hex digits of a \uXXXX escape still to skip
+
+    @property
+    def done(self):
+        return self.state == _END
+
+    def _push(self, c):
+        if self.tok_len < len(self.tok):
+            self.tok[self.tok_len] = c
+            self.tok_len += 1
+
+    def _token(self):
+        tok = bytes(self.tok[:self.tok_len])
+        for cut in range(4):  # a truncated token may end inside a utf-8 character
+            try:
+                return tok[:len(tok) - cut].decode("utf-8")
+            except UnicodeError:
+                pass
+        return ""
+
+    def _path(self):
+        parts = []
+        for is_object, key in self.stack:
+            parts.append(key if is_object else str(key))
+        return ".".join(parts)
+
+    def _scalar(self, value_fn):
+        # only build the path string if it can possibly be wanted
+        if len(self.stack) <= self.depth:
+            path = self._path()
+            if path in self.wanted:
+                self.values[path] = value_fn()
+        self._after_value()
+
+    def _after_value(self):
+        self.state = _AFTER if self.stack else _END
+
+    def _literal(self):
+        tok = self._token()
+        if tok == "true":
+            return True
+        if tok == "false":
+            return False
+        if tok == "null":
+            return None
+        if "." in tok or "e" in tok or "E" in tok:
+            return float(tok)
+        return int(tok)
+
+    def feed(self, data):
+        for c in data:
+            state = self.state
+            if state == _STRING:
+                if self.unicode:
+                    self.unicode -= 1
+                    if not self.unicode:
+                        self._push(63)  # "?" for any \u escape
+                elif self.escape:
+                    self.escape = False
+                    if c == 117:  # u
+                        self.unicode = 4
+                    else:
+                        self._push(_ESCAPES.get(c, c))
+                elif c == 92:  # backslash
+                    self.escape = True
+                elif c == 34:  # closing quote
+                    if self.is_key:
+                        self.stack[-1][1] = self._token()
+                        self.state = _COLON
+                    else:
+                        self._scalar(self._token)
+                else:
+                    self._push(c)
+                continue
+
+            if state == _LITERAL:
+                if c not in b",}]" and c not in _WS:
+                    self._push(c)
+                    continue
+                self._scalar(self._literal)
+                state = self.state  # fall through to handle the delimiter
+
+            if c in _WS:
+                continue
+
+            if state == _VALUE:
+                if c == 123:  # {
+                    self.stack.append([True, None])
+                    self.state = _KEY
+                elif c == 91:  # [
+                    self.stack.append([False, 0])
+                elif c == 93:  # ] of an empty array
+                    self.stack.pop()
+                    self._after_value()
+                elif c == 34:
+                    self.tok_len = 0
+                    self.is_key = False
+                    self.state = _STRING
+                else:
+                    self.tok_len = 0
+                    self._push(c)
+                    self.state = _LITERAL
+            elif state == _KEY:
+                if c == 34:
+                    self.tok_len = 0
+                    self.is_key = True
+                    self.state = _STRING
+                elif c == 125:  # } of an empty object
+                    self.stack.pop()
+                    self._after_value()
+            elif state == _COLON:
+                if c == 58:
+                    self.state = _VALUE
+            elif state == _AFTER:
+                if c == 44:  # ,
+                    top = self.stack[-1]
+                    if top[0]:
+                        self.state = _KEY
+                    else:
+                        top[1] += 1
+                        self.state = _VALUE
+                elif c == 125 or c == 93:  # } ]
+                    self.stack.pop()
+                    self._after_value()
+        return self.state == _END
+
+
+async def http_get_fields(host, path, paths, port=80):
+    """Minimal non-blocking HTTP GET, returns (status, {path: value} or None).
+
+    The body is streamed through JSONFields, so the full document is never held in memory.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write("GET {} HTTP/1.0\r\nHost: {}\r\n\r\n".format(path, host).encode())
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        while True:
+            line = await reader.readline()
+            if not line or line == b"\r\n":
+                break
+        if status != 200:
+            return status, None
+        fields = JSONFields(paths)
+        while True:
+            chunk = await reader.read(128)
+            if not chunk or fields.feed(chunk):
+                break
+        return status, fields.values
+    finally:
+        writer.close()
+        await writer.wait_closed()
@@ -0,0 +1,33 @@
+# Partial SSD1306 updates: send a few columns of one page instead of show()
+#
+# oled.show() pushes the whole framebuffer (1 KB on a 128x64 panel) over
+# I2C. send_span() sets the panel's RAM window to one column range of one
+# 8 pixel page (six commands) and writes only those bytes. A 64 pixel wide
+# panel sits at column 32 of the controller's RAM, the same offset
+# ssd1306.show() uses. Both return the I2C bytes they wrote, for the
+# callers' bytes_sent counters.
+#
+# usage:
+#   fb = memoryview(oled.buffer)   # once
+#   sent += send_span(oled, fb, page, x0, x1)
+#   sent += send_all(oled)
+
+# SSD1306 commands
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+
+
+def send_span(oled, fb, page, x0, x1):
+    """Sends columns x0..x1 of one page from fb (the framebuffer), returns the bytes written"""
+    col = 32 if oled.width == 64 else 0
+    for cmd in (SET_COL_ADDR, col + x0, col + x1, SET_PAGE_ADDR, page, page):
+        oled.write_cmd(cmd)
+    start = page * oled.width
+    oled.write_data(fb[start + x0:start + x1 + 1])
+    return 12 + 1 + x1 - x0 + 1  # 6 commands (control byte + command), 0x40 data prefix + columns
+
+
+def send_all(oled):
+    """oled.show(), returns the bytes written"""
+    oled.show()
+    return 12 + 1 + len(oled.buffer)  # show() sets the window (6 commands) first
@@ -0,0 +1,370 @@
+# Server side WebSockets (RFC 6455) on top of httpserver.py
+#
+# The upgrade is a normal route, so the page and its socket share one
+# port: accept() checks the request, answers 101 with the
+# Sec-WebSocket-Accept key and returns a WebSocket. The handler then owns
+# the connection and returns None when it is done; the socket no longer
+# counts against the server's max_conns, so open sockets never keep the
+# page from loading (cap them in the app if needed).
+#
+# - recv() reads masked client frames straight into a buffer allocated
+#   once per connection (readinto() where the stream has it), unmasks them
+#   in place and returns (opcode, memoryview); the view is only valid
+#   until the next recv()
+# - fragmented messages are joined, pings are answered with pongs, a close
+#   frame is echoed and recv() returns None
+# - send() may be called from several tasks (the handler's replies, a
+#   Broadcaster's sender task, pongs): a frame is written and drained
+#   under a per-socket lock, since a uasyncio stream allows only one task
+#   waiting to write
+# - an idle connection gets a ping after idle_s and is closed if the peer
+#   stays silent for another idle_s (half-open sockets don't hang around)
+# - Broadcaster fans messages out to many sockets: every client has a
+#   small queue and its own sender task, so a client that stops reading
+#   only loses its own messages and is evicted, it never blocks the sender
+#   or the other clients and never holds more than its queue
+#
+# usage:
+#   @server.route("/ws")
+#   async def ws_route(req):
+#       ws = await websocket.accept(req)
+#       if ws is None:
+#           return 400, "text/plain", "WebSocket only"
+#       while True:
+#           msg = await ws.recv()
+#           if msg is None:
+#               return None
+#           opcode, data = msg
+#           await ws.send("got " + bytes(data).decode())
+#
+#   hub = Broadcaster()
+#   hub.add(ws)                            # in the handler, hub.remove(ws) when it ends
+#   hub.send(b"\x01\x02")                  # queued for every client, drop-oldest when full
+#   hub.send('{"score": 3}', key="score")  # replaces a queued "score" message (latest wins)
+#
+# Copy this file to /lib on the Pico.
+
+import uasyncio as asyncio
+import binascii
+import hashlib
+import struct
+from utime import ticks_ms, ticks_diff
+
+_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# opcodes
+CONT = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+# close codes
+NORMAL = 1000
+PROTOCOL_ERROR = 1002
+TOO_BIG = 1009
+
+_CLOSE_TIMEOUT_S = 2  # a close frame that can't be sent by then is dropped with the connection
+
+
+def accept_key(key):
+    """Sec-WebSocket-Accept value for a Sec-WebSocket-Key"""
+    return binascii.b2a_base64(hashlib.sha1(key.encode() + _GUID).digest())[:-1]
+
+
+async def accept(req, max_message=256, idle_s=30):
+    """Completes the handshake for a WebSocket upgrade request, None if it isn't one"""
+    h = req.headers
+    key = h.get("sec-websocket-key")
+    if (not key or h.get("upgrade", "").lower() != "websocket"
+            or "upgrade" not in h.get("connection", "").lower()
+            or h.get("sec-websocket-version") != "13"):
+        return None
+    req.detach()  # a long-lived socket, it doesn't take one of the server's HTTP slots
+    req.writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Accept: " + accept_key(key) + b"\r\n\r\n")
+    await req.writer.drain()
+    return WebSocket(req.reader, req.writer, max_message, idle_s)
+
+
+class WebSocket:
+    def __init__(self, reader, writer, max_message=256, idle_s=30):
+        self.reader = reader
+        self.writer = writer
+        self.idle_s = idle_s
+        self.buf = bytearray(max_message)  # unmasked payload of the current message
+        self.mv = memoryview(self.buf)
+        self._hdr = bytearray(10)  # header of the frame being sent
+        self._hmv = memoryview(self._hdr)
+        self._wlock = asyncio.Lock()  # one frame at a time, whichever task sends it
+        self._rhdr = bytearray(14)  # header of the frame being received: 2 + length 8 + mask 4
+        rmv = memoryview(self._rhdr)
+        self._rhead, self._rlen16, self._rlen64, self._rmask = rmv[:2], rmv[2:4], rmv[2:10], rmv[10:14]
+        self._readinto = hasattr(reader, "readinto")  # uasyncio streams have it, CPython's don't
+        self.closed = False
+        self.stats = {"frames_in": 0, "frames_out": 0, "pings": 0}
+
+    # ---------- Receiving ----------
+    async def _read_into(self, mv):
+        """Fills mv from the socket: readinto() where the stream has it, else read() in pieces"""
+        got = 0
+        n = len(mv)
+        while got < n:
+            if self._readinto:
+                k = await self.reader.readinto(mv[got:])
+            else:
+                data = await self.reader.read(n - got)
+                k = len(data)
+                mv[got:got + k] = data
+            if not k:
+                raise EOFError
+            got += k
+
+    async def _frame_start(self):
+        """Reads the first two header bytes, pinging once if the peer is idle. False: give up"""
+        for probe in (True, False):
+            try:
+                await asyncio.wait_for(self._read_into(self._rhead), self.idle_s)
+                return True
+            except asyncio.TimeoutError:
+                if probe:
+                    await self._send_frame(PING, b"")
+        return False
+
+    async def recv(self):
+        """Next TEXT / BINARY message as (opcode, memoryview), None once the connection is closed"""
+        try:
+            return await self._recv()
+        except (EOFError, OSError):  # peer went away mid-frame (CPython: IncompleteReadError)
+            self.closed = True
+            return None
+
+    async def _recv(self):
+        size = 0
+        opcode = None
+        hdr = self._rhdr
+        while not self.closed:
+            if not await self._frame_start():
+                self.closed = True
+                return None
+            b0, b1 = hdr[0], hdr[1]
+            fin, op, n = b0 & 0x80, b0 & 0x0F, b1 & 0x7F
+            if b0 & 0x70 or not b1 & 0x80:  # reserved bits, unmasked client frame
+                await self.close(PROTOCOL_ERROR)
+                return None
+            if n == 126:
+                await self._read_into(self._rlen16)
+                n = struct.unpack_from(">H", hdr, 2)[0]
+            elif n == 127:
+                await self._read_into(self._rlen64)
+                n = struct.unpack_from(">Q", hdr, 2)[0]
+            mask = self._rmask
+            await self._read_into(mask)
+            self.stats["frames_in"] += 1
+            if op >= CLOSE:  # control frames: short, never fragmented, may arrive between fragments
+                if n > 125 or not fin:
+                    await self.close(PROTOCOL_ERROR)
+                    return None
+                data = bytearray(n)
+                if n:
+                    await self._read_into(memoryview(data))
+                for i in range(n):
+                    data[i] ^= mask[i & 3]
+                if op == PING:
+                    self.stats["pings"] += 1
+                    await self._send_frame(PONG, data)
+                elif op == CLOSE:
+                    await self.close(struct.unpack(">H", data[:2])[0] if n >= 2 else NORMAL)
+                    return None
+                continue
+            if (op == CONT) != (opcode is not None):  # continuation without a start, or vice versa
+                await self.close(PROTOCOL_ERROR)
+                return None
+            if size + n > len(self.buf):
+                await self.close(TOO_BIG)
+                return None
+            if opcode is None:
+                opcode = op
+            if n:
+                # straight into the message buffer and unmasked there, nothing allocated per frame
+                await self._read_into(self.mv[size:size + n])
+                buf = self.buf
+                for i in range(size, size + n):
+                    buf[i] ^= mask[(i - size) & 3]
+                size += n
+            if fin:
+                return opcode, self.mv[:size]
+        return None
+
+    # ---------- Sending ----------
+    async def _send_frame(self, opcode, data):
+        async with self._wlock:
+            hdr = self._hdr
+            n = len(data)
+            hdr[0] = 0x80 | opcode
+            if n < 126:
+                hdr[1] = n
+                k = 2
+            elif n < 65536:
+                hdr[1] = 126
+                struct.pack_into(">H", hdr, 2, n)
+                k = 4
+            else:
+                hdr[1] = 127
+                struct.pack_into(">Q", hdr, 2, n)
+                k = 10
+            self.writer.write(self._hmv[:k])
+            if n:
+                self.writer.write(data)
+            await self.writer.drain()
+            self.stats["frames_out"] += 1
+
+    async def send(self, data, opcode=None):
+        """Sends one message: str as TEXT, bytes-like as BINARY unless opcode says otherwise"""
+        if self.closed:
+            raise OSError("WebSocket closed")
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+            if opcode is None:
+                opcode = TEXT
+        await self._send_frame(opcode or BINARY, data)
+
+    def abort(self):
+        """Drops the connection without a close handshake (for a peer that stopped reading)"""
+        self.closed = True
+        try:
+            self.writer.close()
+        except OSError:
+            pass
+
+    async def close(self, code=NORMAL):
+        """Sends a close frame (once); the TCP connection closes when the handler returns"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            await asyncio.wait_for(self._send_frame(CLOSE, struct.pack(">H", code)), _CLOSE_TIMEOUT_S)
+        except asyncio.TimeoutError:  # the peer stopped reading, don't wait for it
+            self.abort()
+        except OSError:
+            pass
+
+
+def _replace(queue, key, data, opcode):
+    """Puts data in place of the queued message with this key, False if there is none"""
+    for item in queue:
+        if item[0] == key:
+            item[1] = data
+            item[2] = opcode
+            return True
+    return False
+
+
+def _oldest_unkeyed(queue):
+    """Index of the message to drop: the oldest without a key, keyed state is kept if possible"""
+    for i in range(len(queue)):
+        if queue[i][0] is None:
+            return i
+    return 0
+
+
+class _Client:
+    def __init__(self, ws):
+        self.ws = ws
+        self.queue = []  # [key, data, opcode], oldest first
+        self.ready = asyncio.Event()
+        self.full_since = None  # ticks when the queue started overflowing
+        self.gone = False
+
+
+class Broadcaster:
+    """Sends every message to all clients without waiting for any of them.
+
+    send() only appends to each client's queue (queue_len messages at
+    most). A message with a key replaces one with the same key that is
+    still queued (coalesce, latest wins: scores, state); one without a key
+    pushes out the oldest queued message without a key when the queue is
+    full (drop oldest: a stream of frames). A client is evicted when one send takes
+    longer than send_timeout_s, or when its queue keeps overflowing for
+    evict_after_ms.
+    """
+    def __init__(self, queue_len=8, send_timeout_s=2, evict_after_ms=3000):
+        self.queue_len = queue_len
+        self.send_timeout_s = send_timeout_s
+        self.evict_after_ms = evict_after_ms
+        self.clients = []
+        self.stats = {"clients": 0, "sent": 0, "dropped": 0, "coalesced": 0, "evicted": 0}
+
+    def add(self, ws):
+        c = _Client(ws)
+        self.clients.append(c)
+        self.stats["clients"] = len(self.clients)
+        asyncio.create_task(self._pump(c))
+
+    def remove(self, ws):
+        for c in self.clients:
+            if c.ws is ws:
+                self._forget(c)
+                return
+
+    def _forget(self, c):
+        if c.gone:
+            return
+        c.gone = True
+        c.queue = []
+        c.ready.set()  # lets the sender task finish
+        self.clients.remove(c)
+        self.stats["clients"] = len(self.clients)
+
+    def _evict(self, c):
+        if not c.gone:
+            self.stats["evicted"] += 1
+            self._forget(c)
+            c.ws.abort()
+
+    def send(self, data, key=None, opcode=None):
+        """Queues a message (str: TEXT, bytes: BINARY) for every client, never waits"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+            if opcode is None:
+                opcode = TEXT
+        if opcode is None:
+            opcode = BINARY
+        now = ticks_ms()
+        slow = None
+        for c in self.clients:
+            q = c.queue
+            if key is not None and _replace(q, key, data, opcode):
+                self.stats["coalesced"] += 1
+                continue
+            if len(q) >= self.queue_len:
+                q.pop(_oldest_unkeyed(q))
+                self.stats["dropped"] += 1
+                if c.full_since is None:
+                    c.full_since = now
+                elif ticks_diff(now, c.full_since) > self.evict_after_ms:
+                    slow = slow or []
+                    slow.append(c)
+            q.append([key, data, opcode])
+            c.ready.set()
+        if slow:
+            for c in slow:
+                self._evict(c)
+
+    async def _pump(self, c):
+        """Sender task of one client"""
+        try:
+            while not c.gone:
+                if not c.queue:
+                    c.full_since = None  # caught up
+                    c.ready.clear()
+                    await c.ready.wait()
+                    continue
+                _, data, opcode = c.queue.pop(0)
+                await asyncio.wait_for(c.ws.send(data, opcode), self.send_timeout_s)
+                self.stats["sent"] += 1
+        except asyncio.TimeoutError:  # the client stopped reading
+            self._evict(c)
+        except OSError:  # the connection is gone, the handler removes it
+            self._forget(c)
@@ -0,0 +1,90 @@
+# Non-blocking blink / beep effects and alert thresholds
+#
+# An Effect plays a pattern of (value, duration_ms) steps on one output
+# (a NeoPixel colour, a buzzer tone, ...). play() starts it, update() is
+# called once per main loop pass and only touches the output when a step
+# boundary has passed, so nothing ever sleeps and the loop keeps its frame
+# rate while an alert is running.
+#
+# Hysteresis turns a reading into an alert state that switches on at one
+# level and only off again below a lower one, so a temperature hovering at
+# the threshold doesn't restart the alert every frame.
+#
+# usage:
+#   BLINK = (((255, 0, 0), 150), ((0, 0, 0), 150))
+#   led = Effect(set_colour, (0, 0, 0))
+#   hot = Hysteresis(on=40, off=39)
+#   while True:
+#       if hot.update(temp) > 0:
+#           led.play(BLINK, repeat=0)
+#       led.update()
+
+from utime import ticks_ms, ticks_add, ticks_diff
+
+
+class Effect:
+    def __init__(self, apply, idle):
+        self.apply = apply  # called with a step's value when the step starts
+        self.idle = idle  # value applied when the effect ends or is stopped
+        self.steps = None
+        self.i = 0
+        self.repeat = 0
+        self.step_ts = 0
+
+    @property
+    def active(self):
+        return self.steps is not None
+
+    def play(self, steps, repeat=1):
+        """Starts steps ((value, ms), ...), repeat times in a row, 0 = until stop()"""
+        assert sum(ms for _, ms in steps) > 0  # a pattern that takes no time would never let update() return
+        self.steps = steps
+        self.repeat = repeat
+        self.i = 0
+        self.step_ts = ticks_ms()
+        self.apply(steps[0][0])
+
+    def stop(self):
+        if self.steps is not None:
+            self.steps = None
+            self.apply(self.idle)
+
+    def update(self, now=None):
+        if self.steps is None:
+            return
+        if now is None:
+            now = ticks_ms()
+        duration = self.steps[self.i][1]
+        if ticks_diff(now, self.step_ts) < duration:
+            return
+        # skip every step that ended since the last call, then apply once
+        while ticks_diff(now, self.step_ts) >= duration:
+            self.step_ts = ticks_add(self.step_ts, duration)
+            self.i += 1
+            if self.i == len(self.steps):
+                self.i = 0
+                if self.repeat > 0:
+                    self.repeat -= 1
+                    if self.repeat == 0:
+                        self.stop()
+                        return
+            duration = self.steps[self.i][1]
+        self.apply(self.steps[self.i][0])
+
+
+class Hysteresis:
+    def __init__(self, on, off):
+        assert off <= on
+        self.on = on
+        self.off = off
+        self.active = False
+
+    def update(self, value):
+        """1 when the alert starts, -1 when it clears, 0 otherwise"""
+        if not self.active and value > self.on:
+            self.active = True
+            return 1
+        if self.active and value < self.off:
+            self.active = False
+            return -1
+        return 0
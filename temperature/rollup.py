@@ -0,0 +1,111 @@
+# Multi-resolution time series with min/max/mean rollups
+#
+# Every tier is a ring of fixed-size buckets (step seconds each) kept in
+# preallocated arrays, so memory is set by the tier sizes and never grows
+# with uptime. Each add() updates the current bucket of every tier in
+# place: min, max, sum and count, the mean is sum // count. A bucket
+# stops summing at 32767 samples (the count's limit), min and max still
+# follow every sample.
+#
+# The default tiers keep 1 s buckets for 10 minutes, 1 min buckets for a
+# day and 15 min buckets for 31 days, 5016 buckets x 10 bytes = ~50 KB.
+#
+# usage:
+#   history = RollupStore()
+#   history.add(time.time(), 2508)                 # 25.08 C as 0.01 C
+#   step, rows = history.query(now - 86400, now, max_points=128)
+#   rows = history.tier(60).buckets(start, end)   # or a given resolution
+#   for ts, lo, hi, mean, count in rows:
+#       ...
+
+from array import array
+
+DEFAULT_TIERS = ((1, 600), (60, 1440), (900, 2976))  # (step s, buckets)
+
+_SIZE = {"h": 2, "i": 4}
+
+
+class RollupTier:
+    def __init__(self, step, slots, typecode="h"):
+        self.step = step
+        self.slots = slots
+        # values use typecode, sums are 32 bit: keep step x sample rate x max value below 2**31
+        self.lo = array(typecode, bytes(slots * _SIZE[typecode]))
+        self.hi = array(typecode, bytes(slots * _SIZE[typecode]))
+        self.sum = array("i", bytes(slots * 4))
+        self.count = array("h", bytes(slots * 2))
+        self.last = None  # newest bucket number (ts // step)
+
+    def covers(self, ts):
+        """True if the bucket holding ts is still in the ring"""
+        return self.last is not None and ts // self.step > self.last - self.slots
+
+    def add(self, ts, value):
+        b = ts // self.step
+        if self.last is None or b > self.last:
+            # open the new bucket and empty any skipped ones (gaps in the data)
+            first = b if self.last is None else self.last + 1
+            for k in range(first, first + min(b - first + 1, self.slots)):
+                self.count[k % self.slots] = 0
+            self.last = b
+        elif b <= self.last - self.slots:
+            return  # older than anything this tier keeps
+        i = b % self.slots
+        n = self.count[i]
+        if n == 0:
+            self.lo[i] = value
+            self.hi[i] = value
+            self.sum[i] = value
+            self.count[i] = 1
+            return
+        if value < self.lo[i]:
+            self.lo[i] = value
+        if value > self.hi[i]:
+            self.hi[i] = value
+        if n < 32767:  # a full bucket keeps its mean of the first 32767 samples, sum and count stay in step
+            self.sum[i] += value
+            self.count[i] = n + 1
+
+    def buckets(self, start, end):
+        """Yields (bucket start ts, min, max, mean, count) for non-empty buckets in [start, end]"""
+        if self.last is None:
+            return
+        b = max(start // self.step, self.last - self.slots + 1)
+        stop = min(end // self.step, self.last)
+        while b <= stop:
+            i = b % self.slots
+            n = self.count[i]
+            if n:
+                yield b * self.step, self.lo[i], self.hi[i], self.sum[i] // n, n
+            b += 1
+
+
+class RollupStore:
+    def __init__(self, tiers=DEFAULT_TIERS, typecode="h"):
+        # finest tier first
+        self.tiers = [RollupTier(step, slots, typecode) for step, slots in sorted(tiers)]
+
+    def add(self, ts, value):
+        for tier in self.tiers:
+            tier.add(ts, value)
+
+    def best_tier(self, start, end, max_points=None):
+        """Finest tier that still holds start and, if given, needs at most max_points buckets"""
+        for tier in self.tiers:
+            if not tier.covers(start):
+                continue
+            if max_points is None or (end - start) // tier.step + 1 <= max_points:
+                return tier
+        return self.tiers[-1]
+
+    def tier(self, step):
+        """The tier with buckets of step seconds, None if there is none"""
+        for tier in self.tiers:
+            if tier.step == step:
+                return tier
+        return None
+
+    def query(self, start, end, max_points=None):
+        """(step, rows) from the best tier, rows as in RollupTier.buckets"""
+        tier = self.best_tier(start, end, max_points)
+        return tier.step, tier.buckets(start, end)
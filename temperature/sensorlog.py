@@ -0,0 +1,208 @@
+# Append-only binary sensor log in segment files
+#
+# Each record is 10 bytes: timestamp (s), temperature (0.01 C) and
+# pressure (Pa), packed with struct. Records are only ever appended, to the
+# newest of a few segment files in one directory; when it is full a new
+# segment is started and, past `segments` files, the oldest one is
+# deleted. Nothing is rewritten in place, which suits LittleFS (the Pico's
+# flash filesystem): an append writes the new bytes plus a small metadata
+# commit, where a write into the middle of a file copies the whole block.
+#
+# Timestamps must not go backwards. After a reboot without RTC/NTP sync
+# time.time() restarts in 2021, and such records would break the time order
+# every lookup relies on, so append() refuses them and counts them in
+# .rejected instead of storing a wrong time.
+#
+# Records stay sorted by time: the segment holding a time is picked from
+# the first timestamps kept in memory, then found by a binary search inside
+# it (O(log n) small reads), and a time range is streamed a few records at
+# a time without loading a file.
+#
+# usage:
+#   log = SensorLog("sensor_log")
+#   log.append(time.time(), 2508, 100653)
+#   for ts, centi, pa in log.records(start, end):
+#       ...
+#   for data in log.chunks(start, end):   # the same records still packed, for sending
+#       ...
+
+import os
+import struct
+
+_REC = "<Ihi"  # timestamp s, temperature 0.01 C, pressure Pa
+_REC_SIZE = 10
+_CHUNK = 16  # records per read while iterating
+
+
+class SensorLog:
+    def __init__(self, path="sensor_log", segments=20, per_segment=1024):
+        # defaults: 19 to 20 x 1024 records (at most 200 KB), a bit over a year at one per 30 min
+        self.path = path
+        self.segments = segments
+        self.per_segment = per_segment
+        self.rejected = 0  # appends refused because the timestamp went backwards
+        self._rec = bytearray(_REC_SIZE)
+        self._probe = bytearray(_REC_SIZE)
+        self.f = None  # append handle of the newest segment
+        self._torn = False  # the newest segment ends in a partial record
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass  # already there
+        self._scan()
+
+    # ---------- Layout ----------
+    def _name(self, seq):
+        return "{}/{:08d}.bin".format(self.path, seq)
+
+    def _scan(self):
+        """Lists the segments with their first timestamp and record count"""
+        self.segs = []  # [seq, first ts, records] per segment file, oldest first
+        self.count = 0
+        self.last_ts = 0
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".bin"):
+                continue
+            try:
+                seq = int(name[:-4])
+            except ValueError:
+                continue
+            size = os.stat(self._name(seq))[6]
+            n = size // _REC_SIZE
+            if not n:
+                os.remove(self._name(seq))
+                continue
+            with open(self._name(seq), "rb") as f:
+                first = self._ts_at(f, 0)
+                self.last_ts = self._ts_at(f, n - 1)
+            self.segs.append([seq, first, n])
+            self.count += n
+            self._torn = size % _REC_SIZE != 0  # power cut mid-append, start afresh
+
+    def _new_segment(self, ts):
+        """Starts the next segment file, deleting the oldest ones past self.segments"""
+        if self.f:
+            self.f.close()
+        seq = self.segs[-1][0] + 1 if self.segs else 0
+        self.f = open(self._name(seq), "wb")
+        self.segs.append([seq, ts, 0])
+        self._torn = False
+        while len(self.segs) > self.segments:
+            old = self.segs.pop(0)
+            os.remove(self._name(old[0]))
+            self.count -= old[2]
+
+    def _ts_at(self, f, slot):
+        f.seek(slot * _REC_SIZE)
+        f.readinto(self._probe)
+        return struct.unpack_from("<I", self._probe)[0]
+
+    def _locate(self, i):
+        """(segment index, slot) of the i-th record, 0 = oldest"""
+        for k, seg in enumerate(self.segs):
+            if i < seg[2]:
+                return k, i
+            i -= seg[2]
+        return len(self.segs), 0
+
+    def _open(self, seq):
+        try:
+            return open(self._name(seq), "rb")
+        except OSError:  # rotated away while a reader was streaming
+            return None
+
+    # ---------- API ----------
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return self.segments * self.per_segment
+
+    def append(self, ts, centi, pa):
+        """Adds one record, O(1): one small append. Returns False (and counts it
+        in .rejected) when ts is older than the last record"""
+        if ts < self.last_ts:
+            self.rejected += 1
+            return False
+        segs = self.segs
+        if not segs or segs[-1][2] >= self.per_segment or self._torn:
+            self._new_segment(ts)
+        elif self.f is None:
+            self.f = open(self._name(segs[-1][0]), "ab")
+        struct.pack_into(_REC, self._rec, 0, ts, centi, pa)
+        self.f.write(self._rec)
+        self.f.flush()
+        segs[-1][2] += 1
+        self.count += 1
+        self.last_ts = ts
+        return True
+
+    def find(self, ts):
+        """Index of the first record at or after ts (len(self) if none)"""
+        segs = self.segs
+        if not segs:
+            return 0
+        base = k = 0
+        while k + 1 < len(segs) and segs[k + 1][1] < ts:  # last segment starting before ts
+            base += segs[k][2]
+            k += 1
+        lo, hi = 0, segs[k][2]
+        with open(self._name(segs[k][0]), "rb") as f:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._ts_at(f, mid) < ts:
+                    lo = mid + 1
+                else:
+                    hi = mid
+        return base + lo
+
+    def records(self, start=None, end=None):
+        """Yields (ts, centi, pa) with start <= ts <= end, oldest first"""
+        k, slot = self._locate(0 if start is None else self.find(start))
+        buf = bytearray(_CHUNK * _REC_SIZE)
+        mv = memoryview(buf)
+        for seq, _, n in [tuple(s) for s in self.segs[k:]]:  # appends meanwhile are not included
+            f = self._open(seq)
+            if f is None:
+                slot = 0
+                continue
+            with f:
+                f.seek(slot * _REC_SIZE)
+                while slot < n:
+                    k = min(_CHUNK, n - slot)
+                    f.readinto(mv[:k * _REC_SIZE])
+                    for j in range(k):
+                        rec = struct.unpack_from(_REC, buf, j * _REC_SIZE)
+                        if end is not None and rec[0] > end:
+                            return
+                        yield rec
+                    slot += k
+            slot = 0
+
+    def chunks(self, start=None, end=None, n=32):
+        """Yields the packed records with start <= ts <= end as bytes, up to n records each"""
+        i = 0 if start is None else self.find(start)
+        left = (self.count if end is None else self.find(end + 1)) - i
+        k, slot = self._locate(i)
+        for seq, _, count in [tuple(s) for s in self.segs[k:]]:
+            if left <= 0:
+                break
+            f = self._open(seq)
+            if f is None:
+                left -= count - slot
+                slot = 0
+                continue
+            with f:
+                f.seek(slot * _REC_SIZE)
+                while slot < count and left > 0:
+                    k = min(n, count - slot, left)
+                    yield f.read(k * _REC_SIZE)
+                    slot += k
+                    left -= k
+            slot = 0
+
+    def close(self):
+        if self.f:
+            self.f.close()
+            self.f = None
@@ -1,6 +1,8 @@
 from machine import Pin, I2C, PWM
 import time
 import bmp280
+from sensorlog import SensorLog
+from alerts import Effect, Hysteresis
 import ssd1306
 import neopixel
 import framebuf
@@ -11,6 +13,8 @@ i2c_oled = I2C(0, sda=Pin(0), scl=Pin(1), freq=400000)
 
 # Initialize BMP280 sensor and OLED display
 sensor = bmp280.BMP280(i2c_bmp280)
+# forced mode: one conversion per second, the sensor sleeps in between
+sampler = bmp280.BMP280Sampler(sensor, period_ms=1000)
 oled = ssd1306.SSD1306_I2C(128, 64, i2c_oled)
 
 # Initialize NeoPixel (using GPIO 28)
@@ -21,6 +25,9 @@ buzzer = PWM(Pin(18))
 buzzer.freq(1000)  # Set frequency to 1kHz
 buzzer.duty_u16(0)  # Start with no sound
 
+# Append-only binary log on flash (segment files, the oldest is deleted when full)
+log = SensorLog("sensor_log")
+
 # Last time saved, in seconds
 last_save_time = time.time()
 
@@ -60,17 +67,18 @@ def save_temperature_data():
     year, month, day, _, hours, minutes, seconds, _ = current_time
     date_time_str = f"{year}-{month:02}-{day:02} {hours:02}:{minutes:02}:{seconds:02}"
 
-    # Read data from BMP280
-    temp = sensor.temperature
-    pressure = sensor.pressure
+    # Latest sample from the BMP280
+    temp, pressure = sampler.temperature, sampler.pressure
 
-    # Save data to a file with timestamp
-    with open('sensor_data.txt', 'a') as file:
-        file.write(f"{date_time_str} - Temperature: {temp:.2f} C, Pressure: {pressure:.2f} Pa\n")
+    # Append one record (seconds, 0.01 C, Pa) to the log
+    if not log.append(time.time(), sampler.temp_centi, sampler.pressure_pa):
+        print("Clock is behind the log (no RTC sync?), sample not saved")
 
     # Update the last saved time
     last_save_time = time.time()
     print(f"Data saved at {date_time_str} - Temp: {temp:.2f} C, Pressure: {pressure:.2f} Pa")
+    st = sampler.stats()
+    print(f"Sampling {st['rate_hz']:.2f} Hz, I2C busy {st['bus_pct']:.3f} % of the time")
 
 # Function to draw temperature animation on OLED using images
 def draw_temperature_animation(oled, temp, x_pos, y_pos): # Added x_pos and y_pos parameters
@@ -102,8 +110,7 @@ def update_oled():
 
     date_time_str = f"{year}-{month:02}-{day:02} {hours:02}:{minutes:02}:{seconds:02}"
     #print(f"Time: {date_time_str} | Temp: {temp:.2f} C | Pressure: {pressure:.2f} Pa")
-    temp = sensor.temperature
-    pressure = sensor.pressure
+    temp, pressure = sampler.temperature, sampler.pressure  # no bus access, poll() fetched them
 
     oled.fill(0)
     oled.text(date_time_str, 0, 0)
@@ -112,9 +119,9 @@ def update_oled():
 
     draw_temperature_animation(oled, temp, animation_x_pos, animation_y_pos) # Pass x and y positions
 
-    oled.show()
+    control_neopixel(temp)  # before show(), it may add the warning line
 
-    control_neopixel(temp)
+    oled.show()
 
     # --- Update Animation Position ---
     animation_x_pos += animation_direction * animation_speed
@@ -129,8 +136,38 @@ def update_oled():
     # --- End Update Animation Position ---
 
 
+# --- Alerts: blink red and beep while too hot, without stopping the loop ---
+RED_BLINK = (((255, 0, 0), 150), ((0, 0, 0), 150))
+ALARM_TONE = ((1000, 510), (0, 29490))  # 0.5 s beep every 30 s
+
+def set_pixel(colour):
+    np[0] = colour
+    np.write()
+
+def set_tone(freq):
+    if freq:
+        buzzer.freq(freq)
+        buzzer.duty_u16(30000)  # Set volume (duty cycle)
+    else:
+        buzzer.duty_u16(0)
+
+pixel_effect = Effect(set_pixel, (0, 0, 0))
+buzzer_effect = Effect(set_tone, 0)
+overheat = Hysteresis(on=26, off=25.5)  # alert above 26 C, cleared below 25.5 C
+
 # Function to control NeoPixel and trigger buzzer based on temperature
 def control_neopixel(temp):
+    change = overheat.update(temp)
+    if change > 0:
+        pixel_effect.play(RED_BLINK, repeat=0)
+        buzzer_effect.play(ALARM_TONE, repeat=0)
+    elif change < 0:
+        pixel_effect.stop()
+        buzzer_effect.stop()
+    if overheat.active:
+        oled.text('Waring hightTemp', 0, 50)
+        return  # the blink owns the pixel while the alert runs
+
     if temp <= 10:
         np[0] = (0, 0, 255)  # Blue
     elif temp <= 20:
@@ -139,28 +176,12 @@ def control_neopixel(temp):
         np[0] = (128, 50, 0)  # Soft Orange
     elif temp <= 26:
         np[0] = (255, 255, 0)  # Yellow
-    else:
-        # Blink Red if temp > 40
-        for _ in range(5):  # Blink 5 times
-            np[0] = (255, 0, 0)  # Red ON
-            np.write()  # Update the NeoPixel with the red color
-            time.sleep(0.005)  # Stay ON for 0.5s
-            np[0] = (0, 0, 0)  # OFF
-            np.write()  # Update the NeoPixel to OFF state
-            time.sleep(0.0005)  # Stay OFF for 0.
-            oled.text('Waring hightTemp', 0,50 )
-            oled.show()  # Update the OLED to show the text
-        activate_buzzer()  # Activate buzzer if temp > 40°C
-        return  # Exit the function once blinking is done to avoid overwriting the color
-
-# Function to activate buzzer
-def activate_buzzer():
-    buzzer.duty_u16(30000)  # Set volume (duty cycle)
-    time.sleep(0.51)  # Buzz for 0.5 seconds
-    buzzer.duty_u16(0)  # Turn off buzzer
 
 # Main loop
 while True:
+    sampler.poll()  # triggers or reads a conversion only when one is due
+    pixel_effect.update()  # advance blink / beep patterns, never sleeps
+    buzzer_effect.update()
     np.write() 
     update_oled()
     if time.time() - last_save_time >= 1800:  # Save data every 30 minutes
@@ -1,5 +1,6 @@
 import time
 import bmp280
+from alerts import Effect
 import ssd1306
 from machine import Pin, I2C
 import neopixel
@@ -11,6 +12,8 @@ i2c_oled = I2C(0, sda=Pin(0), scl=Pin(1), freq=400000)
 
 # Initialize BMP280 sensor and OLED display
 sensor = bmp280.BMP280(i2c_bmp280)
+# forced mode, 4 conversions per second are plenty for steering
+sampler = bmp280.BMP280Sampler(sensor, period_ms=250)
 oled = ssd1306.SSD1306_I2C(128, 64, i2c_oled)
 
 # Initialize NeoPixel (using GPIO 28)
@@ -30,19 +33,21 @@ food_x_pos = random.randint(0, 118)  # Random x position for food
 food_y_pos = random.randint(0, 54)  # Random y position for food
 food_size = 10  # Size of the food (same as the character size)
 
+# --- Feedback effects, advanced from the main loop instead of sleeping ---
+def set_pixel(colour):
+    np[0] = colour
+    np.write()
+
+buzzer_effect = Effect(buzzer.value, 0)
+pixel_effect = Effect(set_pixel, (0, 0, 0))
+
 # Function to activate buzzer
 def activate_buzzer():
-    buzzer.value(1)  # Turn on the buzzer
-    time.sleep(0.5)  # Buzz for 0.5 seconds
-    buzzer.value(0)  # Turn off the buzzer
+    buzzer_effect.play(((1, 500),))  # Buzz for 0.5 seconds
 
 # Function to display feedback on NeoPixel
 def food_collected_feedback():
-    np[0] = (0, 255, 0)  # Change NeoPixel to green for food collection
-    np.write()
-    time.sleep(0.2)  # Short delay to show feedback
-    np[0] = (0, 0, 0)  # Reset NeoPixel color
-    np.write()
+    pixel_effect.play((((0, 255, 0), 200),))  # Green for 0.2 seconds on food collection
 
 # Function to handle movement direction based on temperature
 def get_direction_and_feedback(temp):
@@ -111,8 +116,9 @@ def check_food_collision():
 def update_game():
     global animation_x_pos, animation_y_pos, score, food_x_pos, food_y_pos, animation_speed
 
-    # Read temperature from BMP280 sensor
-    temp = sensor.temperature
+    # Latest temperature from the BMP280
+    sampler.poll()
+    temp = sampler.temperature
 
     # Get movement direction and feedback based on temperature
     get_direction_and_feedback(temp)
@@ -144,12 +150,16 @@ def update_game():
         oled.fill(0)
         oled.text('Game Over', 40, 30)
         oled.show()
+        buzzer_effect.stop()
+        pixel_effect.stop()
         time.sleep(2)  # Display Game Over for 2 seconds
         return True  # Game Over
     return False
 
 # Main loop
 while True:
+    buzzer_effect.update()
+    pixel_effect.update()
     if update_game():  # If game is over, exit the loop
         break
     np.write()  # Update the NeoPixel
@@ -2,17 +2,29 @@
 
 from machine import Pin, I2C, PWM
 import time
+import network
+import uasyncio as asyncio
 import bmp280
+from httpserver import HTTPServer
+from sensorlog import SensorLog
+from rollup import RollupStore
+from alerts import Effect, Hysteresis
 import ssd1306
 import neopixel
 import framebuf
 
+# Wi-Fi for the history / metrics web server
+WIFI_SSID = ""
+WIFI_PASSWORD = ""
+
 # Initialize I2C for BMP280 and SSD1306
 i2c_bmp280 = I2C(1, sda=Pin(2), scl=Pin(3), freq=400000)
 i2c_oled = I2C(0, sda=Pin(0), scl=Pin(1), freq=400000)
 
 # Initialize BMP280 sensor and OLED display
 sensor = bmp280.BMP280(i2c_bmp280)
+# forced mode: one conversion per second, the sensor sleeps in between
+sampler = bmp280.BMP280Sampler(sensor, period_ms=1000)
 oled = ssd1306.SSD1306_I2C(128, 64, i2c_oled)
 
 # Initialize NeoPixel (using GPIO 28)
@@ -23,6 +35,11 @@ buzzer = PWM(Pin(18))
 buzzer.freq(1000)  # Set frequency to 1kHz
 buzzer.duty_u16(0)  # Start with no sound
 
+# Append-only binary log on flash (segment files, the oldest is deleted when full)
+log = SensorLog("sensor_log")
+# Temperature history in RAM: 1 s for 10 min, 1 min for a day, 15 min for a month
+history = RollupStore()
+
 # Last time saved, in seconds
 last_save_time = time.time()
 
@@ -63,17 +80,18 @@ def save_temperature_data():
     year, month, day, _, hours, minutes, seconds, _ = current_time
     date_time_str = f"{year}-{month:02}-{day:02} {hours:02}:{minutes:02}:{seconds:02}"
 
-    # Read data from BMP280
-    temp = sensor.temperature
-    pressure = sensor.pressure
+    # Latest sample from the BMP280
+    temp, pressure = sampler.temperature, sampler.pressure
 
-    # Save data to a file with timestamp
-    with open('sensor_data.txt', 'a') as file:
-        file.write(f"{date_time_str} - Temperature: {temp:.2f} C, Pressure: {pressure:.2f} Pa\n")
+    # Append one record (seconds, 0.01 C, Pa) to the log
+    if not log.append(time.time(), sampler.temp_centi, sampler.pressure_pa):
+        print("Clock is behind the log (no RTC sync?), sample not saved")
 
     # Update the last saved time
     last_save_time = time.time()
     print(f"Data saved at {date_time_str} - Temp: {temp:.2f} C, Pressure: {pressure:.2f} Pa")
+    st = sampler.stats()
+    print(f"Sampling {st['rate_hz']:.2f} Hz, I2C busy {st['bus_pct']:.3f} % of the time")
 
 # Function to draw temperature animation on OLED using images
 def draw_temperature_animation(oled, temp, x_pos, y_pos): # Added x_pos and y_pos parameters
@@ -105,8 +123,7 @@ def update_oled():
 
     date_time_str = f"{year}-{month:02}-{day:02} {hours:02}:{minutes:02}:{seconds:02}"
     #print(f"Current time: {date_time_str}")
-    temp = sensor.temperature
-    pressure = sensor.pressure
+    temp, pressure = sampler.temperature, sampler.pressure  # no bus access, poll() fetched them
 
     oled.fill(0)
     oled.text(date_time_str, 0, 0)
@@ -115,9 +132,9 @@ def update_oled():
 
     draw_temperature_animation(oled, temp, animation_x_pos, animation_y_pos) # Pass x and y positions
 
-    oled.show()
+    control_neopixel(temp)  # before show(), it may add the warning line
 
-    control_neopixel(temp)
+    oled.show()
 
     # --- Update Animation Position ---
     # Compare the current temperature with the previous temperature
@@ -141,8 +158,37 @@ def update_oled():
     # --- End Update Animation Position ---
 
 
+# --- Alerts: blink red and beep while too hot, without stopping the loop ---
+RED_BLINK = (((255, 0, 0), 150), ((0, 0, 0), 150))
+ALARM_TONE = ((1000, 510), (0, 29490))  # 0.5 s beep every 30 s
+
+def set_pixel(colour):
+    np[0] = colour
+    np.write()
+
+def set_tone(freq):
+    if freq:
+        buzzer.freq(freq)
+        buzzer.duty_u16(30000)  # Set volume (duty cycle)
+    else:
+        buzzer.duty_u16(0)
+
+pixel_effect = Effect(set_pixel, (0, 0, 0))
+buzzer_effect = Effect(set_tone, 0)
+overheat = Hysteresis(on=40, off=39.5)  # alert above 40 C, cleared below 39.5 C
+
 # Function to control NeoPixel and trigger buzzer based on temperature
 def control_neopixel(temp):
+    change = overheat.update(temp)
+    if change > 0:
+        pixel_effect.play(RED_BLINK, repeat=0)
+        buzzer_effect.play(ALARM_TONE, repeat=0)
+    elif change < 0:
+        pixel_effect.stop()
+        buzzer_effect.stop()
+    if overheat.active:
+        return  # the blink owns the pixel while the alert runs
+
     if temp <= 10:
         np[0] = (0, 0, 255)  # Blue
     elif temp <= 20:
@@ -151,29 +197,116 @@ def control_neopixel(temp):
         np[0] = (128, 50, 0)  # Soft Orange
     elif temp <= 40:
         np[0] = (255, 255, 0)  # Yellow
+
+# ---------- Web server ----------
+def connect_wifi(ssid, password):
+    """Connects to the Wi-Fi network."""
+    wlan = network.WLAN(network.STA_IF)
+    wlan.active(True)
+    if not wlan.isconnected():
+        print(f"Connecting to network '{ssid}'...")
+        wlan.connect(ssid, password)
+        max_wait = 15
+        while not wlan.isconnected() and max_wait > 0:
+            print(".", end="")
+            time.sleep(1)
+            max_wait -= 1
+        if not wlan.isconnected():
+            print("\nConnection failed.")
+            return None
+    print("\nConnected! Network config:", wlan.ifconfig())
+    return wlan
+
+server = HTTPServer()
+
+def history_csv(start, end):
+    yield "timestamp,temp_centi,pressure_pa\n"
+    for ts, centi, pa in log.records(start, end):
+        yield f"{ts},{centi},{pa}\n"
+
+def rollup_csv(rows):
+    yield "timestamp,min_centi,max_centi,mean_centi,count\n"
+    for ts, lo, hi, mean, n in rows:
+        yield f"{ts},{lo},{hi},{mean},{n}\n"
+
+@server.route("/history")
+def history_route(req):
+    """Logged samples, streamed: CSV by default, packed 10-byte records with ?format=bin.
+
+    ?start= / ?end= pick a time range in seconds, ?since=<last timestamp seen>
+    returns only newer records so a scraper can fetch incrementally.
+    ?res=1|60|900 returns min/max/mean buckets of that many seconds from the
+    in-memory rollup instead, ?res=auto the finest that fits in ?points=
+    (default 240) over the range (default the last day).
+    """
+    q = req.query
+    try:
+        start = int(q["since"]) + 1 if "since" in q else int(q.get("start", 0))
+        end = int(q["end"]) if "end" in q else None
+        res = q.get("res")
+        step = None if res in (None, "auto") else int(res)
+        points = int(q.get("points", 240))
+    except ValueError:
+        return 400, "text/plain", "start, end, since, res and points are whole numbers"
+    if res is not None:
+        end = int(time.time()) if end is None else end
+        if step is None:
+            if "start" not in q and "since" not in q:
+                start = end - 86400
+            step, rows = history.query(start, end, max_points=points)
+        else:
+            tier = history.tier(step)
+            if tier is None:
+                return 400, "text/plain", "res is one of auto, " + ", ".join(str(t.step) for t in history.tiers)
+            rows = tier.buckets(start, end)
+        return 200, "text/csv", rollup_csv(rows), {"X-Step": str(step)}
+    if q.get("format") == "bin":
+        # records as stored: little endian uint32 seconds, int16 0.01 C, int32 Pa
+        return 200, "application/octet-stream", log.chunks(start, end), {"X-Record-Format": "<Ihi"}
+    return 200, "text/csv", history_csv(start, end)
+
+@server.route("/metrics")
+def metrics_route(req):
+    """Current values in the Prometheus text format"""
+    st = sampler.stats()
+    return 200, "text/plain; version=0.0.4", f"""# TYPE bmp280_temperature_celsius gauge
+bmp280_temperature_celsius {sampler.temperature:.2f}
+# TYPE bmp280_pressure_pascals gauge
+bmp280_pressure_pascals {sampler.pressure:.2f}
+# TYPE bmp280_samples_total counter
+bmp280_samples_total {st['samples']}
+# TYPE bmp280_sample_rate_hz gauge
+bmp280_sample_rate_hz {st['rate_hz']:.3f}
+# TYPE bmp280_bus_busy_percent gauge
+bmp280_bus_busy_percent {st['bus_pct']:.4f}
+# TYPE sensor_log_records gauge
+sensor_log_records {len(log)}
+# TYPE sensor_log_rejected_total counter
+sensor_log_rejected_total {log.rejected}
+# TYPE http_requests_total counter
+http_requests_total {server.stats['requests']}
+"""
+
+# ---------- Main loop ----------
+async def sensor_loop():
+    while True:
+        if sampler.poll():  # triggers or reads a conversion only when one is due
+            history.add(time.time(), sampler.temp_centi)
+        pixel_effect.update()  # advance blink / beep patterns, never sleeps
+        buzzer_effect.update()
+        np.write()
+        update_oled()
+        if time.time() - last_save_time >= 1800:  # Save data every 30 minutes
+            save_temperature_data()
+
+        await asyncio.sleep_ms(50)  # lets the web server run between frames
+
+async def main():
+    if connect_wifi(WIFI_SSID, WIFI_PASSWORD):
+        await server.start("0.0.0.0", 80)
     else:
-        # Blink Red if temp > 40
-        for _ in range(5):  # Blink 5 times
-            np[0] = (255, 0, 0)  # Red ON
-            np.write()  # Update the NeoPixel with the red color
-            time.sleep(0.005)  # Stay ON for 0.5s
-            np[0] = (0, 0, 0)  # OFF
-            np.write()  # Update the NeoPixel to OFF state
-            time.sleep(0.0005)  # Stay OFF for 0.5s
-        activate_buzzer()  # Activate buzzer if temp > 40°C
-        return  # Exit the function once blinking is done to avoid overwriting the color
-
-# Function to activate buzzer
-def activate_buzzer():
-    buzzer.duty_u16(30000)  # Set volume (duty cycle)
-    time.sleep(0.51)  # Buzz for 0.5 seconds
-    buzzer.duty_u16(0)  # Turn off buzzer
-
-# Main loop
-while True:
-    np.write() 
-    update_oled()
-    if time.time() - last_save_time >= 1800:  # Save data every 30 minutes
-        save_temperature_data()
-
-    time.sleep(0.05) # Reduced sleep time for smoother animation (adjust as needed)
+        print("No Wi-Fi, running without the web server")
+    await sensor_loop()
+
+asyncio.run(main())
+
@@ -1,9 +1,9 @@
-from machine import Pin, SoftI2C
+import i2cbus
 import ssd1306
 import time
 
-# Software I2C (works on any pins)
-i2c = SoftI2C(sda=Pin(0), scl=Pin(1), freq=400000)
+# GP0/GP1 are hardware I2C0 pins (i2cbus picks SoftI2C only for other pins)
+i2c = i2cbus.get_bus(sda=0, scl=1, freq=400000)
 
 oled = ssd1306.SSD1306_I2C(128, 64, i2c, addr=0x3C)
 
@@ -0,0 +1,152 @@
+# Runs the MicroPython code on CPython: the modules that only exist on the
+# Pico (machine, utime, uasyncio, ssd1306, PicoRobotics, ...) are replaced
+# with small stand-ins before any test imports project code, and every
+# project folder is put on sys.path the way the files sit next to each
+# other on the Pico.
+#
+#   python -m pytest -q tests
+
+import asyncio
+import json
+import os
+import random
+import struct
+import sys
+import time
+import types
+
+import fakes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("lib", "wether_api/needs", "wether_api", "clockwatch", "fakeos",
+               "temperature", "game_pad_server", "Robot"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+
+def _module(name, **attrs):
+    m = types.ModuleType(name)
+    m.__dict__.update(attrs)
+    sys.modules[name] = m
+    return m
+
+
+# ---------- utime ----------
+_TICKS_PERIOD = 1 << 30
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+
+def ticks_ms():
+    return int(time.monotonic() * 1000) & (_TICKS_PERIOD - 1)
+
+
+def ticks_us():
+    return int(time.monotonic() * 1000000) & (_TICKS_PERIOD - 1)
+
+
+def ticks_add(t, delta):
+    return (t + delta) & (_TICKS_PERIOD - 1)
+
+
+def ticks_diff(a, b):
+    return ((a - b + _TICKS_HALF) & (_TICKS_PERIOD - 1)) - _TICKS_HALF
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+_ticks = dict(ticks_ms=ticks_ms, ticks_us=ticks_us, ticks_add=ticks_add, ticks_diff=ticks_diff,
+              sleep_ms=sleep_ms, sleep_us=sleep_us)
+for _name, _f in _ticks.items():  # MicroPython's time has them too
+    setattr(time, _name, _f)
+_module("utime", **{k: getattr(time, k) for k in dir(time) if not k.startswith("__")})
+
+
+# ---------- uasyncio ----------
+def _sleep_ms(ms):
+    return asyncio.sleep(ms / 1000)
+
+
+def _wait_for_ms(aw, ms):
+    return asyncio.wait_for(aw, ms / 1000)
+
+
+_module("uasyncio", **{k: v for k, v in asyncio.__dict__.items() if not k.startswith("__")})
+sys.modules["uasyncio"].sleep_ms = _sleep_ms
+sys.modules["uasyncio"].wait_for_ms = _wait_for_ms
+
+# ---------- Small renames ----------
+sys.modules["ujson"] = json
+sys.modules["ustruct"] = struct
+_module("urandom", getrandbits=random.getrandbits, randint=random.randint,
+        randrange=random.randrange, choice=random.choice, random=random.random, seed=random.seed)
+_module("micropython", const=lambda x: x)
+if not hasattr(sys, "print_exception"):
+    sys.print_exception = lambda e, file=None: print(repr(e), file=file)
+
+# ---------- Hardware ----------
+_module("machine", Pin=fakes.FakePin, I2C=fakes.FakeI2C, SoftI2C=fakes.FakeI2C, PWM=fakes.FakePWM,
+        reset=lambda: None, freq=lambda *a: 125000000)
+_module("ssd1306", SSD1306_I2C=fakes.FakeSSD1306)
+_module("framebuf", FrameBuffer=fakes.FakeFrameBuffer, MONO_VLSB=0, MONO_HLSB=3, MONO_HMSB=4)
+_module("neopixel", NeoPixel=fakes.FakeNeoPixel)
+_module("PicoRobotics", KitronikPicoRobotics=fakes.FakeRoboticsBoard)
+
+
+class _WLAN:
+    def __init__(self, *args):
+        pass
+
+    def active(self, *args):
+        return True
+
+    def isconnected(self):
+        return True
+
+    def connect(self, *args):
+        pass
+
+    def config(self, *args, **kwargs):
+        pass
+
+    def ifconfig(self, *args):
+        return ("127.0.0.1", "255.255.255.0", "127.0.0.1", "127.0.0.1")
+
+
+_module("network", STA_IF=0, AP_IF=1, WLAN=_WLAN)
+
+
+# ---------- deflate (MicroPython 1.21+) ----------
+class _DeflateIO:
+    def __init__(self, stream, format=0, wbits=0, close=False):
+        import zlib
+        self.stream = stream
+        self.d = zlib.decompressobj(16 + (wbits or 15) if format == 3 else (wbits or 15))
+        self.out = b""
+
+    def read(self, n=-1):
+        while n < 0 or len(self.out) < n:
+            data = self.stream.read(256)
+            if not data:
+                self.out += self.d.flush()
+                break
+            try:
+                self.out += self.d.decompress(data)
+            except Exception as e:  # zlib.error, MicroPython raises OSError
+                raise OSError(str(e))
+        if n < 0:
+            n = len(self.out)
+        data, self.out = self.out[:n], self.out[n:]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+
+_module("deflate", DeflateIO=_DeflateIO, AUTO=0, RAW=1, ZLIB=2, GZIP=3)
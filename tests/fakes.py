@@ -0,0 +1,385 @@
+# Host stand-ins for the Pico hardware and the network, shared by the tests
+#
+# FakeI2C records every transaction, FakeSSD1306 is an SSD1306_I2C with a
+# real MONO_VLSB framebuffer and a model of the panel RAM, so a test can
+# check that what reached the panel is what was drawn and count the bytes
+# that went over the bus for it. stub_server() and http_get() are a local
+# HTTP server and client on 127.0.0.1 for the web code, ws_connect() a
+# WebSocket client.
+
+import asyncio
+import base64
+import hashlib
+import os
+import socket
+import struct
+
+_SET_COL_ADDR = 0x21
+_SET_PAGE_ADDR = 0x22
+
+
+class FakeI2C:
+    """Records transactions and bytes; register reads come from self.regs"""
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.regs = {}  # addr -> bytearray(256)
+        self.txns = 0
+        self.bytes = 0
+        self.writes = []  # (addr, bytes)
+
+    def _mem(self, addr):
+        return self.regs.setdefault(addr, bytearray(256))
+
+    def writeto(self, addr, buf, stop=True):
+        self.txns += 1
+        self.bytes += len(buf)
+        self.writes.append((addr, bytes(buf)))
+        return 1
+
+    def writevto(self, addr, bufs, stop=True):
+        self.txns += 1
+        data = b"".join(bytes(b) for b in bufs)
+        self.bytes += len(data)
+        self.writes.append((addr, data))
+        return 1
+
+    def readfrom(self, addr, n, stop=True):
+        self.txns += 1
+        self.bytes += n
+        return bytes(n)
+
+    def writeto_mem(self, addr, reg, buf):
+        self.txns += 1
+        self.bytes += len(buf)
+        self._mem(addr)[reg:reg + len(buf)] = buf
+
+    def readfrom_mem(self, addr, reg, n):
+        self.txns += 1
+        self.bytes += n
+        return bytes(self._mem(addr)[reg:reg + n])
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        self.txns += 1
+        self.bytes += len(buf)
+        buf[:] = self._mem(addr)[reg:reg + len(buf)]
+
+    def scan(self):
+        return sorted(self.regs)
+
+
+class FakeSSD1306:
+    """SSD1306_I2C look-alike: framebuffer + panel RAM, everything sent over an i2c"""
+    def __init__(self, width=128, height=64, i2c=None, addr=0x3C):
+        self.width = width
+        self.height = height
+        self.pages = height // 8
+        self.i2c = i2c if i2c is not None else FakeI2C()
+        self.addr = addr
+        self.buffer = bytearray(self.pages * width)
+        self.ram = bytearray(self.pages * width)  # what the panel holds
+        self.col0 = 32 if width == 64 else 0  # a 64 pixel panel shows columns 32..95 of the controller's RAM
+        self.start_line = 0
+        self._win = [self.col0, self.col0 + width - 1, 0, self.pages - 1]
+        self._pos = [0, 0]
+        self._args = []
+
+    # ---------- Drawing (framebuf) ----------
+    def pixel(self, x, y, c=None):
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return 0
+        i = (y >> 3) * self.width + x
+        if c is None:
+            return self.buffer[i] >> (y & 7) & 1
+        if c:
+            self.buffer[i] |= 1 << (y & 7)
+        else:
+            self.buffer[i] &= ~(1 << (y & 7)) & 0xFF
+
+    def fill(self, c):
+        self.buffer[:] = (b"\xff" if c else b"\x00") * len(self.buffer)
+
+    def fill_rect(self, x, y, w, h, c):
+        for xx in range(max(x, 0), min(x + w, self.width)):
+            for yy in range(max(y, 0), min(y + h, self.height)):
+                self.pixel(xx, yy, c)
+
+    def rect(self, x, y, w, h, c):
+        self.hline(x, y, w, c)
+        self.hline(x, y + h - 1, w, c)
+        self.vline(x, y, h, c)
+        self.vline(x + w - 1, y, h, c)
+
+    def hline(self, x, y, w, c):
+        self.fill_rect(x, y, w, 1, c)
+
+    def vline(self, x, y, h, c):
+        self.fill_rect(x, y, 1, h, c)
+
+    def text(self, s, x, y, c=1):
+        for k, ch in enumerate(s):  # made-up 8x8 glyphs, distinct per character
+            for col in range(8):
+                bits = (ord(ch) * (col + 3)) & 0x7E
+                for b in range(8):
+                    if bits >> b & 1:
+                        self.pixel(x + 8 * k + col, y + b, c)
+
+    def blit(self, fb, x, y, key=-1):
+        pass
+
+    def scroll(self, dx, dy):
+        raise NotImplementedError
+
+    # ---------- Panel ----------
+    def write_cmd(self, cmd):
+        self.i2c.writeto(self.addr, bytes((0x80, cmd)))
+        args = self._args
+        if args:
+            args.append(cmd)
+            if len(args) == 3:
+                if args[0] == _SET_COL_ADDR:
+                    self._win[0:2] = args[1:]
+                else:
+                    self._win[2:4] = args[1:]
+                self._pos = [self._win[0], self._win[2]]
+                self._args = []
+        elif cmd in (_SET_COL_ADDR, _SET_PAGE_ADDR):
+            self._args = [cmd]
+        elif 0x40 <= cmd <= 0x7F:
+            self.start_line = cmd & 0x3F
+
+    def write_data(self, buf):
+        self.i2c.writevto(self.addr, (b"\x40", buf))
+        x, p = self._pos
+        x0, x1, p0, p1 = self._win
+        for v in bytes(buf):
+            if 0 <= x - self.col0 < self.width:  # columns the panel doesn't show are lost
+                self.ram[p * self.width + x - self.col0] = v
+            x += 1
+            if x > x1:
+                x = x0
+                p = p + 1 if p < p1 else p0
+        self._pos = [x, p]
+
+    def show(self):
+        for cmd in (_SET_COL_ADDR, self.col0, self.col0 + self.width - 1, _SET_PAGE_ADDR, 0, self.pages - 1):
+            self.write_cmd(cmd)
+        self.write_data(self.buffer)
+
+    def poweron(self):
+        pass
+
+    def poweroff(self):
+        pass
+
+    def contrast(self, c):
+        pass
+
+    def invert(self, i):
+        pass
+
+    def screen(self):
+        """Rows as the viewer sees them: panel RAM rotated by the display start line"""
+        shift = self.start_line // 8 * self.width
+        return bytes(self.ram[shift:] + self.ram[:shift])
+
+
+SSD1306_I2C = FakeSSD1306
+
+
+class FakeFrameBuffer:
+    """framebuf.FrameBuffer for images that are only ever blitted"""
+    def __init__(self, buf, width, height, format, stride=None):
+        self.buf = buf
+        self.width = width
+        self.height = height
+        self.format = format
+
+
+class FakePin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+    PULL_DOWN = 3
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id=None, mode=None, pull=None, value=1):
+        self.id = id
+        self._value = value
+
+    def value(self, v=None):
+        if v is None:
+            return self._value
+        self._value = v
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, *args, **kwargs):
+        pass
+
+
+class FakePWM:
+    def __init__(self, pin, *args, **kwargs):
+        self.pin = pin
+        self._freq = 0
+        self._duty = 0
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self._duty
+        self._duty = d
+
+    def deinit(self):
+        pass
+
+
+class FakeNeoPixel:
+    def __init__(self, pin, n):
+        self.n = n
+        self.pixels = [(0, 0, 0)] * n
+        self.writes = 0
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, i, v):
+        self.pixels[i] = v
+
+    def __getitem__(self, i):
+        return self.pixels[i]
+
+    def fill(self, v):
+        self.pixels = [v] * self.n
+
+    def write(self):
+        self.writes += 1
+
+
+class FakeRoboticsBoard:
+    """PicoRobotics.KitronikPicoRobotics, records motor calls; pwm holds the signed % per motor"""
+    def __init__(self, *args, **kwargs):
+        self.calls = []
+        self.pwm = {1: 0, 2: 0}
+
+    def motorOn(self, motor, direction, speed):
+        self.calls.append((motor, direction, speed))
+        self.pwm[motor] = speed if direction == "f" else -speed
+
+    def motorOff(self, motor):
+        self.calls.append((motor, "off", 0))
+        self.pwm[motor] = 0
+
+
+# ---------- Network ----------
+async def stub_server(handler):
+    """Starts handler(reader, writer) on a free local port, returns (server, port)"""
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def read_response(reader):
+    """(status, headers, body) of one HTTP/1.1 response, Content-Length or chunked"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode().split("\r\n")
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            k, _, v = line.partition(":")
+            headers[k.strip().lower()] = v.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while True:
+            n = int((await reader.readline()).strip(), 16)
+            body += await reader.readexactly(n + 2)
+            body = body[:-2]
+            if n == 0:
+                break
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+async def http_get(port, path, headers=None):
+    """One request on a new connection, returns (status, headers, body)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        extra = "".join("{}: {}\r\n".format(k, v) for k, v in (headers or {}).items())
+        writer.write("GET {} HTTP/1.1\r\nHost: pico\r\n{}\r\n".format(path, extra).encode())
+        await writer.drain()
+        return await read_response(reader)
+    finally:
+        writer.close()
+
+
+WS_MASK = b"\x11\x22\x33\x44"
+
+
+def ws_frame(op, payload, fin=True, mask=WS_MASK, length=None):
+    """A client frame; length forces the 7, 16 or 64 bit length form"""
+    n = len(payload)
+    b0 = (0x80 if fin else 0) | op
+    length = length or (7 if n < 126 else 16 if n < 65536 else 64)
+    if length == 7:
+        hdr = bytes((b0, 0x80 | n))
+    elif length == 16:
+        hdr = bytes((b0, 0x80 | 126)) + struct.pack(">H", n)
+    else:
+        hdr = bytes((b0, 0x80 | 127)) + struct.pack(">Q", n)
+    return hdr + mask + bytes(b ^ mask[i & 3] for i, b in enumerate(payload))
+
+
+async def ws_read_frame(reader):
+    """(opcode, payload) of one server frame"""
+    b0, b1 = await reader.readexactly(2)
+    assert not b1 & 0x80  # server frames are never masked
+    n = b1 & 0x7F
+    if n == 126:
+        n = struct.unpack(">H", await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack(">Q", await reader.readexactly(8))[0]
+    return b0 & 0x0F, await reader.readexactly(n)
+
+
+async def ws_connect(port, path="/ws", rcvbuf=None):
+    """Opens a WebSocket, checks the handshake, returns (reader, writer).
+
+    rcvbuf shrinks the socket's receive buffer, so a client that stops
+    reading backs up the server after a few KB instead of a few MB.
+    """
+    if rcvbuf:
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+        reader, writer = await asyncio.open_connection(sock=sock, limit=rcvbuf)
+    else:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    key = base64.b64encode(os.urandom(16))
+    writer.write(b"GET " + path.encode() + b" HTTP/1.1\r\nHost: pico\r\nUpgrade: websocket\r\n"
+                 b"Connection: keep-alive, Upgrade\r\nSec-WebSocket-Key: " + key
+                 + b"\r\nSec-WebSocket-Version: 13\r\n\r\n")
+    head = await reader.readuntil(b"\r\n\r\n")
+    accept = base64.b64encode(hashlib.sha1(key + b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11").digest())
+    assert head.startswith(b"HTTP/1.1 101") and accept in head
+    return reader, writer
+
+
+# ---------- Scripts ----------
+def load_script(path, **env):
+    """Runs an app script without its final asyncio.run(main()), returns its globals"""
+    src = open(path).read().replace("asyncio.run(main())", "pass")  # also under if __name__ == "__main__"
+    ns = {"__name__": "script", "__file__": path}
+    ns.update(env)
+    exec(compile(src, path, "exec"), ns)
+    return ns
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+
+import alerts
+from alerts import Effect, Hysteresis
+
+RED_BLINK = (((255, 0, 0), 150), ((0, 0, 0), 150))
+ALARM_TONE = ((1000, 500), (0, 29500))
+
+
+class Clock:
+    def __init__(self, ms=0):
+        self.ms = ms
+
+    def __call__(self):
+        return self.ms
+
+
+def recorder(clock):
+    log = []
+    return log, lambda v: log.append((clock.ms, v))
+
+
+def test_blink_follows_the_pattern(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(alerts, "ticks_ms", clock)
+    log, apply = recorder(clock)
+    led = Effect(apply, (0, 0, 0))
+    led.play(RED_BLINK, repeat=0)
+    for _ in range(40):  # 50 ms frames for 2 s
+        clock.ms += 50
+        led.update()
+    assert [ts for ts, _ in log] == list(range(0, 2001, 150))  # one write per step, none in between
+    assert [v for _, v in log[:3]] == [(255, 0, 0), (0, 0, 0), (255, 0, 0)]
+    led.stop()
+    assert log[-1][1] == (0, 0, 0) and not led.active
+
+
+def test_repeat_ends_on_idle_and_late_updates_skip(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(alerts, "ticks_ms", clock)
+    log, apply = recorder(clock)
+    beep = Effect(apply, 0)
+    beep.play(((2000, 100), (0, 100)), repeat=2)
+    clock.ms = 250  # a slow frame: two steps ended, applied once
+    beep.update()
+    assert log == [(0, 2000), (250, 2000)]
+    clock.ms = 400
+    beep.update()
+    assert log[-1] == (400, 0) and not beep.active
+
+
+def test_ticks_wrap(monkeypatch):
+    clock = Clock((1 << 30) - 100)
+    monkeypatch.setattr(alerts, "ticks_ms", clock)
+    log, apply = recorder(clock)
+    led = Effect(apply, 0)
+    led.play(((1, 150), (0, 150)), repeat=0)
+    for _ in range(10):
+        clock.ms = (clock.ms + 50) & ((1 << 30) - 1)
+        led.update()
+    assert [v for _, v in log] == [1, 0, 1, 0]
+
+
+def test_hovering_temperature_does_not_retrigger():
+    hot = Hysteresis(on=26, off=25.5)
+    temps = [25, 25.9, 26.1, 26.05, 25.8, 26.2, 25.6, 25.4, 25.9, 26.3] * 6
+    changes = [hot.update(t) for t in temps]
+    naive = sum(1 for a, b in zip([0] + temps, temps) if a <= 26 < b)
+    assert changes[:8] == [0, 0, 1, 0, 0, 0, 0, -1]  # wobbling around 26 C doesn't clear it
+    assert changes.count(1) == 12 < naive == 18
+
+
+def test_frame_period_is_steady_while_alerting():
+    """tem.py's loop with an alert running: no update() waits for a step to end"""
+    led = Effect(lambda v: None, (0, 0, 0))
+    tone = Effect(lambda v: None, 0)
+    hot = Hysteresis(on=26, off=25.5)
+    frames = []
+    prev = time.monotonic()
+    for k in range(60):
+        if hot.update(27 if k >= 10 else 25) > 0:
+            led.play(RED_BLINK, repeat=0)
+            tone.play(ALARM_TONE, repeat=0)
+        led.update()
+        tone.update()
+        time.sleep(0.02 - (time.monotonic() - prev) % 0.02)
+        now = time.monotonic()
+        frames.append(now - prev)
+        prev = now
+    assert led.active and tone.active
+    assert max(frames[11:]) < 0.035  # the 150 ms blink and 500 ms beep never stretch a frame
+
+
+def test_pattern_that_takes_no_time_is_refused(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(alerts, "ticks_ms", clock)
+    log, apply = recorder(clock)
+    led = Effect(apply, 0)
+    with pytest.raises(AssertionError):
+        led.play(((1, 0), (0, 0)), repeat=0)
+    assert not led.active and log == []
+    led.play(((1, 0), (2, 100)), repeat=0)  # a zero step inside a pattern is just skipped
+    clock.ms = 250
+    led.update()
+    assert log == [(0, 1), (250, 2)]
@@ -0,0 +1,297 @@
+import struct
+
+import bmp280
+from fakes import FakeI2C
+
+# datasheet section 3.12 example: calibration, raw sample and results
+CALIBRATION = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000)
+T_RAW, P_RAW = 519888, 415148
+
+
+def raw_bytes(p_raw, t_raw):
+    return bytes((p_raw >> 12, p_raw >> 4 & 255, (p_raw & 15) << 4,
+                  t_raw >> 12, t_raw >> 4 & 255, (t_raw & 15) << 4))
+
+
+def fake_bus(p_raw=P_RAW, t_raw=T_RAW):
+    """FakeI2C holding the datasheet calibration and one sample at 0x76"""
+    i2c = FakeI2C()
+    regs = i2c._mem(0x76)
+    regs[0x88:0x88 + 24] = struct.pack("<HhhHhhhhhhhh", *CALIBRATION)
+    regs[0xF7:0xFD] = raw_bytes(p_raw, t_raw)
+    return i2c
+
+
+class Clock:
+    def __init__(self):
+        self.ms = 0
+
+    def __call__(self):
+        return self.ms
+
+
+# ---------- Burst read rate limit ----------
+def test_one_burst_read_per_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bmp280, "ticks_ms", clock)
+    i2c = fake_bus()
+    sensor = bmp280.BMP280(i2c, use_case=None, new_read_ms=200)
+    assert i2c.txns == 12  # calibration words
+    temp, pressure = sensor.read()
+    assert i2c.txns == 13
+    for _ in range(50):
+        clock.ms += 3
+        assert sensor.read() == (temp, pressure)
+        sensor.temperature, sensor.pressure, sensor.temperature_centi, sensor.pressure_pa_q8
+    assert i2c.txns == 13  # 150 ms of reads served from the one sample
+    clock.ms += 50
+    sensor.read()
+    assert i2c.txns == 14
+
+
+def test_new_sample_is_picked_up_after_the_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bmp280, "ticks_ms", clock)
+    i2c = fake_bus()
+    sensor = bmp280.BMP280(i2c, use_case=None, new_read_ms=200)
+    before = sensor.read()
+    i2c.regs[0x76][0xF7:0xFD] = raw_bytes(P_RAW + 4000, T_RAW + 5000)
+    clock.ms += 199
+    assert sensor.read() == before
+    clock.ms += 1
+    after = sensor.read()
+    assert after[0] > before[0] and after[1] != before[1]
+
+
+def test_zero_window_reads_every_time():
+    i2c = fake_bus()
+    sensor = bmp280.BMP280(i2c, use_case=None, new_read_ms=0)
+    start = i2c.txns
+    for _ in range(5):
+        sensor.read()
+    assert i2c.txns - start == 5
+
+
+def test_datasheet_example_values():
+    sensor = bmp280.BMP280(fake_bus(), use_case=None)
+    temp, pressure = sensor.read()
+    assert temp == 25.08
+    assert abs(pressure - 100653.27) < 1 / 16  # the table lists the floating point version
+
+
+# ---------- Integer compensation ----------
+class Tracked(int):
+    """int that counts the results MicroPython would have to put on the heap:
+    floats, and ints outside the small int range (31 bit signed on the Pico)"""
+    heap = 0
+
+
+def _tracked(name):
+    op = getattr(int, name)
+
+    def f(a, b):
+        v = op(int(a), int(b))
+        if isinstance(v, float) or not -(1 << 30) <= v < 1 << 30:
+            Tracked.heap += 1
+        return Tracked(v) if isinstance(v, int) else v
+    return f
+
+
+for _op in ("add", "sub", "mul", "floordiv", "mod", "truediv", "lshift", "rshift", "and", "or"):
+    setattr(Tracked, "__%s__" % _op, _tracked("__%s__" % _op))
+    setattr(Tracked, "__r%s__" % _op, _tracked("__r%s__" % _op))
+Tracked.__neg__ = lambda a: Tracked(-int(a))
+
+
+def sensor_at(t_raw, p_raw, tracked=False):
+    sensor = bmp280.BMP280(fake_bus(p_raw, t_raw), use_case=None)
+    if tracked:
+        for name in ("_T1", "_T2", "_T3", "_P1", "_P2", "_P3", "_P4", "_P5", "_P6", "_P7", "_P8", "_P9"):
+            setattr(sensor, name, Tracked(getattr(sensor, name)))
+    return sensor
+
+
+def sweep():
+    """Raw samples for about -25 .. 75 C and 300 .. 1100 hPa"""
+    for t_raw in range(260000, 780001, 26000):
+        for p_raw in range(150000, 720001, 5000):
+            yield t_raw, p_raw
+
+
+def test_integer_path_matches_the_datasheet_vector():
+    sensor = sensor_at(T_RAW, P_RAW)
+    assert sensor.temperature_centi == 2508
+    assert sensor.pressure_pa_q8 >> 8 == 100656  # the 32 bit reference result
+
+
+def datasheet_p_int32(s):
+    """bmp280_compensate_P_int32 from the datasheet, line by line"""
+    var1 = (s._t_fine >> 1) - 64000
+    var2 = (((var1 >> 2) * (var1 >> 2)) >> 11) * s._P6
+    var2 = var2 + ((var1 * s._P5) << 1)
+    var2 = (var2 >> 2) + (s._P4 << 16)
+    var1 = (((s._P3 * (((var1 >> 2) * (var1 >> 2)) >> 13)) >> 3) + ((s._P2 * var1) >> 1)) >> 18
+    var1 = ((32768 + var1) * s._P1) >> 15
+    p = ((1048576 - s._p_raw) - (var2 >> 12)) * 3125
+    p = (p << 1) // var1 if p < 0x80000000 else (p // var1) * 2
+    var1 = (s._P9 * (((p >> 3) * (p >> 3)) >> 13)) >> 12
+    var2 = ((p >> 2) * s._P8) >> 13
+    return p + ((var1 + var2 + s._P7) >> 4)
+
+
+def test_integer_and_float_paths_agree():
+    worst = 0
+    points = 0
+    for t_raw, p_raw in sweep():
+        sensor = sensor_at(t_raw, p_raw)
+        temp, pressure = sensor.read()
+        if not 30000 <= pressure <= 110000 or not -25 <= temp <= 75:
+            continue
+        points += 1
+        assert sensor.temperature_centi == round(temp * 100)
+        assert sensor.pressure_pa_q8 >> 8 == datasheet_p_int32(sensor)
+        worst = max(worst, abs(sensor.pressure_pa_q8 / 256 - pressure))
+    assert points > 800
+    assert worst < 8  # Pa, the 32 bit reference is that much coarser than the 64 bit one
+
+
+def test_allocations_per_read():
+    """Benchmark: heap objects created per sample, float read() vs the int path"""
+    per_read = {"float": 0, "int": 0}
+    points = 0
+    for t_raw, p_raw in sweep():
+        sensor = sensor_at(t_raw, p_raw, tracked=True)
+        Tracked.heap = 0
+        temp, pressure = sensor.read()
+        per_read["float"] = max(per_read["float"], Tracked.heap)
+        if not 30000 <= pressure <= 110000 or not -25 <= temp <= 75:
+            continue
+        points += 1
+        sensor._t_fine = sensor._p_q8 = 0
+        Tracked.heap = 0
+        sensor.temperature_centi, sensor.pressure_pa_q8
+        per_read["int"] = max(per_read["int"], Tracked.heap)
+    print("allocations per read over", points, "samples:", per_read)
+    assert per_read["int"] == 0
+    assert per_read["float"] > 10  # bigints in the 64 bit pressure math, plus the floats
+
+
+def test_sampler_keeps_integer_samples():
+    sensor = sensor_at(T_RAW, P_RAW, tracked=True)
+    sampler = bmp280.BMP280Sampler(sensor, period_ms=1000)
+    assert (sampler.temp_centi, sampler.pressure_pa) == (2508, 100656)
+    assert sampler.temperature == 25.08 and abs(sampler.pressure - 100656) < 1
+    Tracked.heap = 0
+    for _ in range(100):
+        sampler._fetch()
+    assert Tracked.heap == 0
+
+
+# ---------- Forced-mode sampler ----------
+class SimBus(FakeI2C):
+    """BMP280 in forced mode: a conversion takes conv_ms, then the sensor sleeps"""
+    def __init__(self, clock, conv_ms=6):
+        super().__init__()
+        self.clock = clock
+        self.conv_ms = conv_ms
+        self.busy_until = 0
+        self.conversions = 0
+        regs = self._mem(0x76)
+        regs[0x88:0x88 + 24] = struct.pack("<HhhHhhhhhhhh", *CALIBRATION)
+        regs[0xF7:0xFD] = raw_bytes(P_RAW, T_RAW)
+
+    def _status(self):
+        regs = self.regs[0x76]
+        busy = self.clock.ms < self.busy_until
+        regs[0xF3] = 8 if busy else 0
+        if not busy and regs[0xF4] & 3 == bmp280.BMP280_POWER_FORCED:
+            regs[0xF4] &= ~3  # conversion done, back to sleep
+
+    def readfrom_mem(self, addr, reg, n):
+        self._status()
+        return super().readfrom_mem(addr, reg, n)
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        self._status()
+        super().readfrom_mem_into(addr, reg, buf)
+
+    def writeto_mem(self, addr, reg, buf):
+        super().writeto_mem(addr, reg, buf)
+        if reg == 0xF4 and buf[0] & 3 == bmp280.BMP280_POWER_FORCED:
+            self.busy_until = self.clock.ms + self.conv_ms
+            self.conversions += 1
+
+
+def sim_sampler(monkeypatch, conv_ms=6, period_ms=100):
+    clock = Clock()
+    monkeypatch.setattr(bmp280, "ticks_ms", clock)
+    monkeypatch.setattr(bmp280, "ticks_us", lambda: clock.ms * 1000)
+
+    def sleep_ms(ms):
+        clock.ms += ms
+    monkeypatch.setattr(bmp280, "sleep_ms", sleep_ms)
+    bus = SimBus(clock, conv_ms)
+    sampler = bmp280.BMP280Sampler(bmp280.BMP280(bus), period_ms=period_ms)
+    return clock, bus, sampler
+
+
+def test_sampler_runs_one_conversion_per_period(monkeypatch):
+    clock, bus, sampler = sim_sampler(monkeypatch)
+    assert sampler.temp_centi == 2508
+    start = bus.conversions
+    for _ in range(2000):  # 5 ms main loop for 10 s
+        clock.ms += 5
+        sampler.poll()
+    clock.ms += 10
+    assert sampler.poll()  # the conversion started at 10 s
+    assert sampler.samples == 101 and bus.conversions - start == 100
+    assert sampler.not_ready == 0 and sampler.skipped == 0
+    assert bus.regs[0x76][0xF4] & 3 == bmp280.BMP280_POWER_SLEEP  # asleep until the next one
+
+
+def test_poll_leaves_the_bus_alone_between_samples(monkeypatch):
+    clock, bus, sampler = sim_sampler(monkeypatch)
+    while not sampler.poll():
+        clock.ms += 1
+    txns = bus.txns
+    for _ in range(sampler.sleep_ms() - 1):
+        clock.ms += 1
+        assert not sampler.poll()
+    assert bus.txns == txns
+
+
+def test_slow_conversion_is_read_when_done(monkeypatch):
+    clock, bus, sampler = sim_sampler(monkeypatch, conv_ms=20)
+    for _ in range(1000):
+        clock.ms += 2
+        sampler.poll()
+    assert sampler.not_ready > 0 and sampler.samples == 20
+    assert sampler.temp_centi == 2508
+
+
+def test_late_polls_skip_instead_of_bursting(monkeypatch):
+    clock, bus, sampler = sim_sampler(monkeypatch)
+    clock.ms += 1000  # the loop stalled for ten periods
+    start = bus.conversions
+    for _ in range(20):
+        clock.ms += 10
+        sampler.poll()
+    assert bus.conversions - start == 2 and sampler.skipped == 9
+
+
+# ---------- Register fields ----------
+def test_fields_leave_their_neighbours_alone():
+    i2c = fake_bus()
+    sensor = bmp280.BMP280(i2c, use_case=None)
+    regs = i2c._mem(0x76)
+    regs[0xF4] = regs[0xF5] = 0
+    sensor.standby, sensor.iir, sensor.spi3w = 7, 4, 1
+    sensor.temp_os, sensor.press_os, sensor.power_mode = 5, 2, 3
+    assert regs[0xF5] == 7 << 5 | 4 << 2 | 1 and regs[0xF4] == 5 << 5 | 2 << 2 | 3
+    assert (sensor.standby, sensor.iir, sensor.spi3w) == (7, 4, 1)
+    assert (sensor.temp_os, sensor.press_os, sensor.power_mode) == (5, 2, 3)
+    sensor.iir = 0
+    sensor.oversample(bmp280.BMP280_OS_ULTRAHIGH)  # both oversampling fields in one write
+    assert regs[0xF5] == 7 << 5 | 1 and regs[0xF4] == bmp280.BMP280_TEMP_OS_2 << 5 | bmp280.BMP280_PRES_OS_16 << 2 | 3
+    regs[0xF3] = 0x08
+    assert sensor.is_measuring and not sensor.is_updating
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import random
+import time
+
+from fakes import http_get, load_script
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def clock_watch(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = load_script(os.path.join(ROOT, "clockwatch", "clock_watch.py"))
+    app["bmp"].read = lambda: (21.5, 1013.2)
+    return app
+
+
+class Clock:
+    def __init__(self, ms=0):
+        self.ms = ms
+
+    def __call__(self):
+        return self.ms
+
+
+GOOD = {"desc": "Light rain", "temp": 12.5, "city": "Halifax", "feels_like": 11.0, "humidity": 80, "wind_speed": 4.2}
+
+
+async def loop_lag(stop, out):
+    """Worst delay of a 5 ms sleep while the other tasks run"""
+    while not stop.is_set():
+        t0 = time.monotonic()
+        await asyncio.sleep(0.005)
+        out[0] = max(out[0], time.monotonic() - t0 - 0.005)
+
+
+def test_one_loop_runs_button_display_and_web(tmp_path, monkeypatch):
+    app = clock_watch(tmp_path, monkeypatch)
+    oled, view, button = app["oled"], app["text_view"], app["button"]
+
+    async def run():
+        site = await app["server"].start("127.0.0.1", 0)
+        port = site.sockets[0].getsockname()[1]
+        stop, lag = asyncio.Event(), [0]
+        tasks = [asyncio.create_task(app[name]()) for name in ("button_task", "snake_task", "render_task")]
+        tasks.append(asyncio.create_task(loop_lag(stop, lag)))
+        await asyncio.sleep(0.1)
+        seen = {"clock": view.lines}
+        button.value(0)  # press
+        await asyncio.sleep(0.06)
+        button.value(1)
+        seen["banner"] = (app["mode"], view.lines)
+        await asyncio.sleep(0.6)
+        seen["temp"] = view.lines
+        status = (await http_get(port, "/mode=snake"))[0]
+        await asyncio.sleep(0.3)
+        seen["snake"] = (app["mode"], app["snake_ticks"]["run"])
+        stop.set()
+        for t in tasks:
+            t.cancel()
+        site.close()
+        return seen, status, lag[0]
+
+    seen, status, lag = asyncio.run(run())
+    assert seen["clock"][0] == (0, 0, "Clock")
+    assert seen["banner"] == ("TEMP", ((0, 10, "Mode:"), (0, 25, "TEMP")))
+    assert seen["temp"] == ((0, 0, "Temperature"), (0, 20, "T: 21.5 C"), (0, 40, "P: 1013.2hPa"))
+    assert status == 204 and seen["snake"][0] == "SNAKE" and seen["snake"][1] >= 1
+    assert oled.ram == oled.buffer  # the panel shows the last frame
+    assert app["latency"]["count"] >= 2 and app["latency"]["max_ms"] < 100
+    assert lag < 0.05  # no task holds the loop
+
+
+def test_snake_keeps_its_grid_through_stalls(tmp_path, monkeypatch):
+    app = clock_watch(tmp_path, monkeypatch)
+    app["set_mode"](3)
+    ticks = app["snake_ticks"]
+    tick_s = app["SNAKE_TICK_MS"] / 1000
+
+    async def run():
+        tasks = [asyncio.create_task(app[name]()) for name in ("snake_task", "render_task")]
+        t0 = time.monotonic()
+        await asyncio.sleep(0.5)
+        time.sleep(2.5 * tick_s)  # a slow frame: caught up, nothing lost
+        await asyncio.sleep(0.5)
+        after_short = dict(ticks, s=time.monotonic() - t0)
+        time.sleep(6.5 * tick_s)  # longer than SNAKE_MAX_CATCHUP ticks: the rest is dropped
+        await asyncio.sleep(0.5)
+        elapsed = time.monotonic() - t0
+        for t in tasks:
+            t.cancel()
+        return after_short, dict(ticks), elapsed
+
+    after_short, final, elapsed = asyncio.run(run())
+    assert after_short["dropped"] == 0 and abs(after_short["run"] - after_short["s"] / tick_s) <= 1.5
+    assert final["dropped"] >= 6 - app["SNAKE_MAX_CATCHUP"]
+    assert abs(final["run"] + final["dropped"] - elapsed / tick_s) <= 2  # the grid never drifts
+    late = app["timing"]["tick_late"].summary()
+    assert sum(late["counts"]) == final["run"] and late["max_ms"] >= 250
+
+
+def test_weather_backs_off_and_keeps_the_last_good_data(tmp_path, monkeypatch):
+    app = clock_watch(tmp_path, monkeypatch)
+    clock = Clock(1000)
+    monkeypatch.setattr(time, "ticks_ms", clock)
+    monkeypatch.setattr(app["urandom"], "getrandbits", lambda bits: 1 << bits - 1)  # the middle: no jitter
+    refresher = app["WeatherRefresher"]()
+    outcomes = ["ok", "fail", "fail", "fail", "fail", "fail", "ok"]
+    seen = []  # what the display read while fetches were running
+
+    async def fetch():
+        outcome = outcomes.pop(0)
+        result = {}
+        for k, v in GOOD.items():  # built across awaits, like a slow response
+            result[k] = v
+            await asyncio.sleep(0)
+        return result if outcome == "ok" else {"error": "Fetch Failed"}
+
+    async def reader(stop):
+        while not stop.is_set():
+            seen.append((app["weather_data"], app["weather_model"]()))
+            await asyncio.sleep(0)
+
+    app["get_weather_data"] = fetch
+    app["weather_data"] = {}
+
+    async def run():
+        stop = asyncio.Event()
+        task = asyncio.create_task(reader(stop))
+        delays = []
+        while outcomes:
+            before = clock.ms
+            await refresher.poll()
+            delays.append(refresher.next_fetch - before)
+            data = app["weather_data"]
+            assert data == GOOD, "the last good data is kept while retrying"
+            await refresher.poll()  # not due yet: no fetch
+            clock.ms = refresher.next_fetch
+        stop.set()
+        await task
+        return delays
+
+    delays = asyncio.run(run())
+    assert delays == [600000, 15000, 30000, 60000, 120000, 240000, 600000]
+    assert refresher.failures == 0
+    assert seen and all(data is not None and data in ({}, GOOD) for data, _ in seen)  # never half-built
+    assert all(model[1][2] == "Halifax" for data, model in seen if data)
+
+
+def test_retry_delay_is_jittered_and_capped(tmp_path, monkeypatch):
+    app = clock_watch(tmp_path, monkeypatch)
+    refresher = app["WeatherRefresher"](retry_min_ms=15000, retry_max_ms=600000)
+    rand = [0]
+    monkeypatch.setattr(app["urandom"], "getrandbits", lambda bits: rand[0])
+    for failures, base in ((1, 15000), (2, 30000), (6, 480000), (7, 600000), (30, 600000)):
+        refresher.failures = failures
+        rand[0] = 0
+        low = refresher._retry_delay()
+        rand[0] = 0xFFFF
+        high = refresher._retry_delay()
+        assert low == base - base // 4 and base + base // 4 - 20 <= high < base + base // 4
+    delays = set()
+    refresher.failures = 3
+    monkeypatch.setattr(app["urandom"], "getrandbits", random.getrandbits)
+    for _ in range(200):
+        delays.add(refresher._retry_delay())
+    assert min(delays) >= 45000 and max(delays) < 75000 and len(delays) > 100  # clients don't retry in step
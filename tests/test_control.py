@@ -0,0 +1,120 @@
+import asyncio
+import os
+import struct
+
+import control
+import websocket
+from control import CommandChannel
+from fakes import http_get, load_script, ws_connect, ws_frame, ws_read_frame
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setpoint(seq, throttle, steer, ts=0):
+    return struct.pack("<BHbb", seq & 0xFF, ts & 0xFFFF, throttle, steer)
+
+
+def channel():
+    log = []
+    ch = CommandChannel(lambda t, s: log.append((t, s)), lambda: log.append("halt"), deadman_ms=500)
+    return ch, log
+
+
+def test_latest_setpoint_wins():
+    ch, log = channel()
+    assert ch.feed(setpoint(1, 50, 0, ts=1234), now=0)
+    assert ch.ack == bytes((1, 1234 & 0xFF, 1234 >> 8))
+    assert ch.feed(setpoint(2, 50, 0), now=100)  # heartbeat: nothing to apply
+    assert not ch.feed(setpoint(1, -50, 0), now=110)  # older than what was applied
+    assert ch.feed(setpoint(5, 25, -25), now=120)  # frames lost in between don't matter
+    assert log == [(50, 0), (25, -25)]
+    assert ch.counts["frames"] == 4 and ch.counts["applied"] == 2 and ch.counts["stale"] == 1
+
+
+def test_sequence_wraps_and_restarts_on_connect():
+    ch, log = channel()
+    for seq in range(250, 262):
+        assert ch.feed(setpoint(seq, seq - 250, 0), now=0)
+    assert ch.seq == 261 & 0xFF and ch.counts["stale"] == 0
+    ch.disconnect()
+    ch.connect()  # a reloaded page counts from 1 again
+    assert ch.feed(setpoint(1, 5, 0), now=0) and log[-1] == (5, 0)
+
+
+def test_values_are_clamped_and_bad_frames_ignored():
+    ch, log = channel()
+    assert ch.feed(setpoint(1, 127, -128), now=0)
+    assert log == [(100, -100)]
+    assert not ch.feed(b"\x02\x00\x00\x10", now=0) and ch.counts["bad"] == 1
+
+
+def test_deadman_stops_once():
+    ch, log = channel()
+    ch.feed(setpoint(1, 50, 0), now=1000)
+    ch.check(now=1500)  # exactly deadman_ms: still driving
+    assert log == [(50, 0)]
+    ch.check(now=1501)
+    ch.check(now=1600)  # already stopped, not halted again
+    assert log == [(50, 0), "halt"] and ch.counts["deadman"] == 1
+    assert ch.feed(setpoint(2, 50, 0), now=1700) and log[-1] == (50, 0)  # the same setpoint applies again
+
+
+def test_deadman_with_ticks_wrapping(monkeypatch):
+    period = 1 << 30
+    ch, log = channel()
+    ch.feed(setpoint(1, 0, 40), now=period - 100)
+    ch.check(now=300)  # 400 ms later, across the wrap
+    assert log == [(0, 40)]
+    ch.check(now=401)
+    assert log[-1] == "halt"
+    monkeypatch.setattr(control, "ticks_ms", lambda: 401)
+    assert ch.stats()["last_frame_ms"] == 501
+
+
+def test_one_controller_at_a_time():
+    ch, log = channel()
+    assert ch.connect()
+    ch.feed(setpoint(7, 50, 0), now=0)
+    assert not ch.connect()  # a second page: the first one keeps its sequence numbers
+    assert ch.feed(setpoint(8, 60, 0), now=10) and log == [(50, 0), (60, 0)]
+    assert ch.disconnect() and log[-1] == "halt"
+    assert ch.connect() and ch.feed(setpoint(1, 10, 0), now=20)
+    assert ch.counts["rejected"] == 1 and ch.counts["stale"] == 0
+
+
+def test_second_page_neither_resets_nor_stops_the_first():
+    app = load_script(os.path.join(ROOT, "Robot", "Robot.py"))
+    control = app["control"]
+    upgrade = {"Upgrade": "websocket", "Connection": "Upgrade",
+               "Sec-WebSocket-Key": "dGhlIHNhbXBsZSBub25jZQ==", "Sec-WebSocket-Version": "13"}
+
+    async def drive(conn, seq, throttle):
+        reader, writer = conn
+        writer.write(ws_frame(websocket.BINARY, setpoint(seq, throttle, 0, ts=seq)))
+        op, ack = await ws_read_frame(reader)
+        assert op == websocket.BINARY and ack[0] == seq
+
+    async def run():
+        site = await app["server"].start("127.0.0.1", 0)
+        port = site.sockets[0].getsockname()[1]
+        first = await ws_connect(port)
+        await drive(first, 41, 50)
+        second = await http_get(port, "/ws", upgrade)  # another phone opens the page
+        await drive(first, 42, 60)
+        driving = (control.throttle, dict(control.counts))
+        first[1].write(ws_frame(websocket.CLOSE, b"\x03\xe8"))
+        await ws_read_frame(first[0])
+        while control.connected:
+            await asyncio.sleep(0.01)
+        stopped = (control.throttle, list(app["motors"].target))
+        third = await ws_connect(port)  # the first page is gone, the next one drives
+        await drive(third, 1, 30)
+        third[1].close()
+        site.close()
+        return second[0], driving, stopped, control.throttle
+
+    rejected, driving, stopped, throttle = asyncio.run(asyncio.wait_for(run(), 5))
+    assert rejected == 503
+    assert driving[0] == 60 and driving[1]["stale"] == 0 and driving[1]["rejected"] == 1
+    assert stopped[0] == 0 and stopped[1] == [0, 0]
+    assert throttle == 30
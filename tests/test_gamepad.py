@@ -0,0 +1,260 @@
+import asyncio
+import os
+import random
+import socket
+import struct
+
+import gamepad
+import websocket
+from fakes import http_get, load_script, ws_connect, ws_frame, ws_read_frame
+from gamepad import A, B, LEFT, RIGHT, Gamepads, pack
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def server_frames(data):
+    """(opcode, payload) of every frame in what the server wrote, checks they don't overlap"""
+    frames = []
+    i = 0
+    while i < len(data):
+        b0, n = data[i], data[i + 1] & 0x7F
+        assert b0 & 0xF0 == 0x80 and not data[i + 1] & 0x80
+        i += 2
+        if n == 126:
+            n = struct.unpack_from(">H", data, i)[0]
+            i += 2
+        frames.append((b0 & 0x0F, bytes(data[i:i + n])))
+        i += n
+    assert i == len(data)
+    return frames
+
+
+class StallingWriter:
+    """A phone on bad Wi-Fi: drain() takes a moment, or until closed once stalled.
+
+    Like a uasyncio stream, only one task may wait in drain() at a time; a
+    second one trips an assertion there (and is counted in overlaps).
+    """
+    def __init__(self):
+        self.out = bytearray()
+        self.waiting = False
+        self.stalled = False
+        self.closed = False
+        self.overlaps = 0
+
+    def write(self, data):
+        if self.closed:
+            raise OSError(104)
+        self.out += data
+
+    async def drain(self):
+        if self.waiting:
+            self.overlaps += 1
+            raise AssertionError("two tasks waiting to write on one stream")
+        self.waiting = True
+        try:
+            await asyncio.sleep(random.random() * 0.002)
+            while self.stalled and not self.closed:
+                await asyncio.sleep(0.01)
+            if self.closed:
+                raise OSError(104)
+        finally:
+            self.waiting = False
+
+    def close(self):
+        self.closed = True
+
+
+class Request:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.headers = {"upgrade": "websocket", "connection": "Upgrade",
+                        "sec-websocket-key": "dGhlIHNhbXBsZSBub25jZQ==", "sec-websocket-version": "13"}
+
+    def detach(self):
+        pass
+
+
+class Clock:
+    def __init__(self, ms=0):
+        self.ms = ms
+
+    def __call__(self):
+        return self.ms
+
+
+def test_second_page_leaves_the_first_ones_state_alone(monkeypatch):
+    monkeypatch.setattr(gamepad, "ticks_ms", Clock())
+    pad = Gamepads()
+    first = pad.connect()
+    for seq in (1, 2, 3):
+        pad.feed(first, pack(seq, seq * 10, LEFT))
+    second = pad.connect()
+    assert pad.feed(second, pack(1, 500, A))  # its own sequence numbers, starting over
+    assert pad.buttons == LEFT | A and pad.pressed() == LEFT | A
+    pad.disconnect(second)
+    assert pad.buttons == LEFT and pad.released() == A  # only what the second page held
+    assert pad.feed(first, pack(4, 40, 0))
+    assert first.counts["lost"] == 0 and first.counts["bad"] == 0
+    assert pad.released() == LEFT and pad.buttons == 0
+
+
+def test_edges_follow_the_merged_buttons(monkeypatch):
+    monkeypatch.setattr(gamepad, "ticks_ms", Clock())
+    pad = Gamepads()
+    a, b = pad.connect(), pad.connect()
+    pad.feed(a, pack(1, 0, A))
+    pad.feed(b, pack(1, 0, A | RIGHT))
+    assert pad.pressed() == A | RIGHT  # held on both pages, pressed once
+    pad.feed(a, pack(2, 0, 0))
+    assert pad.released() == 0 and pad.buttons == A | RIGHT
+    pad.feed(b, pack(2, 0, B))  # the last page lets go of A, taps B and RIGHT goes
+    pad.feed(b, pack(3, 0, 0))
+    assert pad.pressed() == B and pad.released() == A | RIGHT | B and pad.buttons == 0
+
+
+def test_a_quiet_page_times_out_alone(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(gamepad, "ticks_ms", clock)
+    pad = Gamepads(timeout_ms=1000)
+    a, b = pad.connect(), pad.connect()
+    pad.feed(a, pack(1, 0, LEFT))
+    pad.feed(b, pack(1, 0, A))
+    pad.pressed()
+    for seq in range(2, 8):  # b keeps sending keepalives, a went quiet
+        clock.ms += 250
+        pad.feed(b, pack(seq, clock.ms, A))
+    assert pad.buttons == A and pad.released() == LEFT
+    clock.ms += 100
+    pad.feed(a, pack(2, clock.ms, LEFT))  # a comes back still holding LEFT: a new press
+    assert pad.pressed() == LEFT and pad.buttons == LEFT | A
+
+
+def test_two_pages_through_the_web_server():
+    app = load_script(os.path.join(ROOT, "game_pad_server", "gamepad_webserver.py"))
+    pad = app["pad"]
+
+    async def send(conn, seq, buttons):
+        reader, writer = conn
+        writer.write(ws_frame(websocket.BINARY, pack(seq, 1000 + seq, buttons)))
+        op, ack = await ws_read_frame(reader)
+        assert op == websocket.BINARY and ack == bytes((seq, (1000 + seq) & 0xFF, (1000 + seq) >> 8))
+
+    async def run():
+        site = await app["http_server"].start("127.0.0.1", 0)
+        port = site.sockets[0].getsockname()[1]
+        first, second = await ws_connect(port), await ws_connect(port)
+        await send(first, 1, LEFT)
+        await send(second, 1, A)
+        await send(first, 2, LEFT)
+        held = pad.buttons
+        second[1].write(ws_frame(websocket.CLOSE, b"\x03\xe8"))
+        await ws_read_frame(second[0])
+        while len(pad.states) > 1:
+            await asyncio.sleep(0.01)
+        await send(first, 3, LEFT)
+        site.close()
+        return held, pad.buttons, pad.states[0].counts
+
+    held, after, counts = asyncio.run(run())
+    assert held == LEFT | A and after == LEFT
+    assert counts["frames"] == 3 and counts["lost"] == 0 and counts["bad"] == 0
+
+
+def test_acks_and_pushes_share_a_stalling_socket():
+    """Acks from the handler, pongs and hub pushes all write to one socket that stalls"""
+    random.seed(4)
+    app = load_script(os.path.join(ROOT, "game_pad_server", "gamepad_webserver.py"))
+    hub = app["hub"]
+    writer = StallingWriter()
+
+    async def run():
+        reader = asyncio.StreamReader()
+        handler = asyncio.create_task(app["websocket_handler"](Request(reader, writer)))
+        await asyncio.sleep(0)
+        writer.out = bytearray()  # after the 101 response
+        pings = 0
+        for seq in range(1, 301):
+            reader.feed_data(ws_frame(websocket.BINARY, pack(seq, seq, seq >> 4 & 0x3F)))
+            if seq % 10 == 0:
+                reader.feed_data(ws_frame(websocket.PING, b"%d" % seq))
+                pings += 1
+            app["push"]("buttons", [seq])  # coalesced, latest wins
+            hub.send(b"frame %d" % seq)  # drop oldest
+            await asyncio.sleep(0.001)
+        while hub.clients[0].queue or app["pad"].states[0].counts["frames"] < 300:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        before_stall = server_frames(writer.out)
+        hub.send_timeout_s = 0.3
+        hub.evict_after_ms = 300
+        writer.stalled = True  # the phone stops reading: the hub evicts it, the handler ends
+        for seq in range(301, 400):
+            reader.feed_data(ws_frame(websocket.BINARY, pack(seq, seq, 0)))
+            hub.send(b"frame %d" % seq)
+            await asyncio.sleep(0.01)
+            if handler.done():
+                break
+        await asyncio.wait_for(handler, 1)
+        return before_stall, pings
+
+    frames, pings = asyncio.run(asyncio.wait_for(run(), 10))
+    assert writer.overlaps == 0
+    acks = [f[1][0] for f in frames if f[0] == websocket.BINARY and len(f[1]) == 3]
+    assert acks == [seq & 0xFF for seq in range(1, 301)]
+    assert [f[1] for f in frames if f[0] == websocket.PONG] == [b"%d" % k for k in range(10, 301, 10)]
+    assert len(acks) + pings + hub.stats["sent"] == len(frames)
+    assert hub.stats["evicted"] == 1 and hub.stats["clients"] == 0
+    assert app["pad"].states == [] and app["pad"].buttons == 0
+
+
+def test_many_pads_some_never_read():
+    """The hub fans out to more pads than the HTTP server has slots; pads that never read are evicted"""
+    readers, stalled, messages = 10, 4, 200
+    app = load_script(os.path.join(ROOT, "game_pad_server", "gamepad_webserver.py"))
+    hub, http_server = app["hub"], app["http_server"]
+    hub.send_timeout_s = 0.5
+    payload = bytes(1000)
+
+    async def handle(reader, writer):  # small server-side buffers, as on the Pico
+        writer.transport.set_write_buffer_limits(high=4096)
+        writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        await http_server._handle(reader, writer)
+
+    async def read_all(conn):
+        reader, writer = conn
+        got = []
+        while len(got) < messages:
+            op, data = await ws_read_frame(reader)
+            if op == websocket.BINARY and len(data) > 3:  # not an ack
+                got.append(int.from_bytes(data[:4], "big"))
+        return got
+
+    async def run():
+        site = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = site.sockets[0].getsockname()[1]
+        good = [await ws_connect(port) for _ in range(readers)]
+        bad = [await ws_connect(port, rcvbuf=4096) for _ in range(stalled)]
+        pads = len(app["pad"].states)
+        page = await http_get(port, "/")  # every pad connected, the page still loads
+        tasks = [asyncio.create_task(read_all(conn)) for conn in good]
+        for k in range(messages):
+            hub.send(k.to_bytes(4, "big") + payload)
+            await asyncio.sleep(0.005)
+        got = await asyncio.wait_for(asyncio.gather(*tasks), 10)
+        while hub.stats["evicted"] < stalled:
+            await asyncio.sleep(0.05)
+        stats = dict(hub.stats)
+        for conn in bad + good:  # the phones go away, every handler ends
+            conn[1].close()
+        while app["pad"].states:
+            await asyncio.sleep(0.05)
+        site.close()
+        return pads, page[0], got, stats
+
+    pads, page_status, got, stats = asyncio.run(asyncio.wait_for(run(), 20))
+    assert pads == readers + stalled > http_server.max_conns and page_status == 200
+    assert got == [list(range(messages))] * readers  # everything, in order, nothing dropped
+    assert stats["evicted"] == stalled and stats["clients"] == readers
+    assert hub.stats["clients"] == 0 and http_server.active == 0  # open sockets never took HTTP slots
@@ -0,0 +1,366 @@
+import asyncio
+import gzip
+import json
+import time
+import tracemalloc
+
+from fakes import http_get, read_response
+from httpserver import EventChannel, HTTPServer, Request, StaticPage, parse_query
+
+PAGE = "<html><body>" + "<p>weather row</p>" * 200 + "</body></html>"
+
+
+def request(headers=None):
+    return Request("GET", "/", {}, "HTTP/1.1", headers or {}, None, None)
+
+
+async def serve(server):
+    site = await server.start("127.0.0.1", 0)
+    return site, site.sockets[0].getsockname()[1]
+
+
+# ---------- Connections ----------
+def echo_server(**kwargs):
+    server = HTTPServer(**kwargs)
+    server.add_route("/echo", lambda req: (200, "application/json", json.dumps(req.query)))
+    server.add_route("/body", lambda req: (200, "text/plain", req.body), methods=("POST",))
+    return server
+
+
+async def raw(port, data):
+    """Sends data as is, returns the (status, headers, body) of the answer"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(data)
+    try:
+        return await asyncio.wait_for(read_response(reader), 2)
+    finally:
+        writer.close()
+
+
+def test_keep_alive_load_past_max_conns():
+    """20 keep-alive clients x 100 pipelined requests on a default server (4 slots): none refused"""
+    clients, per_client = 20, 100
+
+    async def client(port, c):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"".join("GET /echo?c={}&i={} HTTP/1.1\r\nHost: pico\r\n\r\n".format(c, i).encode()
+                              for i in range(per_client)))
+        out = []
+        for _ in range(per_client):
+            status, _, body = await read_response(reader)
+            out.append((status, json.loads(body) if status == 200 else body))
+        writer.close()
+        return out
+
+    async def run():
+        server = echo_server()
+        site, port = await serve(server)
+        results = await asyncio.wait_for(asyncio.gather(*(client(port, c) for c in range(clients))), 30)
+        site.close()
+        return results, server.stats
+
+    results, stats = asyncio.run(run())
+    for c, out in enumerate(results):
+        assert [status for status, _ in out] == [200] * per_client  # no 503
+        assert out == [(200, {"c": str(c), "i": str(i)}) for i in range(per_client)]  # in order, not mixed up
+    assert stats["rejected"] == 0 and stats["queued"] > 0  # some had to wait for a slot
+    assert stats["requests"] == clients * per_client and stats["errors"] == 0
+
+
+def test_queued_connection_gives_up_after_queue_s():
+    async def run():
+        server = echo_server(max_conns=1, queue_s=0.2)
+        site, port = await serve(server)
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)  # holds the only slot
+        writer.write(b"GET /echo?a=1 HTTP/1.1\r\n\r\n")
+        await read_response(reader)
+        t0 = time.monotonic()
+        busy = await raw(port, b"GET /echo HTTP/1.1\r\n\r\n")
+        waited = time.monotonic() - t0
+        writer.close()
+        await asyncio.sleep(0.05)
+        free = await raw(port, b"GET /echo HTTP/1.1\r\n\r\n")  # the slot is back
+        site.close()
+        return busy, waited, free, server.stats
+
+    busy, waited, free, stats = asyncio.run(run())
+    assert busy[0] == 503 and waited >= 0.2
+    assert free[0] == 200 and stats["rejected"] == 1
+
+
+def test_request_limits_and_routing():
+    async def run():
+        server = echo_server()
+        site, port = await serve(server)
+        out = [await raw(port, data) for data in (
+            b"GET /echo HTTP/1.1\r\nX-Pad: " + b"x" * 1100 + b"\r\n\r\n",
+            b"POST /body HTTP/1.1\r\nContent-Length: 2000\r\n\r\n",
+            b"POST /body HTTP/1.1\r\nContent-Length: twelve\r\n\r\n",
+            b"POST /body HTTP/1.1\r\nContent-Length: -5\r\n\r\n",
+            b"POST /body HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello",
+            b"GET /nothing HTTP/1.1\r\n\r\n",
+            b"POST /echo HTTP/1.1\r\n\r\n",
+            b"GET /echo?q=caf%C3%A9&sp=a+b%21&flag&=x HTTP/1.1\r\n\r\n",
+            b"nonsense\r\n\r\n",
+        )]
+        site.close()
+        return [(status, body) for status, _, body in out], server.stats
+
+    out, stats = asyncio.run(run())
+    assert [status for status, _ in out] == [431, 413, 400, 400, 200, 404, 405, 200, 400]
+    assert out[4][1] == b"hello"
+    assert json.loads(out[7][1]) == {"q": "café", "sp": "a b!", "flag": "", "": "x"}
+    assert stats["errors"] == 0
+
+
+def test_parse_query():
+    assert parse_query("") == {}
+    assert parse_query("a=1&&b=x+y&c=%41%zz&d") == {"a": "1", "b": "x y", "c": "A%zz", "d": ""}
+    assert parse_query("k=1&k=2") == {"k": "2"}  # the last one wins
+    assert parse_query("t=%E2%84%83&p=100%&x=%4") == {"t": "\u2103", "p": "100%", "x": "%4"}
+
+
+# ---------- Static pages ----------
+def test_static_page_304_and_bytes_sent():
+    async def run():
+        server = HTTPServer()
+        page = server.add_static("/", PAGE)
+        site, port = await serve(server)
+        first = await http_get(port, "/")
+        sent = server.stats["bytes_sent"]
+        again = await http_get(port, "/", {"If-None-Match": page.etag})
+        site.close()
+        return first, sent, again, server.stats["bytes_sent"] - sent
+
+    first, full_bytes, again, revalidate_bytes = asyncio.run(run())
+    assert first[0] == 200 and first[2] == PAGE.encode() and first[1]["etag"]
+    assert again[0] == 304 and again[2] == b""
+    assert full_bytes > len(PAGE) and revalidate_bytes < 200  # a reload costs headers only
+
+
+def test_static_page_allocates_nothing_per_request():
+    page = StaticPage(PAGE)
+    req = request()
+    page(req)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(100):
+        status, _, body, _ = page(req)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(d.size_diff for d in after.compare_to(before, "filename"))
+    assert body is page.body  # the encoded page is reused, not rebuilt
+    assert grown < len(PAGE) // 4
+
+
+def test_gzip_copy_has_its_own_etag_and_vary(tmp_path):
+    gz_file = tmp_path / "page.html.gz"
+    gz_file.write_bytes(gzip.compress(PAGE.encode(), 9))
+    page = StaticPage(PAGE, gz_file=str(gz_file))
+    plain = page(request())
+    packed = page(request({"accept-encoding": "gzip, deflate"}))
+    assert packed[2] == gz_file.read_bytes() and packed[3]["Content-Encoding"] == "gzip"
+    assert plain[3]["ETag"] != packed[3]["ETag"]
+    assert plain[3]["Vary"] == packed[3]["Vary"] == "Accept-Encoding"
+    # each validator only matches its own encoding
+    assert page(request({"accept-encoding": "gzip", "if-none-match": page.gz_etag}))[0] == 304
+    assert page(request({"if-none-match": page.gz_etag}))[0] == 200
+    assert page(request({"accept-encoding": "gzip", "if-none-match": page.etag}))[0] == 200
+
+
+def test_stale_gzip_copy_is_ignored(tmp_path):
+    gz_file = tmp_path / "page.html.gz"
+    gz_file.write_bytes(gzip.compress(b"<html>last week's page</html>"))
+    page = StaticPage(PAGE, gz_file=str(gz_file))
+    status, _, body, headers = page(request({"accept-encoding": "gzip"}))
+    assert page.gz is None and body == PAGE.encode() and "Content-Encoding" not in headers
+
+
+# ---------- Bodies ----------
+async def exchange(port, paths, timeout=2):
+    """Sends the requests one after the other on one keep-alive connection"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    out = []
+    for path in paths:
+        writer.write("GET {} HTTP/1.1\r\nHost: pico\r\n\r\n".format(path).encode())
+        await writer.drain()
+        out.append(await asyncio.wait_for(read_response(reader), timeout))
+    writer.close()
+    return out
+
+
+def test_none_body_and_list_bodies():
+    parts = ["café ", b"au ", "lait"]
+
+    async def run():
+        server = HTTPServer()
+        server.add_route("/empty", lambda req: (204, None, None))
+        server.add_route("/none", lambda req: (200, "text/plain", None))
+        server.add_route("/parts", lambda req: (200, "text/plain", parts))
+        site, port = await serve(server)
+        out = await exchange(port, ("/empty", "/none", "/parts", "/parts"))
+        site.close()
+        return out, server.stats
+
+    (empty, none, first, again), stats = asyncio.run(run())
+    assert empty[0] == 204 and empty[2] == b"" and "content-length" not in empty[1]
+    assert none[0] == 200 and none[1]["content-length"] == "0"
+    assert first[2] == again[2] == "café au lait".encode()
+    assert parts == ["café ", b"au ", "lait"]  # not encoded in place
+    assert stats["errors"] == 0
+
+
+class NullWriter:
+    """Counts what would go out on the socket, keeps nothing"""
+    def __init__(self):
+        self.total = 0
+        self.largest = 0
+
+    def write(self, data):
+        self.total += len(data)
+        self.largest = max(self.largest, len(data))
+
+    async def drain(self):
+        pass
+
+
+def test_large_stream_is_chunked_in_flat_memory():
+    rows = 100000
+    body = ("{},{},{}\n".format(i, 2000 + i % 500, 100000 + i) for i in range(rows))
+    server = HTTPServer()
+    writer = NullWriter()
+    tracemalloc.start()
+    asyncio.run(server.send(writer, 200, "text/csv", body))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert writer.total == server.stats["bytes_sent"] > rows * 18
+    assert writer.largest < 2 * server.stream_chunk  # chunks, never the whole body
+    assert peak < 16 * 1024  # the same for 1 000 or 100 000 rows, not the 2 MB sent
+
+
+def test_stream_over_the_socket():
+    def csv(req):
+        return 200, "text/csv", ("{}\n".format(i) for i in range(5000))
+
+    async def run():
+        server = HTTPServer()
+        server.add_route("/rows", csv)
+        site, port = await serve(server)
+        out = await exchange(port, ("/rows", "/rows"))
+        site.close()
+        return out
+
+    first, again = asyncio.run(run())
+    assert first[1]["transfer-encoding"] == "chunked"
+    assert first[2] == again[2] == "".join("{}\n".format(i) for i in range(5000)).encode()
+
+
+# ---------- Server-Sent Events ----------
+async def subscribe(port, log, until):
+    """Reads (time, event, data) into log until the event `until` arrives"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /events HTTP/1.1\r\nAccept: text/event-stream\r\n\r\n")
+    await writer.drain()
+    head = await reader.readuntil(b"\r\n\r\n")
+    assert b"text/event-stream" in head
+    event = None
+    while True:
+        line = (await asyncio.wait_for(reader.readline(), 5)).decode().rstrip("\n")
+        if line.startswith("event: "):
+            event = line[7:]
+        elif line.startswith("data: "):
+            log.append((time.monotonic(), event, line[6:]))
+            if event == until:
+                break
+    writer.close()
+
+
+class StuckWriter:
+    """A client that stopped reading: every drain() hangs"""
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    async def drain(self):
+        await asyncio.sleep(3600)
+
+
+def test_events_reach_every_subscriber_past_a_stuck_one():
+    async def run():
+        server = HTTPServer(max_conns=8)
+        events = EventChannel(max_clients=6, send_timeout_s=0.3)
+        server.add_route("/events", events.handle)
+        events.publish("mode", "CLOCK")
+        site, port = await serve(server)
+        stuck = asyncio.create_task(events.handle(Request("GET", "/events", {}, "HTTP/1.1", {}, None, StuckWriter())))
+        logs = [[] for _ in range(4)]
+        clients = [asyncio.create_task(subscribe(port, log, "bye")) for log in logs]
+        await asyncio.sleep(0.1)
+        subscribed = events.stats["subscribers"]
+        sent_at = {}
+        for i in range(20):
+            t0 = time.monotonic()
+            events.publish("text", "line %d" % i)
+            sent_at[i] = t0
+            assert time.monotonic() - t0 < 0.005  # publish never waits for a socket
+            assert not events.publish("text", "line %d" % i)  # unchanged: nothing to send
+            await asyncio.sleep(0.02)
+        events.publish("mode", "SNAKE")
+        await asyncio.sleep(0.4)  # past send_timeout_s
+        events.publish("bye", 1)
+        await asyncio.gather(*clients)
+        await stuck
+        site.close()
+        return subscribed, logs, sent_at, events.stats
+
+    subscribed, logs, sent_at, stats = asyncio.run(run())
+    assert subscribed == 5
+    for log in logs:
+        assert log[0][1:] == ("mode", "CLOCK")  # current value first
+        texts = [(ts, data) for ts, event, data in log if event == "text"]
+        assert [d for _, d in texts] == ["line %d" % i for i in range(20)]
+        assert max(ts - sent_at[int(d.split()[1])] for ts, d in texts) < 0.1
+        assert ("mode", "SNAKE") in [e[1:] for e in log]
+    assert stats["dropped"] == 1 and stats["subscribers"] == 0
+
+
+def test_slow_subscriber_gets_the_latest_value_only():
+    async def run():
+        events = EventChannel()
+        log = []
+
+        class SlowWriter:
+            def write(self, data):
+                log.append(data)
+
+            async def drain(self):
+                await asyncio.sleep(0.05)
+
+        task = asyncio.create_task(events.handle(Request("GET", "/events", {}, "HTTP/1.1", {}, None, SlowWriter())))
+        await asyncio.sleep(0.01)
+        for i in range(50):
+            events.publish("count", str(i))
+            await asyncio.sleep(0.002)
+        await asyncio.sleep(0.2)
+        task.cancel()
+        return log, events.stats
+
+    log, stats = asyncio.run(run())
+    counts = [d for d in log if d.startswith(b"event: count")]
+    assert counts[-1] == b"event: count\ndata: 49\n\n"
+    assert len(counts) < 20 and stats["published"] == 50  # replaced values were skipped
+
+
+def test_too_many_subscribers():
+    async def run():
+        events = EventChannel(max_clients=1)
+        first = asyncio.create_task(events.handle(Request("GET", "/events", {}, "HTTP/1.1", {}, None, StuckWriter())))
+        await asyncio.sleep(0)
+        second = await events.handle(Request("GET", "/events", {}, "HTTP/1.1", {}, None, StuckWriter()))
+        first.cancel()
+        return second
+
+    status, _, _, headers = asyncio.run(run())
+    assert status == 503 and headers["Retry-After"] == "10"
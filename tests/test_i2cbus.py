@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+import i2cbus
+from fakes import FakeI2C
+
+
+class HardI2C(FakeI2C):
+    made = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.made.append(self)
+        self.n = 0
+
+    def writeto(self, addr, buf, stop=True):
+        n = self.n  # read-modify-write with a gap: loses counts if two threads interleave
+        time.sleep(0.0001)
+        self.n = n + 1
+        return super().writeto(addr, buf, stop)
+
+
+class SoftI2C(HardI2C):
+    made = []
+
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(i2cbus, "I2C", HardI2C)
+    monkeypatch.setattr(i2cbus, "SoftI2C", SoftI2C)
+    monkeypatch.setattr(i2cbus, "buses", {})
+    monkeypatch.setattr(i2cbus, "_hw_taken", {})
+    HardI2C.made = []
+    SoftI2C.made = []
+
+
+def test_pin_table_covers_every_gpio():
+    # RP2040: every GPIO has I2C as function 3, SDA on even pins, SCL on odd,
+    # the peripheral alternating every two pins
+    for gpio in range(30):
+        table = i2cbus._HW_SCL if gpio & 1 else i2cbus._HW_SDA
+        assert table.get(gpio) == (gpio >> 1) & 1, gpio
+    assert len(i2cbus._HW_SDA) == len(i2cbus._HW_SCL) == 15
+
+
+@pytest.mark.parametrize("sda, scl, hw", [(0, 1, 0), (2, 3, 1), (22, 23, 1), (26, 27, 1), (28, 29, 0)])
+def test_hardware_peripheral_is_used(sda, scl, hw):
+    bus = i2cbus.get_bus(sda, scl)
+    assert bus.name == "I2C{} sda={} scl={}".format(hw, sda, scl)
+    assert bus.i2c is HardI2C.made[0] and HardI2C.made[0].args == (hw,) and not SoftI2C.made
+    assert i2cbus.get_bus(sda, scl) is bus  # one bus object per pin pair
+
+
+def test_soft_i2c_fallback():
+    assert i2cbus.get_bus(7, 8).name.startswith("SoftI2C")  # SDA/SCL of different peripherals
+    assert i2cbus.get_bus(1, 0).name.startswith("SoftI2C")  # swapped
+    assert i2cbus.get_bus(0, 1).name.startswith("I2C0")
+    assert i2cbus.get_bus(4, 5).name.startswith("SoftI2C")  # I2C0 already drives 0/1
+    assert i2cbus.get_bus(22, 23).name.startswith("I2C1")
+    assert len(HardI2C.made) == 2 and len(SoftI2C.made) == 3
+
+
+def test_lock_serialises_threads():
+    bus = i2cbus.get_bus(0, 1)
+
+    def work():
+        for _ in range(200):
+            bus.writeto(0x3C, b"ab")
+            with bus:  # several transactions as one, re-entrant in the same thread
+                bus.readfrom_mem(0x76, 0xF7, 6)
+                bus.writeto(0x3C, b"c")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert bus.i2c.n == 1600  # no lost updates
+    assert bus.transactions == 2400 and bus.i2c.txns == 2400
+
+
+def test_stats_count_bytes_and_errors():
+    bus = i2cbus.get_bus(2, 3, freq=100000)
+    bus.writeto(0x3C, b"\x80\xaf")  # address + 2
+    bus.readfrom_mem(0x76, 0xF7, 6)  # address, register, address again + 6
+    bus.writevto(0x3C, (b"\x40", bytes(16)))
+
+    def fail(*args):
+        raise OSError(5)
+    bus.i2c.writeto_mem = fail
+    with pytest.raises(OSError):
+        bus.writeto_mem(0x76, 0xF4, b"\x01")
+    st = bus.stats()
+    assert st["transactions"] == 4 and st["bytes"] == 3 + 9 + 18 + 3 and st["errors"] == 1
+    assert st["clock_khz"] == 100 and st["kbit_s"] > 0
+    assert i2cbus.report() == {bus.name: st}
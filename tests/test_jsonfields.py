@@ -0,0 +1,67 @@
+import json
+import os
+import tracemalloc
+
+from jsonfields import JSONFields
+
+PAYLOAD = open(os.path.join(os.path.dirname(__file__), "owm_halifax.json"), "rb").read()
+PATHS = ("weather.0.description", "main.temp", "main.feels_like", "main.humidity",
+         "main.pressure", "wind.speed", "wind.deg", "visibility", "sys.sunrise",
+         "sys.sunset", "sys.country", "name")
+
+
+def expected(doc, paths):
+    out = {}
+    for path in paths:
+        v = doc
+        for part in path.split("."):
+            v = v[int(part)] if isinstance(v, list) else v[part]
+        out[path] = v
+    return out
+
+
+def test_recorded_payload_byte_by_byte():
+    fields = JSONFields(PATHS)
+    done = [fields.feed(PAYLOAD[i:i + 1]) for i in range(len(PAYLOAD))]
+    assert done.index(True) == PAYLOAD.rindex(b"}")  # finished exactly at the closing brace
+    assert fields.values == expected(json.loads(PAYLOAD), PATHS)
+
+
+def test_any_split_gives_the_same_values():
+    want = expected(json.loads(PAYLOAD), PATHS)
+    for size in (2, 3, 7, 64, 128, len(PAYLOAD)):
+        fields = JSONFields(PATHS)
+        for i in range(0, len(PAYLOAD), size):
+            fields.feed(memoryview(PAYLOAD)[i:i + size])
+        assert fields.values == want, size
+
+
+def test_strings_numbers_and_literals():
+    doc = b'{"a": "x\\"y\\\\z\\n", "b": -1.5e3, "c": [true, false, null, {"d": "\\u00e9t\\u00e9"}], "e": {}}'
+    fields = JSONFields(("a", "b", "c.0", "c.1", "c.2", "c.3.d", "e"))
+    assert fields.feed(doc)
+    assert fields.values == {"a": 'x"y\\z\n', "b": -1500.0, "c.0": True, "c.1": False, "c.2": None, "c.3.d": "?t?"}
+
+
+def test_long_values_are_cut_at_max_token():
+    fields = JSONFields(("name",), max_token=8)
+    fields.feed(b'{"name": "' + "é".encode() * 10 + b'"}')
+    assert fields.values["name"] == "é" * 4  # cut on a character boundary
+
+
+def test_memory_does_not_grow_with_the_document():
+    def peak(doc):
+        fields = JSONFields(PATHS)
+        tracemalloc.start()
+        for i in range(0, len(doc), 128):
+            fields.feed(doc[i:i + 128])
+        size = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert fields.values["name"] == "Halifax"
+        return size
+
+    padded = json.loads(PAYLOAD)
+    padded["list"] = [{"dt": i, "main": {"temp": i / 10}, "note": "x" * 50} for i in range(2000)]
+    big = json.dumps(padded).encode()
+    assert len(big) > 100 * len(PAYLOAD)
+    assert peak(big) < 2 * peak(PAYLOAD) + 1024
@@ -0,0 +1,82 @@
+import os
+import re
+
+from fakes import FakeRoboticsBoard, load_script
+from motors import MotorController, mix
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# setpoints as a joystick drag produced them, by tick (100 Hz)
+TRACE = {0: (0, 0), 5: (30, 0), 10: (60, 5), 20: (100, 0), 60: (100, -40), 90: (-50, 0),
+         150: (0, 0), 200: (80, 80), 240: (80, 80), 260: (0, 0)}
+
+
+def test_mix_scales_and_keeps_the_turning_radius():
+    assert mix(50, 0, 40) == (20, 20) and mix(-50, 0, 40) == (-20, -20)
+    assert mix(25, -25, 40) == (20, 0) and mix(25, 25, 40) == (0, 20)
+    assert mix(100, 100) == (0, 100) and mix(100, 50) == (33, 100)
+
+
+def test_presets_drive_the_old_motor_patterns():
+    """The page's buttons, through mix() at MAX_SPEED, end where the old fixed commands did"""
+    app = load_script(os.path.join(ROOT, "Robot", "Robot.py"))
+    presets = dict((name, (int(t), int(s))) for t, s, name in
+                   re.findall(r'onclick="send\((-?\d+), (-?\d+)\)">(\w+)<', app["WEB_PAGE"]))
+    old = {"up": {1: 20, 2: 20}, "back": {1: -20, 2: -20}, "left": {1: 20, 2: 0},
+           "right": {1: 0, 2: 20}, "stop": {1: 0, 2: 0}}
+    assert presets.keys() == old.keys()
+    for name, (throttle, steer) in presets.items():
+        board = FakeRoboticsBoard()
+        motors = MotorController(board, rate_hz=100, accel=app["ACCEL"], max_speed=app["MAX_SPEED"])
+        motors.set_target(throttle, steer)
+        for _ in range(50):
+            motors.tick()
+        assert board.pwm == old[name], name
+
+
+def test_recorded_trace_ramps_and_calls_the_board_on_change_only():
+    board = FakeRoboticsBoard()
+    motors = MotorController(board, rate_hz=100, accel=300, max_speed=100)
+    prev = [0, 0]
+    last_pwm = dict(board.pwm)
+    pwm_changes = 0
+    for k in range(320):
+        if k in TRACE:
+            motors.set_target(*TRACE[k])
+        motors.tick()
+        for i in (0, 1):
+            assert abs(motors.speed[i] - prev[i]) <= motors.step  # at most 3 % per tick
+            prev[i] = motors.speed[i]
+        assert board.pwm == {1: motors.sent[0], 2: motors.sent[1]}
+        pwm_changes += sum(board.pwm[m] != last_pwm[m] for m in (1, 2))
+        last_pwm = dict(board.pwm)
+    assert motors.speed == [0, 0] and board.pwm == {1: 0, 2: 0}
+    assert len(board.calls) == motors.bus_calls == pwm_changes == 271  # of 640 wheel updates
+    # holding the stick or repeating a setpoint costs nothing
+    for _ in range(100):
+        motors.set_target(0, 0)
+        motors.tick()
+    assert len(board.calls) == 271
+
+
+def test_full_stick_from_rest_takes_a_third_of_a_second():
+    board = FakeRoboticsBoard()
+    motors = MotorController(board, rate_hz=100, accel=300)
+    motors.set_target(100, 0)
+    ticks = 0
+    while board.pwm != {1: 100, 2: 100}:
+        motors.tick()
+        ticks += 1
+    assert ticks == 34  # 100 % at 3 % per tick
+    assert len(board.calls) == 2 * 34  # one call per wheel per PWM change
+
+
+def test_stop_skips_the_ramp():
+    board = FakeRoboticsBoard()
+    motors = MotorController(board, rate_hz=100, accel=300)
+    motors.set_target(100, 0)
+    for _ in range(40):
+        motors.tick()
+    n = len(board.calls)
+    motors.stop()
+    assert board.calls[n:] == [(1, "off", 0), (2, "off", 0)] and motors.speed == [0, 0]
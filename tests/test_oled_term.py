@@ -0,0 +1,78 @@
+from fakes import FakeI2C, FakeSSD1306
+from oled_term import OledTerminal
+
+FULL_FRAME = 6 * 2 + 1 + 1024  # window commands + data prefix + framebuffer
+
+
+def make():
+    i2c = FakeI2C()
+    oled = FakeSSD1306(128, 64, i2c)
+    return i2c, oled, OledTerminal(oled)
+
+
+def expected_screen(lines):
+    ref = FakeSSD1306()
+    for row, line in enumerate(lines):
+        ref.text(line, 0, row * 8)
+    return bytes(ref.buffer)
+
+
+def test_screen_matches_the_text_while_scrolling():
+    i2c, oled, term = make()
+    term.clear()
+    shown = []
+    for n in range(30):
+        line = "line %d" % n
+        term.print(line)
+        shown = (shown + [line])[-8:]
+        assert oled.ram == oled.buffer  # everything drawn reached the panel
+        assert oled.screen() == expected_screen(shown)
+
+
+def test_bytes_sent_matches_the_bus():
+    i2c, oled, term = make()
+    term.clear()
+    for n in range(20):
+        term.print("DIR entry %d" % n)
+    term.append(".")
+    assert term.bytes_sent == i2c.bytes
+
+
+def test_printing_costs_one_page_instead_of_the_frame():
+    i2c, oled, term = make()
+    term.clear()
+    for n in range(8):
+        term.print("fill %d" % n)
+    before = i2c.bytes
+    for n in range(100):  # every line scrolls
+        term.print("scroll %d" % n)
+    per_line = (i2c.bytes - before) / 100
+    assert per_line <= 2 + 12 + 1 + 128  # start line + window + one page
+    assert FULL_FRAME / per_line > 7
+
+
+def test_append_sends_one_page():
+    i2c, oled, term = make()
+    term.clear()
+    term.print("LOADING ")
+    pages = term.pages_sent
+    for _ in range(5):
+        term.append(".")
+    assert term.pages_sent - pages == 5
+    assert oled.screen() == expected_screen(["LOADING ....."])
+
+
+def test_long_lines_wrap():
+    i2c, oled, term = make()
+    term.clear()
+    term.print("x" * 50)
+    assert term.lines == ["x" * 21, "x" * 21, "x" * 8]
+
+
+def test_narrow_panel_gets_the_column_offset():
+    oled = FakeSSD1306(64, 48)
+    term = OledTerminal(oled, wrap=8)
+    term.clear()
+    for n in range(8):
+        term.print("line %d" % n)
+    assert oled.ram == oled.buffer and oled.ram != bytes(len(oled.ram))
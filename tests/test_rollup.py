@@ -0,0 +1,102 @@
+import asyncio
+import os
+import random
+import time
+
+from fakes import http_get, load_script
+from rollup import RollupStore, RollupTier
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+T0 = 1700000000
+
+
+def expected(raw, start, end, step):
+    """Buckets computed from the raw samples"""
+    out = {}
+    for ts, v in raw:
+        if start // step <= ts // step <= end // step:
+            out.setdefault(ts // step * step, []).append(v)
+    return [(b, min(vs), max(vs), sum(vs) // len(vs), len(vs)) for b, vs in sorted(out.items())]
+
+
+# ---------- Buckets ----------
+def test_bucket_rollover_and_gaps():
+    tier = RollupTier(10, 4)
+    for ts, v in ((T0, 5), (T0 + 3, -2), (T0 + 9, 7), (T0 + 10, 1)):
+        tier.add(ts, v)
+    assert list(tier.buckets(T0, T0 + 19)) == [(T0, -2, 7, 3, 3), (T0 + 10, 1, 1, 1, 1)]
+    tier.add(T0 + 35, 4)  # skips two buckets: they come back empty, not with stale values
+    assert list(tier.buckets(T0, T0 + 40)) == [(T0, -2, 7, 3, 3), (T0 + 10, 1, 1, 1, 1), (T0 + 30, 4, 4, 4, 1)]
+    tier.add(T0 + 45, 8)  # the ring wraps onto T0's slot
+    assert not tier.covers(T0) and tier.covers(T0 + 10)
+    assert [b[0] for b in tier.buckets(T0, T0 + 50)] == [T0 + 10, T0 + 30, T0 + 40]
+    tier.add(T0 + 2, 99)  # older than the ring: dropped
+    assert [b[1:] for b in tier.buckets(T0, T0 + 50)][-1] == (8, 8, 8, 1)
+    tier.add(T0 + 500, 3)  # a gap longer than the ring empties every slot
+    assert list(tier.buckets(T0, T0 + 600)) == [(T0 + 500, 3, 3, 3, 1)]
+
+
+def test_full_bucket_keeps_a_true_mean():
+    hour = T0 // 3600 * 3600
+    tier = RollupTier(3600, 2)
+    for k in range(100000):  # 27 samples a second for an hour
+        tier.add(hour + k * 36 // 1000, 30000 if k < 50000 else 20000)
+    tier.add(hour + 3599, -5)
+    (ts, lo, hi, mean, n), = tier.buckets(hour, hour + 3599)
+    assert n == 32767 and mean == 30000  # the first 32767 samples, the sum didn't overflow or drift
+    assert lo == -5 and hi == 30000
+
+
+def test_tiers_cascade():
+    random.seed(1)
+    store = RollupStore()
+    raw = []
+    for s in range(0, 2 * 86400, 7):
+        if 50000 < s < 52000:
+            continue  # sensor offline for half an hour
+        v = 2000 + random.randint(-300, 300)
+        raw.append((T0 + s, v))
+        store.add(T0 + s, v)
+    end = raw[-1][0]
+    for start, max_points, step in ((end - 300, None, 1), (end - 300, 100, 60), (end - 3600, None, 60),
+                                    (end - 86000, None, 60), (end - 86000, 200, 900), (T0, None, 900)):
+        got_step, rows = store.query(start, end, max_points)
+        assert got_step == step, (start, max_points)
+        assert list(rows) == expected(raw, start, end, step)
+    # every tier saw every sample: the coarse buckets are the fine ones merged
+    fine = list(store.tier(60).buckets(end - 3599, end))
+    coarse = list(store.tier(900).buckets(end - 3599, end))
+    for ts, lo, hi, _, n in coarse[1:]:
+        inside = [b for b in fine if ts <= b[0] < ts + 900]
+        assert lo == min(b[1] for b in inside) and hi == max(b[2] for b in inside)
+        assert n == sum(b[4] for b in inside)
+    assert store.tier(5) is None
+
+
+# ---------- /history?res= ----------
+def test_history_route_serves_rollups(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # sensor_log/ is created here
+    app = load_script(os.path.join(ROOT, "temperature", "temp_server.py"))
+    history = app["history"]
+    now = int(time.time())
+    for s in range(7200):
+        history.add(now - 7199 + s, 2000 + s % 100)
+
+    async def run():
+        site = await app["server"].start("127.0.0.1", 0)
+        port = site.sockets[0].getsockname()[1]
+        out = [await http_get(port, path) for path in
+               ("/history?res=60&start=%d" % (now - 600), "/history?res=auto&points=30",
+                "/history?res=7", "/history?res=x")]
+        site.close()
+        return out
+
+    minute, auto, bad_step, bad = asyncio.run(run())
+    assert minute[0] == 200 and minute[1]["x-step"] == "60"
+    lines = minute[2].decode().splitlines()
+    assert lines[0] == "timestamp,min_centi,max_centi,mean_centi,count"
+    rows = [tuple(map(int, line.split(","))) for line in lines[1:]]
+    assert rows == list(history.tier(60).buckets(now - 600, now))
+    assert auto[1]["x-step"] == "900" and len(auto[2].decode().splitlines()) <= 31
+    assert bad_step[0] == 400 and b"1, 60, 900" in bad_step[2]
+    assert bad[0] == 400
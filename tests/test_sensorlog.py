@@ -0,0 +1,159 @@
+import asyncio
+import builtins
+import os
+import struct
+
+import sensorlog
+from fakes import http_get, load_script
+from sensorlog import SensorLog
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+T0 = 1700000000
+HALF_HOUR = 1800
+YEAR = 365 * 48
+N = YEAR * 3 // 2  # enough to rotate
+
+
+def sample(i):
+    return T0 + i * HALF_HOUR, 2000 + i % 700, 100000 + i % 3000
+
+
+class CountingFile:
+    def __init__(self, f, counts):
+        self.f = f
+        self.counts = counts
+
+    def write(self, data):
+        self.counts["written"] += len(data)
+        return self.f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+
+def test_eighteen_months_of_samples(tmp_path, monkeypatch):
+    counts = {"written": 0}
+    monkeypatch.setattr(sensorlog, "open", lambda *a: CountingFile(builtins.open(*a), counts), raising=False)
+    path = str(tmp_path / "log")
+    log = SensorLog(path)
+    for i in range(N):
+        assert log.append(*sample(i))
+
+    assert counts["written"] == N * 10  # every byte written once, nothing rewritten
+    files = os.listdir(path)
+    assert len(files) == log.segments
+    assert sum(os.path.getsize(os.path.join(path, f)) for f in files) == len(log) * 10
+    assert 19 * 1024 <= len(log) <= 20 * 1024 and len(log) >= YEAR  # a bit over a year kept
+
+    oldest = N - len(log)
+    recs = list(log.records())
+    assert recs[0] == sample(oldest) and recs[-1] == sample(N - 1)
+    assert [r[0] for r in recs] == sorted(r[0] for r in recs)
+
+    # a day in the middle, bounds inclusive, across a segment boundary
+    first = oldest + 3 * 1024 - 10
+    start, end = sample(first)[0], sample(first + 47)[0]
+    day = list(log.records(start, end))
+    assert day == [sample(i) for i in range(first, first + 48)]
+    packed = b"".join(log.chunks(start, end, n=7))
+    assert packed == b"".join(struct.pack("<Ihi", *r) for r in day)
+    assert log.find(start - 1) == log.find(start) == first - oldest
+    assert log.find(sample(N - 1)[0] + 1) == len(log)
+    assert list(log.records(sample(N + 100)[0])) == []
+
+
+def test_reopen_continues_where_it_stopped(tmp_path):
+    path = str(tmp_path / "log")
+    log = SensorLog(path, segments=4, per_segment=10)
+    for i in range(25):
+        log.append(*sample(i))
+    log.close()
+    log = SensorLog(path, segments=4, per_segment=10)
+    assert len(log) == 25 and log.last_ts == sample(24)[0]
+    log.append(*sample(25))
+    assert list(log.records())[-2:] == [sample(24), sample(25)]
+    assert len(os.listdir(path)) == 3
+
+
+def test_clock_going_back_is_rejected(tmp_path):
+    log = SensorLog(str(tmp_path / "log"))
+    for i in range(10):
+        log.append(*sample(i))
+    # reboot without RTC sync: the Pico's clock restarts at 2021-01-01
+    assert not log.append(1609459200, 2100, 100100)
+    assert log.rejected == 1 and len(log) == 10
+    assert log.append(*sample(10))  # a synced clock is accepted again
+    assert [r[0] for r in log.records()] == [sample(i)[0] for i in range(11)]
+    assert log.append(sample(10)[0], 2000, 100000)  # equal timestamps are fine
+
+
+def test_torn_append_starts_a_new_segment(tmp_path):
+    path = str(tmp_path / "log")
+    log = SensorLog(path, per_segment=100)
+    for i in range(5):
+        log.append(*sample(i))
+    log.close()
+    with open(os.path.join(path, "00000000.bin"), "ab") as f:
+        f.write(b"\x01\x02\x03")  # power cut in the middle of a record
+    log = SensorLog(path, per_segment=100)
+    assert len(log) == 5
+    log.append(*sample(5))
+    assert list(log.records()) == [sample(i) for i in range(6)]
+    assert sorted(os.listdir(path)) == ["00000000.bin", "00000001.bin"]
+
+
+# ---------- /history and /metrics ----------
+def csv_rows(body):
+    lines = body.decode().splitlines()
+    assert lines[0] == "timestamp,temp_centi,pressure_pa"
+    return [tuple(map(int, line.split(","))) for line in lines[1:]]
+
+
+def test_history_and_metrics_routes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # sensor_log/ is created here
+    app = load_script(os.path.join(ROOT, "temperature", "temp_server.py"))
+    log = app["log"]
+    n = 2500  # three segments
+    for i in range(n):
+        log.append(*sample(i))
+    log.append(T0, 0, 0)  # clock went back: rejected
+    start, end = sample(1000)[0], sample(1100)[0]
+    paths = ("/history", "/history?start=%d&end=%d" % (start, end), "/history?since=%d" % sample(n - 4)[0],
+             "/history?format=bin&start=%d&end=%d" % (start, end), "/history?since=%d" % sample(n - 1)[0],
+             "/history?since=yesterday", "/metrics")
+
+    async def run():
+        site = await app["server"].start("127.0.0.1", 0)
+        port = site.sockets[0].getsockname()[1]
+        out = [await http_get(port, path) for path in paths]
+        site.close()
+        return out
+
+    full, window, since, binary, nothing_new, bad, metrics = asyncio.run(run())
+    assert full[0] == 200 and full[1]["content-type"] == "text/csv"
+    assert csv_rows(full[2]) == [sample(i) for i in range(n)]
+    assert csv_rows(window[2]) == [sample(i) for i in range(1000, 1101)]  # bounds inclusive
+    assert csv_rows(since[2]) == [sample(i) for i in range(n - 3, n)]  # only what's newer
+    assert csv_rows(nothing_new[2]) == []
+    assert binary[0] == 200 and binary[1]["x-record-format"] == "<Ihi"
+    assert binary[2] == b"".join(struct.pack("<Ihi", *sample(i)) for i in range(1000, 1101))
+    assert bad[0] == 400
+
+    assert metrics[0] == 200 and metrics[1]["content-type"].startswith("text/plain; version=0.0.4")
+    values = {}
+    for line in metrics[2].decode().splitlines():
+        if not line.startswith("#"):
+            name, value = line.split()
+            values[name] = float(value)
+    sampler = app["sampler"]
+    assert values["sensor_log_records"] == n and values["sensor_log_rejected_total"] == 1
+    assert values["bmp280_temperature_celsius"] == round(sampler.temperature, 2)
+    assert values["bmp280_samples_total"] == sampler.stats()["samples"]
+    assert values["http_requests_total"] == 7  # this one included
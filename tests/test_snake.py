@@ -0,0 +1,201 @@
+import random
+import time
+
+import snake
+from fakes import FakeSSD1306
+from snake import ATE, DIED, MOVED, Snake, SnakeView
+
+W, H = 32, 16
+
+
+def hamiltonian_next(w=W, h=H):
+    """Direction index to take from each cell to follow a cycle through the whole board"""
+    cycle = [(x, 0) for x in range(w)]
+    for y in range(1, h):
+        cycle += [(x, y) for x in (range(w - 1, 0, -1) if y % 2 else range(1, w))]
+    cycle += [(0, y) for y in range(h - 1, 0, -1)]
+    assert len(set(cycle)) == w * h
+    nxt = {}
+    for i, (x, y) in enumerate(cycle):
+        nx, ny = cycle[(i + 1) % len(cycle)]
+        nxt[y * w + x] = {(0, -1): 0, (1, 0): 1, (0, 1): 2, (-1, 0): 3}[(nx - x, ny - y)]
+    return nxt
+
+
+def on_cycle(game):
+    """Puts a 3 cell snake at the start of the cycle, heading right"""
+    for i in range(len(game.occ)):
+        game.occ[i] = 0
+    game.tail = game.length = 0
+    for x in range(3):
+        game._push(x)
+    game.dir = game.next_dir = 1
+    game.place_food()
+
+
+def grow(game, nxt, length):
+    """Follows the cycle, feeding the cell ahead until the snake is that long"""
+    while game.length < length:
+        game.next_dir = d = nxt[game.head]
+        ahead = ((game.head // W + snake._DY[d]) % H) * W + (game.head % W + snake._DX[d]) % W
+        game.food = ahead
+        result = game.step()
+        assert result == ATE
+
+
+def check_body(game):
+    cells = [game.cell(k) for k in range(game.length)]
+    assert len(set(cells)) == game.length
+    assert sum(bin(b).count("1") for b in game.occ) == game.length
+    assert all(game.occupied(c) for c in cells)
+    assert game.food < 0 or not game.occupied(game.food)
+
+
+# ---------- Snake ----------
+def test_random_play_keeps_body_and_bitmap_in_step():
+    random.seed(7)
+    game = Snake(W, H)
+    results = set()
+    for _ in range(20000):
+        game.steer(random.choice(snake.DIRECTIONS))
+        results.add(game.step())
+        check_body(game)
+    assert results == {MOVED, ATE, DIED}
+
+
+def test_ring_wraps_around_the_array_end():
+    game = Snake(W, H)
+    nxt = hamiltonian_next()
+    on_cycle(game)
+    grow(game, nxt, 300)
+    game.food = -1
+    wrapped = 0
+    for _ in range(2 * W * H):
+        game.next_dir = nxt[game.head]
+        tail = game.tail
+        assert game.step() == MOVED
+        wrapped += game.tail < tail
+        check_body(game)
+    assert wrapped == 2 and game.length == 300
+
+
+def test_running_into_itself_restarts():
+    game = Snake(W, H)  # three cells on row 2, heading right
+    for _ in range(2):
+        game.food = game.head + 1
+        assert game.step() == ATE
+    game.food = -1
+    assert not game.steer("LEFT")  # reversing is ignored
+    results = []
+    for name in ("DOWN", "LEFT", "UP"):  # curls back into its own body
+        assert game.steer(name)
+        results.append(game.step())
+    assert results == [MOVED, MOVED, DIED]
+    assert game.length == 3 and game.score == 0 and game.head == 2 * W + 2
+
+
+def test_moving_into_the_cell_the_tail_leaves_is_allowed():
+    game = Snake(W, H)
+    for i in range(len(game.occ)):
+        game.occ[i] = 0
+    game.tail = game.length = 0
+    for c in (0, 1, W + 1, W):  # a 2 x 2 square, the head next to the tail
+        game._push(c)
+    game.dir = game.next_dir = 3
+    game.food = -1
+    assert game.steer("UP") and game.step() == MOVED
+    assert game.head == 0
+    check_body(game)
+
+
+def test_food_only_on_free_cells():
+    random.seed(3)
+    game = Snake(W, H)
+    nxt = hamiltonian_next()
+    on_cycle(game)
+    grow(game, nxt, W * H - 1)
+    free = [c for c in range(W * H) if not game.occupied(c)]
+    assert len(free) == 1
+    for _ in range(50):  # the random tries all miss, the bitmap walk finds it
+        game.place_food()
+        assert game.food == free[0]
+    for length in (W * H // 2, W * H - 20):
+        on_cycle(game)
+        grow(game, nxt, length)
+        for _ in range(200):
+            game.place_food()
+            assert not game.occupied(game.food)
+
+
+def median_step_us(game, nxt, n=400):
+    times = []
+    for _ in range(n):
+        game.next_dir = nxt[game.head]
+        t = time.perf_counter()
+        assert game.step() == MOVED
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return times[n // 2] * 1e6
+
+
+def test_tick_cost_does_not_grow_with_length():
+    game = Snake(W, H)
+    nxt = hamiltonian_next()
+    on_cycle(game)
+    game.food = -1
+    short = min(median_step_us(game, nxt) for _ in range(3))
+    grow(game, nxt, 500)
+    game.food = -1
+    long = min(median_step_us(game, nxt) for _ in range(3))
+    assert long < 2 * short + 5  # O(1): a 500 cell snake moves as fast as a 3 cell one
+
+
+# ---------- SnakeView ----------
+def test_panel_matches_the_framebuffer_after_every_frame():
+    random.seed(5)
+    oled = FakeSSD1306(128, 64)
+    game = Snake(W, H)
+    view = SnakeView(oled, game, 4)
+    view.draw()
+    view.flush()
+    for i in range(3000):
+        game.steer(random.choice(snake.DIRECTIONS))
+        view.update(game.step())
+        if i % 700 == 0:  # another mode was on screen
+            oled.fill(0)
+            oled.text("Mode:", 0, 10)
+            view.invalidate()
+        view.draw()
+        view.flush()
+        assert oled.ram == oled.buffer
+    assert view.bytes_sent == oled.i2c.bytes
+
+
+def test_bytes_per_frame_do_not_depend_on_length():
+    oled = FakeSSD1306(128, 64)
+    game = Snake(W, H)
+    view = SnakeView(oled, game, 4)
+    nxt = hamiltonian_next()
+    on_cycle(game)
+    view.invalidate()
+    view.draw()
+    view.flush()
+    full_frame = oled.i2c.bytes
+    per_length = {}
+    random.seed(2)
+    while game.length < 500:
+        game.next_dir = d = nxt[game.head]
+        ahead = ((game.head // W + snake._DY[d]) % H) * W + (game.head % W + snake._DX[d]) % W
+        if random.random() < 0.3:
+            game.food = ahead
+        before = oled.i2c.bytes
+        result = game.step()
+        view.update(result)
+        view.draw()
+        view.flush()
+        assert oled.ram == oled.buffer
+        per_length.setdefault((result, game.length // 100), set()).add(oled.i2c.bytes - before)
+    for (result, hundreds), sizes in sorted(per_length.items()):
+        # tail and head columns (and the score box when they pass under it), whatever the length
+        assert max(sizes) <= (106 if result == MOVED else 119) < full_frame // 8
+    assert {k[1] for k in per_length} == {0, 1, 2, 3, 4, 5}
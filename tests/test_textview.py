@@ -0,0 +1,74 @@
+from fakes import FakeSSD1306
+from textview import TextView
+
+
+def clock_screen(t):
+    return ((0, 0, "Clock"), (0, 25, "%02d:%02d:%02d" % (t // 3600, t // 60 % 60, t % 60)), (0, 50, "Temp 21.5C"))
+
+
+def test_unchanged_model_sends_nothing():
+    oled = FakeSSD1306()
+    view = TextView(oled)
+    assert view.draw(clock_screen(0))
+    view.flush()
+    sent = oled.i2c.bytes
+    assert not view.draw(clock_screen(0))
+    view.flush()
+    assert oled.i2c.bytes == sent and oled.ram == oled.buffer
+
+
+def test_changed_line_sends_only_its_columns():
+    oled = FakeSSD1306()
+    view = TextView(oled)
+    view.draw(clock_screen(0))
+    view.flush()
+    full = oled.i2c.bytes
+    for t in range(1, 200):
+        before = oled.i2c.bytes
+        assert view.draw(clock_screen(t))
+        view.flush()
+        assert oled.ram == oled.buffer
+        # "HH:MM:SS" at y=25 covers pages 3 and 4: 2 x 64 columns + window commands
+        assert oled.i2c.bytes - before <= 2 * (12 + 1 + 64) < full // 4
+    assert view.bytes_sent == oled.i2c.bytes
+
+
+def test_shorter_text_clears_the_old_tail():
+    oled = FakeSSD1306()
+    view = TextView(oled)
+    view.draw(((0, 8, "Temperature"),))
+    view.flush()
+    view.draw(((0, 8, "Hot"),))
+    view.flush()
+    ref = FakeSSD1306()
+    ref.text("Hot", 0, 8)
+    assert oled.ram == ref.buffer
+
+
+def test_new_layout_and_invalidate_redraw_everything():
+    oled = FakeSSD1306()
+    view = TextView(oled)
+    view.draw(clock_screen(0))
+    view.flush()
+    sent = oled.i2c.bytes
+    view.draw(((0, 0, "Mode:"), (0, 10, "Snake")))  # another mode: another layout
+    view.flush()
+    assert oled.i2c.bytes - sent > len(oled.buffer)
+    oled.fill(1)  # something else drew over the framebuffer
+    view.invalidate()
+    assert view.draw(((0, 0, "Mode:"), (0, 10, "Snake")))
+    view.flush()
+    ref = FakeSSD1306()
+    ref.text("Mode:", 0, 0)
+    ref.text("Snake", 0, 10)
+    assert oled.ram == ref.buffer
+
+
+def test_narrow_panel_gets_the_column_offset():
+    oled = FakeSSD1306(64, 48)  # shows columns 32..95 of the controller's RAM
+    view = TextView(oled)
+    view.draw(((0, 0, "Temp"), (0, 20, "21.5C")))
+    view.flush()
+    view.draw(((0, 0, "Temp"), (0, 20, "22.0C")))
+    view.flush()
+    assert oled.ram == oled.buffer
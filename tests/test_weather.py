@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import time
+
+import weather
+from fakes import http_get, stub_server
+
+PAYLOAD = open(os.path.join(os.path.dirname(__file__), "owm_halifax.json"), "rb").read()
+
+
+async def fake_api(delay=0.0, status=200):
+    """OpenWeatherMap stand-in, returns (server, port, requests seen)"""
+    seen = []
+
+    async def handle(reader, writer):
+        seen.append(await reader.readuntil(b"\r\n\r\n"))
+        await asyncio.sleep(delay)
+        body = PAYLOAD if status == 200 else b'{"cod":401}'
+        writer.write(b"HTTP/1.0 %d X\r\nContent-Type: application/json\r\n\r\n" % status + body)
+        await writer.drain()
+        writer.close()
+
+    server, port = await stub_server(handle)
+    return server, port, seen
+
+
+def test_get_weather_reads_the_fields():
+    async def run():
+        api, port, seen = await fake_api()
+        result = await weather.get_weather("Halifax,gb", "KEY", "127.0.0.1", port)
+        api.close()
+        return result, seen
+
+    result, seen = asyncio.run(run())
+    assert result == ("Light rain", 11.32, 10.71, 85, 1009, 5.14, 240, "8.0",
+                      "06:27:22", "16:56:58", "GB", "Halifax")
+    assert b"q=Halifax,gb&appid=KEY&units=metric" in seen[0]
+
+
+def test_slow_api_does_not_block_other_requests():
+    async def run():
+        api, api_port = (await fake_api(delay=0.5))[:2]
+        cache = weather.WeatherCache(lambda: weather.get_weather("Halifax,gb", "KEY", "127.0.0.1", api_port))
+        site = await weather.make_server(cache).start("127.0.0.1", 0)
+        port = site.sockets[0].getsockname()[1]
+        t0 = time.monotonic()
+        miss = asyncio.create_task(http_get(port, "/weather.json"))  # cold cache: waits for the API
+        await asyncio.sleep(0.05)
+        page = await http_get(port, "/")
+        page_ms = (time.monotonic() - t0) * 1000
+        status, _, body = await miss
+        api.close()
+        site.close()
+        return page[0], page_ms, status, json.loads(body)
+
+    page_status, page_ms, status, data = asyncio.run(run())
+    assert page_status == 200 and page_ms < 300  # answered while the API call was in flight
+    assert status == 200 and data["city"] == "Halifax"
+
+
+# ---------- Cache ----------
+def cache_for(port, **kwargs):
+    return weather.WeatherCache(lambda: weather.get_weather("Halifax,gb", "KEY", "127.0.0.1", port), **kwargs)
+
+
+def test_fresh_results_come_from_memory():
+    async def run():
+        api, port, seen = await fake_api(delay=0.2)
+        cache = cache_for(port, ttl_ms=60000)
+        first = await cache.get()
+        t0 = time.monotonic()
+        for _ in range(20):
+            assert await cache.get() == first
+        hit_ms = (time.monotonic() - t0) * 1000
+        api.close()
+        return len(seen), hit_ms, cache
+
+    calls, hit_ms, cache = asyncio.run(run())
+    assert calls == 1 and cache.misses == 1 and cache.hits == 20
+    assert hit_ms < 20  # local render time, not the 200 ms API round trip
+
+
+def test_stale_value_is_served_and_refreshed_once():
+    async def run():
+        api, port, seen = await fake_api(delay=0.1)
+        cache = cache_for(port, ttl_ms=50, stale_while_revalidate=True)
+        first = await cache.get()
+        await asyncio.sleep(0.1)  # expired
+        t0 = time.monotonic()
+        stale = [await cache.get() for _ in range(5)]
+        stale_ms = (time.monotonic() - t0) * 1000
+        assert cache.pending and len(seen) == 1  # nothing fetched on the request path
+        await asyncio.gather(cache.revalidate(), cache.revalidate())
+        api.close()
+        return first, stale, stale_ms, len(seen), cache
+
+    first, stale, stale_ms, calls, cache = asyncio.run(run())
+    assert all(v == first for v in stale) and stale_ms < 20
+    assert calls == 2  # one refresh for all the stale hits
+    assert not cache.pending
+
+
+def test_failures_are_negative_cached():
+    async def run():
+        api, port, seen = await fake_api(status=401)
+        cache = cache_for(port, error_ttl_ms=200)
+        results = [await cache.get() for _ in range(10)]
+        calls_during_outage = len(seen)
+        await asyncio.sleep(0.25)
+        await cache.get()
+        api.close()
+        return results, calls_during_outage, len(seen)
+
+    results, during, after = asyncio.run(run())
+    assert all(r == weather.WeatherCache.EMPTY for r in results)
+    assert during == 1  # an outage costs one API call per error_ttl_ms, not one per request
+    assert after == 2
+
+
+def test_unreachable_api_gives_up_without_blocking():
+    async def run():
+        api, port, seen = await fake_api()
+        api.close()
+        await api.wait_closed()  # nothing listens on port any more
+        cache = cache_for(port)
+        t0 = time.monotonic()
+        result = await cache.get()
+        return result, (time.monotonic() - t0) * 1000, cache.failed_at
+
+    result, ms, failed_at = asyncio.run(run())
+    assert result == weather.WeatherCache.EMPTY and failed_at is not None and ms < 1000
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def run():
+        api, port, seen = await fake_api(delay=0.1)
+        cache = cache_for(port)
+        results = await asyncio.gather(*(cache.get() for _ in range(5)))
+        api.close()
+        return results, len(seen)
+
+    results, calls = asyncio.run(run())
+    assert calls == 1 and all(r[-1] == "Halifax" for r in results)
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import struct
+
+import websocket
+from fakes import WS_MASK, ws_connect, ws_frame, ws_read_frame
+from httpserver import HTTPServer
+
+
+def echo_server(max_message=256):
+    server = HTTPServer()
+
+    @server.route("/ws")
+    async def ws_route(req):
+        ws = await websocket.accept(req, max_message)
+        if ws is None:
+            return 400, "text/plain", "WebSocket only"
+        while True:
+            msg = await ws.recv()
+            if msg is None:
+                return None
+            opcode, data = msg
+            await ws.send(bytes(data), opcode)
+
+    return server
+
+
+def run_client(client, max_message=256):
+    async def run():
+        site = await echo_server(max_message).start("127.0.0.1", 0)
+        try:
+            return await asyncio.wait_for(client(site.sockets[0].getsockname()[1]), 5)
+        finally:
+            site.close()
+    return asyncio.run(run())
+
+
+def test_accept_key_rfc_example():
+    assert websocket.accept_key("dGhlIHNhbXBsZSBub25jZQ==") == b"s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+
+
+def test_plain_request_is_refused():
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /ws HTTP/1.1\r\nHost: pico\r\n\r\n")
+        return await reader.readuntil(b"\r\n\r\n")
+
+    assert run_client(client).startswith(b"HTTP/1.1 400")
+
+
+def test_masking_and_length_forms():
+    big = os.urandom(70000)
+
+    async def client(port):
+        reader, writer = await ws_connect(port)
+        out = []
+        for op, payload, length in ((websocket.TEXT, b"UP", 7), (websocket.BINARY, bytes(range(200)), 16),
+                                    (websocket.BINARY, b"x" * 300, 64), (websocket.BINARY, big, 64),
+                                    (websocket.TEXT, b"", 7)):
+            writer.write(ws_frame(op, payload, length=length))
+            out.append(await ws_read_frame(reader))
+        return out
+
+    out = run_client(client, max_message=80000)
+    assert out == [(1, b"UP"), (2, bytes(range(200))), (2, b"x" * 300), (2, big), (1, b"")]
+
+
+def test_fragments_are_joined_around_a_ping():
+    async def client(port):
+        reader, writer = await ws_connect(port)
+        writer.write(ws_frame(websocket.TEXT, b"LE", fin=False) + ws_frame(websocket.PING, b"hi")
+                     + ws_frame(websocket.CONT, b"F", fin=False) + ws_frame(websocket.CONT, b"T"))
+        return [await ws_read_frame(reader), await ws_read_frame(reader)]
+
+    assert run_client(client) == [(websocket.PONG, b"hi"), (websocket.TEXT, b"LEFT")]
+
+
+def close_code(reply):
+    op, data = reply
+    assert op == websocket.CLOSE
+    return struct.unpack(">H", data[:2])[0]
+
+
+def test_close_handshake():
+    async def client(port):
+        reader, writer = await ws_connect(port)
+        writer.write(ws_frame(websocket.CLOSE, struct.pack(">H", 1000) + b"bye"))
+        reply = await ws_read_frame(reader)
+        return reply, await reader.read()
+
+    reply, rest = run_client(client)
+    assert close_code(reply) == 1000 and rest == b""  # echoed, then the TCP connection closes
+
+
+async def send_and_get_close(port, data):
+    reader, writer = await ws_connect(port)
+    writer.write(data)
+    return close_code(await ws_read_frame(reader))
+
+
+def test_protocol_errors():
+    cases = (
+        (ws_frame(websocket.TEXT, b"x" * 300), websocket.TOO_BIG),
+        (ws_frame(websocket.TEXT, b"x" * 200, fin=False) + ws_frame(websocket.CONT, b"x" * 100), websocket.TOO_BIG),
+        (bytes((0x81, 2)) + b"UP", websocket.PROTOCOL_ERROR),  # unmasked
+        (bytes((0xC1, 0x80)) + WS_MASK, websocket.PROTOCOL_ERROR),  # RSV bit
+        (ws_frame(websocket.CONT, b"x"), websocket.PROTOCOL_ERROR),  # nothing to continue
+        (ws_frame(websocket.PING, b"p", fin=False), websocket.PROTOCOL_ERROR),  # fragmented control frame
+    )
+    for data, code in cases:
+        assert run_client(lambda port: send_and_get_close(port, data)) == code, data[:2]
+
+
+def test_eof_mid_frame():
+    async def client(port):
+        reader, writer = await ws_connect(port)
+        writer.write(ws_frame(websocket.TEXT, b"LEFT")[:5])
+        writer.write_eof()
+        return await reader.read()
+
+    assert run_client(client) == b""  # dropped without a reply
+
+
+# ---------- readinto ----------
+class TrickleReader:
+    """uasyncio-style stream with readinto(), handing out at most 3 bytes per call"""
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.calls = 0
+
+    async def readinto(self, buf):
+        self.calls += 1
+        k = min(3, len(buf), len(self.data))
+        buf[:k] = self.data[:k]
+        self.data = self.data[k:]
+        return k
+
+    async def read(self, n):
+        raise AssertionError("read() used although readinto() exists")
+
+
+class ListWriter:
+    def __init__(self):
+        self.out = bytearray()
+
+    def write(self, data):
+        self.out += data
+
+    async def drain(self):
+        pass
+
+
+def test_readinto_path_fills_the_buffer_in_place():
+    payloads = [b"UP", bytes(range(256)) * 3, b"", b"RIGHT_RELEASE"]
+    data = b"".join(ws_frame(websocket.BINARY, p) for p in payloads) + ws_frame(websocket.PING, b"x")
+
+    async def run():
+        ws = websocket.WebSocket(TrickleReader(data), ListWriter(), max_message=1024)
+        got = []
+        for _ in payloads:
+            op, view = await ws.recv()
+            assert view.obj is ws.buf  # a view into the connection's buffer, not a copy
+            got.append(bytes(view))
+        assert await ws.recv() is None  # the stream ends after the ping
+        return got, ws
+
+    got, ws = asyncio.run(run())
+    assert got == payloads
+    assert ws.writer.out == bytes((0x8A, 1)) + b"x"  # pong
+    assert ws.closed and ws.reader.calls > len(data) // 3
@@ -1,5 +1,6 @@
 from micropython import const
 from ustruct import unpack as unp
+from utime import ticks_ms, ticks_us, ticks_add, ticks_diff, sleep_ms
 
 # Author David Stenwall (david at stenwall.io)
 
@@ -84,9 +85,12 @@ _BMP280_REGISTER_CONFIG = const(0xF5)  # IIR filter config
 
 _BMP280_REGISTER_DATA = const(0xF7)
 
+# (1 << length) - 1 for register fields of 0..8 bits, looked up instead of computed per access
+_BITS_MASK = tuple((1 << n) - 1 for n in range(9))
+
 
 class BMP280:
-    def __init__(self, i2c_bus, addr=0x76, use_case=BMP280_CASE_HANDHELD_DYN):
+    def __init__(self, i2c_bus, addr=0x76, use_case=BMP280_CASE_HANDHELD_DYN, new_read_ms=200):
         self._bmp_i2c = i2c_bus
         self._i2c_addr = addr
 
@@ -115,9 +119,14 @@ class BMP280:
         self._p_raw = 0
         self._p = 0
 
+        # integer results (see temperature_centi / pressure_pa_q8)
+        self._p_q8 = 0
+        self._buf6 = bytearray(6)  # burst read buffer, reused so sampling doesn't allocate
+        self._buf1 = bytearray(1)  # register read buffer for _read_bits
+
         self.read_wait_ms = 0  # interval between forced measure and readout
-        self._new_read_ms = 200  # interval between
-        self._last_read_ts = 0
+        self._new_read_ms = new_read_ms  # min interval between two burst reads, 0 = always read
+        self._last_read_ts = None  # ticks of the last burst read, None = no sample yet
 
         if use_case is not None:
             self.use_case(use_case)
@@ -131,9 +140,16 @@ class BMP280:
         return self._bmp_i2c.writeto_mem(self._i2c_addr, addr, b_arr)
 
     def _gauge(self):
-        # TODO limit new reads
+        # reuse the last sample while it is younger than _new_read_ms, so
+        # temperature and pressure come from one burst read
+        now = ticks_ms()
+        if self._last_read_ts is not None and ticks_diff(now, self._last_read_ts) < self._new_read_ms:
+            return
+        self._last_read_ts = now
+
         # read all data at once (as by spec)
-        d = self._read(_BMP280_REGISTER_DATA, 6)
+        d = self._buf6
+        self._bmp_i2c.readfrom_mem_into(self._i2c_addr, _BMP280_REGISTER_DATA, d)
 
         self._p_raw = (d[0] << 12) + (d[1] << 4) + (d[2] >> 4)
         self._t_raw = (d[3] << 12) + (d[4] << 4) + (d[5] >> 4)
@@ -141,6 +157,7 @@ class BMP280:
         self._t_fine = 0
         self._t = 0
         self._p = 0
+        self._p_q8 = 0
 
     def reset(self):
         self._write(_BMP280_REGISTER_RESET, 0xB6)
@@ -162,6 +179,11 @@ class BMP280:
     def load_test_data(self):
         self._t_raw = 519888
         self._p_raw = 415148
+        self._t_fine = 0
+        self._t = 0
+        self._p = 0
+        self._p_q8 = 0
+        self._last_read_ts = ticks_ms()  # served as the current sample until it expires
 
     def print_calibration(self):
         print("T1: {} {}".format(self._T1, type(self._T1)))
@@ -179,7 +201,6 @@ class BMP280:
 
     def _calc_t_fine(self):
         # From datasheet page 22
-        self._gauge()
         if self._t_fine == 0:
             var1 = (((self._t_raw >> 3) - (self._T1 << 1)) * self._T2) >> 11
             var2 = (((((self._t_raw >> 4) - self._T1)
@@ -190,13 +211,21 @@ class BMP280:
 
     @property
     def temperature(self):
+        self._gauge()
+        return self._temperature()
+
+    @property
+    def pressure(self):
+        self._gauge()
+        return self._pressure()
+
+    def _temperature(self):
         self._calc_t_fine()
         if self._t == 0:
             self._t = ((self._t_fine * 5 + 128) >> 8) / 100.
         return self._t
 
-    @property
-    def pressure(self):
+    def _pressure(self):
         # From datasheet page 22
         self._calc_t_fine()
         if self._p == 0:
@@ -219,16 +248,72 @@ class BMP280:
             self._p = p / 256.0
         return self._p
 
+    # Integer fast path: the datasheet's 32 bit reference algorithm, giving the
+    # same results bit for bit. With real calibration values and temperatures
+    # between about -25 and 75 C every intermediate stays below 2**30, i.e. a
+    # MicroPython small int, so no bigint or float is allocated per sample.
+    # The 32 bit pressure is a few Pa off the 64 bit one behind .pressure.
+    @property
+    def temperature_centi(self):
+        """Temperature in 0.01 C as an int"""
+        self._gauge()
+        return self._temperature_centi()
+
+    @property
+    def pressure_pa_q8(self):
+        """Pressure in Pa * 256 as an int (1/16 Pa resolution)"""
+        self._gauge()
+        return self._pressure_pa_q8()
+
+    def _temperature_centi(self):
+        self._calc_t_fine()
+        return (self._t_fine * 5 + 128) >> 8
+
+    def _pressure_pa_q8(self):
+        self._calc_t_fine()
+        if self._p_q8 == 0:
+            self._p_q8 = self._compensate_p_int32()
+        return self._p_q8
+
+    def _compensate_p_int32(self):
+        var1 = (self._t_fine >> 1) - 64000
+        sq = (var1 >> 2) * (var1 >> 2)
+        var2 = ((sq >> 11) * self._P6) + ((var1 * self._P5) << 1)
+        var2 = (var2 >> 2) + (self._P4 << 16)
+        # (P2 * var1) >> 1 with var1 halved first, the odd bit added back exactly
+        var1 = (((self._P3 * (sq >> 13)) >> 3)
+                + self._P2 * (var1 >> 1) + ((self._P2 * (var1 & 1)) >> 1)) >> 18
+        # ((32768 + var1) * P1) >> 15, without the ~2**31 product
+        var1 = self._P1 + ((var1 * self._P1) >> 15)
+        if var1 == 0:
+            return 0
+        x = 1048576 - self._p_raw - (var2 >> 12)
+        # p = x * 3125, then (p << 1) // var1 or (p // var1) * 2 for p >= 2**31,
+        # both split into quotient and remainder so no product goes past 2**30
+        if x < 687195:
+            p = (x // var1) * 6250 + ((x % var1) * 6250) // var1
+        else:
+            p = ((x // var1) * 3125 + ((x % var1) * 3125) // var1) * 2
+        var1 = (self._P9 * (((p >> 3) * (p >> 3)) >> 13)) >> 12
+        var2 = ((p >> 2) * self._P8) >> 13
+        # the datasheet ends with p + ((var1 + var2 + P7) >> 4); keep those 4 bits
+        return ((p << 4) + var1 + var2 + self._P7) << 4
+
+    def read(self):
+        """(temperature in C, pressure in Pa) computed from the same sample"""
+        self._gauge()
+        return self._temperature(), self._pressure()
+
     def _write_bits(self, address, value, length, shift=0):
         d = self._read(address)[0]
-        m = int('1' * length, 2) << shift
+        m = _BITS_MASK[length] << shift
         d &= ~m
         d |= m & value << shift
         self._write(address, d)
 
     def _read_bits(self, address, length, shift=0):
-        d = self._read(address)[0]
-        return d >> shift & int('1' * length, 2)
+        self._bmp_i2c.readfrom_mem_into(self._i2c_addr, address, self._buf1)
+        return self._buf1[0] >> shift & _BITS_MASK[length]
 
     @property
     def standby(self):
@@ -319,4 +404,117 @@ class BMP280:
     def oversample(self, oss):
         assert 0 <= oss <= 4
         p_os, t_os, self.read_wait_ms = _BMP280_OS_MATRIX[oss]
-        self._write_bits(_BMP280_REGISTER_CONTROL, p_os + (t_os << 3), 2)
+        self._write_bits(_BMP280_REGISTER_CONTROL, p_os + (t_os << 3), 6, 2)
+
+
+class BMP280Sampler:
+    """Forced-mode sampling at the rate the consumer needs, without busy-waiting.
+
+    The sensor sleeps between samples. poll() is cheap and meant to be called
+    every pass of a main loop (or use run() under uasyncio): when a sample is
+    due it triggers one conversion, read_wait_ms later it reads the result,
+    otherwise it returns without touching the bus.
+
+        sampler = BMP280Sampler(sensor, period_ms=1000)
+        while True:
+            sampler.poll()
+            print(sampler.temperature, sampler.pressure)
+
+    Samples are kept as ints from the integer compensation path (temp_centi
+    in 0.01 C, pressure_pa in Pa), so sampling allocates nothing; the
+    temperature and pressure floats are made on demand for display.
+    """
+    def __init__(self, sensor, period_ms=1000, oss=BMP280_OS_ULTRALOW):
+        self.sensor = sensor
+        self.period_ms = period_ms
+        sensor.use_case(BMP280_CASE_WEATHER)  # forced mode, IIR off; this starts a conversion
+        sensor.oversample(oss)
+        sleep_ms(sensor.read_wait_ms)  # one blocking wait so values are valid from the start
+        self._fetch()
+        now = ticks_ms()
+        self.sample_ts = now  # ticks of the latest sample
+        self._start = now
+        self._due = ticks_add(now, period_ms)
+        self._trigger_ts = None  # ticks of the pending conversion, None = sensor asleep
+
+        self.samples = 1
+        self.skipped = 0  # due samples dropped because poll() was called too late
+        self.not_ready = 0  # readouts put off because the conversion was still running
+        self.bus_us = 0  # time spent in I2C calls
+
+    def _fetch(self):
+        sensor = self.sensor
+        sensor._last_read_ts = None  # a new conversion is done, skip the burst rate limit
+        sensor._gauge()
+        self.temp_centi = sensor._temperature_centi()
+        self.pressure_q8 = sensor._pressure_pa_q8()
+        self.pressure_pa = (self.pressure_q8 + 128) >> 8
+
+    @property
+    def temperature(self):
+        """Latest temperature in C"""
+        return self.temp_centi / 100
+
+    @property
+    def pressure(self):
+        """Latest pressure in Pa"""
+        return self.pressure_q8 / 256
+
+    def poll(self):
+        """Does at most one bus step, returns True when a new sample was read"""
+        now = ticks_ms()
+        if self._trigger_ts is None:
+            late = ticks_diff(now, self._due)
+            if late < 0:
+                return False
+            if late >= self.period_ms:  # fell behind, don't burst to catch up
+                self.skipped += late // self.period_ms
+                self._due = now
+            self._due = ticks_add(self._due, self.period_ms)
+            t0 = ticks_us()
+            self.sensor.force_measure()
+            self.bus_us += ticks_diff(ticks_us(), t0)
+            self._trigger_ts = now
+            return False
+
+        if ticks_diff(now, self._trigger_ts) < self.sensor.read_wait_ms:
+            return False
+        t0 = ticks_us()
+        ready = not self.sensor.is_measuring
+        if ready:
+            self._fetch()
+        self.bus_us += ticks_diff(ticks_us(), t0)
+        if not ready:
+            self.not_ready += 1
+            return False
+        self._trigger_ts = None
+        self.sample_ts = now
+        self.samples += 1
+        return True
+
+    def sleep_ms(self):
+        """How long the caller can sleep before poll() has work to do"""
+        now = ticks_ms()
+        if self._trigger_ts is None:
+            return max(0, ticks_diff(self._due, now))
+        return max(1, self.sensor.read_wait_ms - ticks_diff(now, self._trigger_ts))
+
+    async def run(self):
+        """Samples forever as a uasyncio task"""
+        import uasyncio as asyncio
+        while True:
+            self.poll()
+            await asyncio.sleep_ms(self.sleep_ms())
+
+    def stats(self):
+        """Achieved sample rate and the share of time spent on the I2C bus"""
+        elapsed = max(1, ticks_diff(ticks_ms(), self._start))
+        return {
+            "samples": self.samples,
+            "rate_hz": self.samples * 1000 / elapsed,
+            "target_hz": 1000 / self.period_ms,
+            "skipped": self.skipped,
+            "not_ready": self.not_ready,
+            "bus_us": self.bus_us,
+            "bus_pct": self.bus_us / (elapsed * 10),
+        }
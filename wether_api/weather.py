@@ -1,9 +1,12 @@
-# Full MicroPython Weather Server Code with Manual Capitalization, Timing, and Chunked Sending
+# Full MicroPython Weather Server Code with Manual Capitalization, Timing, and a cached static page + JSON endpoint
+# needs lib/httpserver.py and lib/jsonfields.py copied to /lib on the Pico
 
 import network
 import time
-import urequests
-import socket
+import ujson as json
+import uasyncio as asyncio
+from httpserver import HTTPServer
+from jsonfields import http_get_fields
 import utime
 import gc  # Garbage collector, useful on constrained devices
 import sys  # For more detailed error printing
@@ -13,6 +16,11 @@ WIFI_SSID = "WIFI NAME" # <<< Replace with your Network Name
 WIFI_PASSWORD = "PASSWORD" # <<< # <<< Replace with your Passkey
 OPENWEATHERMAP_API_KEY = "API_KEY"  # <<< Replace with your OpenWeatherMap API key
 CITY = "Halifax,gb"  # <<< Replace with your desired city and country code (e.g., "London,uk", "New York,us")
+WEATHER_CACHE_TTL_MS = 10 * 60 * 1000  # How long a good API result is considered fresh
+WEATHER_ERROR_TTL_MS = 60 * 1000  # After a failed fetch, don't hit the API again for this long
+WEATHER_STALE_WHILE_REVALIDATE = True  # Serve the last good result at once, refresh after the page is sent
+WEATHER_TIMEOUT_S = 10  # Give up on an API request after this long
+OPENWEATHERMAP_HOST = "api.openweathermap.org"
 # --- End Configuration ----
 
 # Connect to Wi-Fi
@@ -41,38 +49,39 @@ def connect_wifi(ssid, password):
         return wlan
 
 # Fetch Weather Data
-def get_weather(city, api_key):
-    """Fetches weather data from OpenWeatherMap API using manual capitalization."""
-    url = f'http://api.openweathermap.org/data/2.5/weather?q={city}&appid={api_key}&units=metric'
-    print(f"Requesting weather URL: {url}")
-    response = None  # Initialize response to None
+WEATHER_PATHS = ("weather.0.description", "main.temp", "main.feels_like", "main.humidity",
+                 "main.pressure", "wind.speed", "wind.deg", "visibility", "sys.sunrise",
+                 "sys.sunset", "sys.country", "name")
+
+async def get_weather(city, api_key, host=OPENWEATHERMAP_HOST, port=80):
+    """Fetches weather data from OpenWeatherMap API using manual capitalization.
+
+    The request runs on uasyncio streams, so the server keeps answering other
+    clients while it is in flight.
+    """
+    path = f'/data/2.5/weather?q={city}&appid={api_key}&units=metric'
+    print(f"Requesting weather URL: http://{host}{path}")
     try:
-        response = urequests.get(url, timeout=10)  # Add timeout
-        status_code = response.status_code
-        data = response.json()  # Parse JSON immediately
-        response.close()  # Close response ASAP to free memory
-
-        print(f"Raw data for {city}: {data}")  # Debugging
+        # Stream the body through the field extractor instead of response.json(),
+        # so only the fields below are ever held in memory
+        status_code, fields = await asyncio.wait_for(
+            http_get_fields(host, path, WEATHER_PATHS, port), WEATHER_TIMEOUT_S)
 
         if status_code == 200:
-            # Extract data safely using .get() to avoid KeyErrors
-            weather_data = data.get('weather', [{}])[0]  # Get first weather item safely
-            main_data = data.get('main', {})
-            wind_data = data.get('wind', {})
-            sys_data = data.get('sys', {})
-
-            weather_desc = weather_data.get('description', 'N/A')  # Default if missing
-            temperature = main_data.get('temp')
-            feels_like = main_data.get('feels_like')
-            humidity = main_data.get('humidity')
-            pressure = main_data.get('pressure')
-            wind_speed = wind_data.get('speed')
-            wind_direction = wind_data.get('deg')
-            visibility = data.get('visibility')  # Visibility is top-level
-            sunrise = sys_data.get('sunrise')
-            sunset = sys_data.get('sunset')
-            country = sys_data.get('country')
-            city_name = data.get('name')
+            print(f"Weather fields for {city}: {fields}")  # Debugging
+
+            weather_desc = fields.get('weather.0.description', 'N/A')  # Default if missing
+            temperature = fields.get('main.temp')
+            feels_like = fields.get('main.feels_like')
+            humidity = fields.get('main.humidity')
+            pressure = fields.get('main.pressure')
+            wind_speed = fields.get('wind.speed')
+            wind_direction = fields.get('wind.deg')
+            visibility = fields.get('visibility')  # Visibility is top-level
+            sunrise = fields.get('sys.sunrise')
+            sunset = fields.get('sys.sunset')
+            country = fields.get('sys.country')
+            city_name = fields.get('name')
 
             # Check if essential data was retrieved
             if temperature is None or sunrise is None or sunset is None or not city_name:
@@ -136,13 +145,6 @@ def get_weather(city, api_key):
                     country, city_name)
         else:
             print(f"Error fetching weather: Status code {status_code}")
-            # Try to get text content for error diagnosis
-            error_text = ""
-            try:
-                error_text = response.text
-            except Exception as text_err:
-                print(f"Could not read response text: {text_err}")
-            print(f"Response content: {error_text if error_text else '(Could not get text)'}")
             return (None,) * 12  # Return tuple of Nones
 
     except Exception as e:
@@ -155,246 +157,189 @@ def get_weather(city, api_key):
             print("(Traceback printing not available in this MicroPython build)")
         except Exception as tb_err:
             print(f"(Error trying to print traceback: {tb_err})")
-
-        # Ensure response is closed if an error happened after it was opened
-        if response:
-            try:
-                response.close()
-            except Exception as close_e:
-                print(f"Error closing response: {close_e}")
         return (None,) * 12  # Return tuple of Nones
     finally:
         # Explicitly run garbage collection after network requests
         gc.collect()
 
-# Set up the web server
-def start_server():
-    """Starts the web server on port 80."""
-    try:
-        # Force garbage collection before attempting to bind socket
-        gc.collect()
-        addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]  # Bind to port 80
-        s = socket.socket()
-        # Allow reusing address quickly after script restart
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind(addr)
-        s.listen(1)  # Listen for only 1 connection at a time
-        print('Web server listening on', addr)
-        return s
-    except OSError as e:
-        print(f"Error starting server (OSError): {e}")
-        print("Port 80 might be in use or unavailable. Check network state.")
-        return None
-    except Exception as e:
-        print(f"Unexpected error starting server: {e}")
+# Weather Cache
+class WeatherCache:
+    """Keeps the last good get_weather() tuple so page views don't wait on the API.
+
+    - fresh results are served straight from memory for ttl_ms
+    - with stale_while_revalidate, an expired result is still served and the
+      refresh is deferred until revalidate() is called (after the client is answered)
+    - failures are remembered for error_ttl_ms so an API outage doesn't make
+      every request wait for the full request timeout
+    - only one fetch runs at a time, requests arriving meanwhile wait for its result
+    """
+
+    EMPTY = (None,) * 12
+
+    def __init__(self, fetch, ttl_ms=WEATHER_CACHE_TTL_MS, error_ttl_ms=WEATHER_ERROR_TTL_MS,
+                 stale_while_revalidate=WEATHER_STALE_WHILE_REVALIDATE):
+        self.fetch = fetch  # coroutine function returning the 12-tuple from get_weather()
+        self.ttl_ms = ttl_ms
+        self.error_ttl_ms = error_ttl_ms
+        self.stale_while_revalidate = stale_while_revalidate
+        self.value = None  # last good tuple
+        self.fetched_at = 0
+        self.failed_at = None  # ticks of the last failed fetch (negative cache)
+        self.pending = False  # a stale value was served and needs refreshing
+        self.fetching = None  # Event of the fetch in flight
+        self.hits = 0
+        self.misses = 0
+
+    def _older_than(self, stamp, age_ms):
+        return time.ticks_diff(time.ticks_ms(), stamp) >= age_ms
+
+    async def get(self):
+        """Returns the weather tuple, only waiting on the API when nothing usable is cached."""
+        if self.value is not None and not self._older_than(self.fetched_at, self.ttl_ms):
+            self.hits += 1
+            return self.value
+        if self.value is not None and self.stale_while_revalidate:
+            self.hits += 1
+            self.pending = True
+            return self.value
+        self.misses += 1
+        await self.refresh()
+        return self.value if self.value is not None else self.EMPTY
+
+    async def refresh(self):
+        """Fetches a new tuple unless the last failure is still negative-cached."""
+        self.pending = False
+        if self.fetching is not None:  # someone else is already asking the API
+            await self.fetching.wait()
+            return
+        if self.failed_at is not None and not self._older_than(self.failed_at, self.error_ttl_ms):
+            print("Weather API failed recently, not retrying yet.")
+            return
+        self.fetching = asyncio.Event()
         try:
-            sys.print_exception(e)
-        except Exception:
-            pass  # Ignore if traceback printing fails
-        return None
+            result = await self.fetch()
+            if result[-1] is None:  # get_weather() returns all Nones on any failure
+                self.failed_at = time.ticks_ms()
+            else:
+                self.value = result
+                self.fetched_at = time.ticks_ms()
+                self.failed_at = None
+        finally:
+            self.fetching.set()
+            self.fetching = None
+
+    async def revalidate(self):
+        """Runs a refresh deferred by get(); call once the client has its response."""
+        if self.pending:
+            await self.refresh()
+
+# The HTML page
+# Static shell, encoded once at startup and served with an ETag (304 on reload).
+# The values are filled in by the script from /weather.json.
+WEATHER_FIELDS = ("weather", "temperature", "feels_like", "humidity", "pressure", "wind_speed",
+                  "wind_direction", "visibility_km", "sunrise", "sunset", "country", "city")
+
+WEATHER_PAGE = """<!DOCTYPE html>
+<html><head><title>Weather</title><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
+<style>
+body { font-family: Arial, sans-serif; background-color: #f0f0f0; color: #333; margin: 0; padding: 15px; }
+.container { max-width: 600px; margin: 20px auto; background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+h1 { color: #2a9d8f; text-align: center; font-size: 1.5em; }
+p { margin: 8px 0; line-height: 1.4; font-size: 0.95em; }
+.weather { font-size: 1.1em; font-weight: bold; color: #e76f51; }
+.temp { font-size: 2em; font-weight: bold; text-align: center; color: #f77f00; margin-bottom: 15px; }
+.label { font-weight: bold; color: #555; min-width: 90px; display: inline-block; }
+.error { color: #D8000C; background-color: #FFD2D2; padding: 10px; }
+
+/* Media query for screens smaller than 600px */
+@media screen and (max-width: 600px) {
+    .container { width: 95%; margin: 10px auto; padding: 15px; }
+    h1 { font-size: 1.2em; }
+    p { font-size: 0.9em; }
+    .temp { font-size: 1.5em; }
+    .label { min-width: 70px; }
+}
+
+/* Media query for screens larger than 1200px */
+@media screen and (min-width: 1200px) {
+    .container { max-width: 900px; }
+    h1 { font-size: 2em; }
+    p { font-size: 1.1em; }
+    .temp { font-size: 2.5em; }
+    .label { min-width: 120px; }
+}
+</style></head><body><div class="container">
+<h1>Weather in <span id="city"></span>, <span id="country"></span></h1>
+<p class="temp"><span id="temperature"></span>°C</p>
+<p><span class="label">Condition:</span> <span class="weather" id="weather"></span></p>
+<p><span class="label">Feels Like:</span> <span id="feels_like"></span>°C</p>
+<p><span class="label">Humidity:</span> <span id="humidity"></span>%</p>
+<p><span class="label">Pressure:</span> <span id="pressure"></span> hPa</p>
+<p><span class="label">Wind:</span> <span id="wind_speed"></span> m/s at <span id="wind_direction"></span>°</p>
+<p><span class="label">Visibility:</span> <span id="visibility_km"></span> km</p>
+<p><span class="label">Sunrise:</span> <span id="sunrise"></span> UTC</p>
+<p><span class="label">Sunset:</span> <span id="sunset"></span> UTC</p>
+<p class="error" id="error" hidden>Could not retrieve valid weather information. Check device logs/API config.</p>
+</div>
+<script>
+fetch('/weather.json').then(r => r.json()).then(d => {
+    if (d.error) { document.getElementById('error').hidden = false; return; }
+    for (const k in d) { const e = document.getElementById(k); if (e) e.textContent = d[k]; }
+    document.title = 'Weather in ' + d.city;
+});
+</script>
+</body></html>"""
+
+def weather_json(weather_results):
+    """Returns the weather tuple as a small JSON object for the page."""
+    if not weather_results[-1] or weather_results[1] is None:  # Check if essential data is present
+        return '{"error": true}'
+    return json.dumps(dict(zip(WEATHER_FIELDS, weather_results)))
+
+# Web Server
+def make_server(weather_cache):
+    """The static page and /weather.json on the shared HTTP server."""
+    server = HTTPServer()
+
+    server.add_static("/", WEATHER_PAGE, gz_file="weather.html.gz")
+
+    @server.route("/weather.json")
+    async def weather_data(req):
+        start_time = time.ticks_ms()  # <<< START TIMER
+        weather_results = await weather_cache.get()
+        duration = time.ticks_diff(time.ticks_ms(), start_time)  # <<< CALCULATE DURATION
+        print(f"Weather data ready in {duration} ms (cache hits {weather_cache.hits}, misses {weather_cache.misses}).")
+        return 200, "application/json", weather_json(weather_results)
+
+    return server
+
+async def revalidate_task(weather_cache, period_s=1):
+    """Refreshes a stale result outside of any request, so no client waits on it."""
+    while True:
+        await asyncio.sleep(period_s)
+        try:
+            await weather_cache.revalidate()
+        except Exception as e:
+            print(f"Error refreshing weather cache: {e}")
+        gc.collect()
 
 # Main Application
 def run_app():
-    """Main application function with timing and chunked sending."""
+    """Main application: connects Wi-Fi and serves the weather page with the shared HTTP server."""
     wlan = connect_wifi(WIFI_SSID, WIFI_PASSWORD)
 
     if not wlan or not wlan.isconnected():
         print("Could not connect to Wi-Fi. Halting.")
         return  # Stop execution if no Wi-Fi
 
-    server = start_server()
-    if not server:
-        print("Could not start web server. Halting.")
-        return  # Stop execution if server fails
+    weather_cache = WeatherCache(lambda: get_weather(CITY, OPENWEATHERMAP_API_KEY))
+    server = make_server(weather_cache)
 
-    while True:
-        cl = None  # Initialize client socket variable
-        client_addr = None
-        try:
-            print(f"\nWaiting for client connection... (Free memory: {gc.mem_free()})")
-            cl, client_addr = server.accept()
-            cl.settimeout(10.0)  # Timeout for client operations (recv/send)
-            print(f'Client connected from {client_addr}')
+    async def main():
+        asyncio.create_task(revalidate_task(weather_cache))
+        await server.serve(port=80)
 
-            # --- Receive Request (Basic handling) ---
-            request = None
-            try:
-                # Read the first line which is usually enough for GET
-                request_line_bytes = cl.readline()
-                if not request_line_bytes:
-                    print("Client disconnected before sending request.")
-                    cl.close()
-                    continue
-
-                request_line = request_line_bytes.decode('utf-8').strip()
-                print(f"--- Request Line --- \n{request_line}\n--------------------")
-
-                # Clear any remaining headers from the buffer (optional but good practice)
-                # while True:
-                #    header = cl.readline()
-                #    if not header or header == b'\r\n':
-                #        break
-
-            except OSError as e:
-                print(f"Timeout or error receiving request: {e.args[0]}")  # Print errno
-                if cl: cl.close()  # Ensure socket is closed
-                continue  # Wait for next connection
-            except Exception as e:
-                print(f"Error receiving/decoding request: {e}")
-                if cl: cl.close()
-                continue
-
-            # --- Get Weather Data ---
-            print("Fetching weather data...")
-            gc.collect()  # Collect garbage before potentially long operation
-            start_time = time.ticks_ms()  # <<< START TIMER
-            weather_results = get_weather(CITY, OPENWEATHERMAP_API_KEY)
-            end_time = time.ticks_ms()  # <<< END TIMER
-            duration = time.ticks_diff(end_time, start_time)  # <<< CALCULATE DURATION
-            print(f"Weather data fetched in {duration} ms.")  # <<< PRINT DURATION
-            gc.collect()  # Collect again after get_weather's internal collection
-
-            # Unpack the tuple (or Nones if failed)
-            (weather, temperature, feels_like, humidity, pressure, wind_speed,
-             wind_direction, visibility_km, sunrise_str, sunset_str, country, city_name) = weather_results
-
-            # --- Prepare and Send HTTP Response ---
-            try:
-                # Send Headers
-                print("Sending HTTP headers...")
-                cl.send(b'HTTP/1.1 200 OK\r\n')  # Use bytes directly
-                cl.send(b'Content-Type: text/html; charset=UTF-8\r\n')
-                cl.send(b'Connection: close\r\n')  # Tell client we will close connection
-                cl.send(b'\r\n')  # End of headers
-                print("Headers sent.")
-                gc.collect()  # GC before building large string
-
-                # --- Generate HTML Body ---
-                print("Generating HTML body...")
-                if city_name and temperature is not None:  # Check if essential data is present
-                    # Ensure all parts are strings before formatting
-                    temperature_str = str(temperature)
-                    feels_like_str = str(feels_like)
-                    humidity_str = str(humidity)
-                    pressure_str = str(pressure)
-                    wind_speed_str = str(wind_speed)
-                    wind_direction_str = str(wind_direction)
-                    visibility_km_str = str(visibility_km)
-                    weather_str = str(weather)
-                    sunrise_str_disp = str(sunrise_str)
-                    sunset_str_disp = str(sunset_str)
-                    country_str = str(country)
-                    city_name_str = str(city_name)
-
-                    # Define parts of the HTML to send in chunks
-                    # Chunk 1: Head and start of body/container
-                    # Media queries within style block.  Target a specific min/max width range, can also target device-pixel-ratio
-                    html_head = f"""<!DOCTYPE html>
-                    <html><head><title>Weather in {city_name_str}</title><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0">
-                    <style>
-                    body {{ font-family: Arial, sans-serif; background-color: #f0f0f0; color: #333; margin: 0; padding: 15px; }}
-                    .container {{ max-width: 600px; margin: 20px auto; background-color: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-                    h1 {{ color: #2a9d8f; text-align: center; font-size: 1.5em; }}
-                    p {{ margin: 8px 0; line-height: 1.4; font-size: 0.95em; }}
-                    .weather {{ font-size: 1.1em; font-weight: bold; color: #e76f51; }}
-                    .temp {{ font-size: 2em; font-weight: bold; text-align: center; color: #f77f00; margin-bottom: 15px; }}
-                    .label {{ font-weight: bold; color: #555; min-width: 90px; display: inline-block; }}
-
-                    /* Media query for screens smaller than 600px */
-                    @media screen and (max-width: 600px) {{
-                        .container {{ width: 95%; margin: 10px auto; padding: 15px; }}
-                        h1 {{ font-size: 1.2em; }}
-                        p {{ font-size: 0.9em; }}
-                        .temp {{ font-size: 1.5em; }}
-                        .label {{ min-width: 70px; }}
-                    }}
-
-                    /* Media query for screens larger than 1200px */
-                    @media screen and (min-width: 1200px) {{
-                        .container {{ max-width: 900px; }}
-                        h1 {{ font-size: 2em; }}
-                        p {{ font-size: 1.1em; }}
-                        .temp {{ font-size: 2.5em; }}
-                        .label {{ min-width: 120px; }}
-                    }}
-                    </style></head><body><div class="container">
-                    <h1>Weather in {city_name_str}, {country_str}</h1>
-                    <p class="temp">{temperature_str}°C</p>"""
-
-                    # Chunk 2: Main weather details
-                    html_details = f"""<p><span class="label">Condition:</span> <span class="weather">{weather_str}</span></p>
-                    <p><span class="label">Feels Like:</span> {feels_like_str}°C</p>
-                    <p><span class="label">Humidity:</span> {humidity_str}%</p>
-                    <p><span class="label">Pressure:</span> {pressure_str} hPa</p>
-                    <p><span class="label">Wind:</span> {wind_speed_str} m/s at {wind_direction_str}°</p>
-                    <p><span class="label">Visibility:</span> {visibility_km_str} km</p>
-                    <p><span class="label">Sunrise:</span> {sunrise_str_disp} UTC</p>
-                    <p><span class="label">Sunset:</span> {sunset_str_disp} UTC</p>"""
-
-                    # Chunk 3: Closing tags
-                    html_foot = "</div></body></html>"
-
-                    # --- Send HTML Body in Chunks ---
-                    print("Sending HTML body chunks...")
-                    chunk1 = html_head.encode('utf-8')
-                    cl.send(chunk1)
-                    print(f"Sent chunk 1 ({len(chunk1)} bytes)")
-                    time.sleep(0.01)  # Small delay might help some network stacks
-                    gc.collect()  # GC between chunks
-
-                    chunk2 = html_details.encode('utf-8')
-                    cl.send(chunk2)
-                    print(f"Sent chunk 2 ({len(chunk2)} bytes)")
-                    time.sleep(0.01)
-                    gc.collect()
-
-                    chunk3 = html_foot.encode('utf-8')
-                    cl.send(chunk3)
-                    print(f"Sent chunk 3 ({len(chunk3)} bytes)")
-
-                    print("Full response body sent.")
-
-                else:
-                    # Send error page (can also be chunked if large, but usually isn't)
-                    print("Generating/Sending error HTML...")
-                    html_body = """<!DOCTYPE html><html><head><title>Weather Error</title><meta charset="UTF-8">
-                         <style> body {{ font-family: Arial, sans-serif; padding: 20px; color: #D8000C; background-color: #FFD2D2; }} </style></head>
-                         <body><h1>Error Fetching Weather Data</h1>
-                         <p>Could not retrieve valid weather information. Check device logs/API config.</p></body></html>"""
-                    cl.sendall(html_body.encode('utf-8'))  # Send error page at once
-                    print("Error response sent.")
-
-            except OSError as e:
-                # Specifically catch errors during the send process
-                print(f"Socket Error during send: {e.args[0]} (Likely ECONNRESET - Client {client_addr} disconnected)")
-                # No need to try sending more - connection is broken
-            except Exception as e:
-                print(f"Error preparing/sending response body: {e}")
-                try:
-                    sys.print_exception(e)
-                except Exception:
-                    pass
-                # Don't try to send more if body generation/sending failed
-
-        except OSError as e:
-            # Errors related to accept() or other socket ops before/after send/recv
-            print(f"Network/Socket Error in main loop: {e.args[0]}")  # Print errno
-        except Exception as e:
-            print(f"An unexpected error occurred in main loop: {e}")
-            try:
-                sys.print_exception(e)
-            except Exception:
-                pass
-        finally:
-            # --- Clean up client connection ---
-            if cl:
-                try:
-                    cl.close()
-                    print(f"Client connection closed for {client_addr}.")
-                except Exception as close_err:
-                    print(f"Error closing client socket: {close_err}")
-            # Optional: Collect garbage periodically in the main loop
-            gc.collect()
+    asyncio.run(main())
 
 # --- Main execution ---
 if __name__ == "__main__":